@@ -0,0 +1,262 @@
+"""Account clusters linked by shared funding and lockstep co-gifting
+
+Rings spread their activity over several accounts, each of which can look
+harmless on its own. AccountClusters keeps a union-find over user IDs and
+links two accounts when:
+
+- shared funding: one sender funds both through funding rows ('top-up'), or
+  one txHash credits both. A sender funding more than
+  cluster_max_funded_accounts accounts is a platform hub (the funding
+  account every top-up comes from) and links nothing.
+- lockstep co-gifting: both gift the same receiver within co_gift_window
+  seconds of each other at least co_gift_min_events times, and those
+  co-gifts make up at least co_gift_min_share of each account's gifts, so
+  the heavy gifters of a popular stream, who land next to everyone now and
+  then, do not link by chance.
+  Each gift is compared with the next CO_GIFT_NEIGHBORS gifts to the same
+  receiver, keeping the pass linear however crowded a stream gets.
+
+The union-find is a parent array over user codes, merged a batch at a time
+by vectorized hooking and pointer jumping and kept fully compressed, so a
+batch costs about linear time in its edges plus one pass over the users.
+update() can be called again as transactions arrive: new users get codes,
+co-gift counts and funding sources carry over, and gifts within the window
+of the previous batch's last ones still pair up. Links are never undone, so
+a funding source that becomes a hub keeps the links it made before, and a
+pair that met co_gift_min_share early on stays linked as its accounts go on
+gifting elsewhere.
+
+cluster_results() aggregates the members' features and scores per cluster
+and scores the cluster with the 'clusters' rules.
+"""
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from scoring_rules import DEFAULT_THRESHOLDS, RISK_LEVELS, RuleSet, risk_level
+
+FUNDING_TYPES = ('top-up',)
+# Raw gift-give rows, or fused events with collapse_gift_triples
+GIFT_TYPES = ('gift-give', 'gift')
+CO_GIFT_NEIGHBORS = 8
+# Members at MEDIUM risk or above count as risky
+_RISKY_SCORE = dict((level, minimum) for minimum, level in RISK_LEVELS)['MEDIUM']
+
+
+class AccountClusters:
+    """Incremental union-find over user IDs"""
+
+    def __init__(self, thresholds: Optional[Dict] = None):
+        self.thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        self.users = pd.Index([], dtype=object)
+        self.parent = np.zeros(0, dtype=np.int64)
+        # Links each account took part in, by kind
+        self.funding_links = np.zeros(0, dtype=np.int64)
+        self.co_gift_links = np.zeros(0, dtype=np.int64)
+        self.gift_counts = np.zeros(0, dtype=np.int64)
+        # Accounts funded by each non-hub source, and the sources found to be hubs
+        self.funded: Dict[int, Set[int]] = {}
+        self.hubs: Set[int] = set()
+        self.pair_counts: Dict[int, int] = {}
+        self.linked_pairs: Set[int] = set()
+        # Gifts (receiver, createdAt ms, sender) close enough to the last batch's end to pair with the next one
+        self.tail = (np.zeros(0, dtype=np.int64),) * 3
+
+    def update(self, df: pd.DataFrame) -> 'AccountClusters':
+        """Add a batch of prepared transactions"""
+        self._register(df)
+        types = df['type'].astype(object)
+        funding = df[types.isin(FUNDING_TYPES).to_numpy()]
+        gifts = df[types.isin(GIFT_TYPES).to_numpy()]
+        self._link_funding(funding)
+        self._link_co_gifts(gifts)
+        return self
+
+    def cluster_of(self, user_id: str) -> Optional[str]:
+        """Root user ID of the cluster holding `user_id` (itself when unlinked), None if unseen"""
+        code = self.users.get_indexer([user_id])[0]
+        return None if code < 0 else self.users[self.parent[code]]
+
+    def clusters(self, min_size: int = 2) -> Dict[str, List[str]]:
+        """Member user IDs of every cluster of at least `min_size` accounts, keyed by root user ID"""
+        sizes = np.bincount(self.parent, minlength=len(self.parent))
+        members = np.flatnonzero(sizes[self.parent] >= min_size)
+        if len(members) == 0:
+            return {}
+        members = members[np.argsort(self.parent[members], kind='stable')]
+        roots = self.parent[members]
+        bounds = np.flatnonzero(np.append(True, roots[1:] != roots[:-1]))
+        user_ids = self.users[members].tolist()
+        return {
+            self.users[roots[start]]: user_ids[start:end]
+            for start, end in zip(bounds, np.append(bounds[1:], len(members)))
+        }
+
+    def cluster_results(self, user_results: Dict[str, Dict], rules: Optional[RuleSet] = None,
+                        min_size: int = 2) -> Dict[str, Dict]:
+        """Aggregate member features and scores per cluster and score them with the 'clusters' rules"""
+        group = (rules or RuleSet())['clusters']
+        funding_links = np.bincount(self.parent, weights=self.funding_links, minlength=len(self.parent))
+        co_gift_links = np.bincount(self.parent, weights=self.co_gift_links, minlength=len(self.parent))
+        clusters = self.clusters(min_size)
+        all_features = []
+        for root, members in clusters.items():
+            results = [user_results[user_id] for user_id in members if user_id in user_results]
+            scores = [result['fraud_score'] for result in results]
+            root_code = self.users.get_loc(root)
+            all_features.append({
+                'cluster_size': len(members),
+                # Every link was counted at both of its accounts
+                'funding_links': int(funding_links[root_code]) // 2,
+                'co_gift_links': int(co_gift_links[root_code]) // 2,
+                'transaction_count': sum(result['features']['transaction_count'] for result in results),
+                'total_amount': sum(result['features']['total_amount'] for result in results),
+                'max_member_score': max(scores, default=0.0),
+                'avg_member_score': sum(scores) / len(scores) if scores else 0.0,
+                'risky_members': sum(score >= _RISKY_SCORE for score in scores),
+            })
+        if not all_features:
+            return {}
+        cluster_scores, masks = group.score_table(all_features)
+        return {
+            root: {
+                'fraud_score': score,
+                'risk_level': risk_level(score),
+                'reasons': group.reasons(features, mask),
+                'features': features,
+                'members': members,
+            }
+            for (root, members), features, score, mask in zip(clusters.items(), all_features,
+                                                              cluster_scores.tolist(), masks.tolist())
+        }
+
+    def _register(self, df: pd.DataFrame):
+        """Give every new user ID a code of its own cluster"""
+        ids = pd.unique(pd.concat([df[col].astype(object) for col in ['senderId', 'receiverId', 'owner']
+                                   if col in df.columns], ignore_index=True).dropna())
+        new = pd.Index(ids, dtype=object).difference(self.users, sort=False)
+        if len(new) == 0:
+            return
+        n = len(self.users)
+        self.users = self.users.append(new)
+        self.parent = np.append(self.parent, np.arange(n, n + len(new), dtype=np.int64))
+        padding = np.zeros(len(new), dtype=np.int64)
+        self.funding_links = np.append(self.funding_links, padding)
+        self.co_gift_links = np.append(self.co_gift_links, padding)
+        self.gift_counts = np.append(self.gift_counts, padding)
+
+    def _codes(self, values: pd.Series) -> np.ndarray:
+        return self.users.get_indexer(values.astype(object))
+
+    def _link_funding(self, funding: pd.DataFrame):
+        """Link accounts funded by the same (non-hub) sender or credited by the same txHash"""
+        senders, receivers = self._codes(funding['senderId']), self._codes(funding['receiverId'])
+        valid = (senders >= 0) & (receivers >= 0) & (senders != receivers)
+        pairs = np.unique(np.stack([senders[valid], receivers[valid]], axis=1), axis=0)
+        edges = []
+        limit = self.thresholds['cluster_max_funded_accounts']
+        for sender, start, end in _runs(pairs[:, 0]):
+            if sender in self.hubs:
+                continue
+            funded = self.funded.setdefault(sender, set())
+            accounts = set(pairs[start:end, 1].tolist()) - funded
+            if len(funded) + len(accounts) > limit:
+                self.hubs.add(sender)
+                del self.funded[sender]
+                continue
+            funded |= accounts
+            edges.extend((sender, account) for account in accounts)
+
+        if 'txHash' in funding.columns:
+            hashes = funding['txHash'].astype(object).to_numpy()
+            shared = pd.notna(hashes) & (receivers >= 0)
+            hash_codes = pd.factorize(hashes[shared])[0]
+            hash_receivers = receivers[shared]
+            # Star from the first account each hash credits to the others
+            _, first_rows = np.unique(hash_codes, return_index=True)
+            first = hash_receivers[first_rows][hash_codes]
+            other = hash_receivers != first
+            edges.extend(zip(first[other].tolist(), hash_receivers[other].tolist()))
+
+        if edges:
+            a, b = np.array(edges, dtype=np.int64).T
+            np.add.at(self.funding_links, a, 1)
+            np.add.at(self.funding_links, b, 1)
+            self._union(a, b)
+
+    def _link_co_gifts(self, gifts: pd.DataFrame):
+        """Count gifts to the same receiver within co_gift_window and link the pairs that qualify"""
+        window_ms = int(self.thresholds['co_gift_window']) * 1000
+        senders, receivers = self._codes(gifts['senderId']), self._codes(gifts['receiverId'])
+        valid = (senders >= 0) & (receivers >= 0) & (senders != receivers)
+        senders, receivers = senders[valid], receivers[valid]
+        times = gifts['createdAt'].to_numpy()[valid].astype('datetime64[ms]').astype(np.int64)
+        np.add.at(self.gift_counts, senders, 1)
+
+        tail_receivers, tail_times, tail_senders = self.tail
+        receivers = np.concatenate([tail_receivers, receivers])
+        times = np.concatenate([tail_times, times])
+        senders = np.concatenate([tail_senders, senders])
+        from_tail = np.arange(len(times)) < len(tail_times)
+        if len(times):
+            self.tail = tuple(column[times >= times.max() - window_ms] for column in (receivers, times, senders))
+
+        order = np.lexsort((times, receivers))
+        receivers, times, senders, from_tail = receivers[order], times[order], senders[order], from_tail[order]
+        keys = []
+        for offset in range(1, CO_GIFT_NEIGHBORS + 1):
+            i = np.arange(len(times) - offset)
+            j = i + offset
+            close = ((receivers[i] == receivers[j]) & (times[j] - times[i] <= window_ms)
+                     & (senders[i] != senders[j]) & ~(from_tail[i] & from_tail[j]))
+            a, b = senders[i[close]], senders[j[close]]
+            keys.append(np.minimum(a, b) << 32 | np.maximum(a, b))
+        keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+
+        pair_counts = self.pair_counts
+        qualifying = []
+        min_events = self.thresholds['co_gift_min_events']
+        min_share = self.thresholds['co_gift_min_share']
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            count = pair_counts[key] = pair_counts.get(key, 0) + count
+            if count >= min_events and key not in self.linked_pairs:
+                if count >= min_share * max(self.gift_counts[key >> 32], self.gift_counts[key & 0xFFFFFFFF]):
+                    qualifying.append(key)
+        if qualifying:
+            self.linked_pairs.update(qualifying)
+            keys = np.array(qualifying, dtype=np.int64)
+            a, b = keys >> 32, keys & 0xFFFFFFFF
+            np.add.at(self.co_gift_links, a, 1)
+            np.add.at(self.co_gift_links, b, 1)
+            self._union(a, b)
+
+    def _union(self, a: np.ndarray, b: np.ndarray):
+        """Merge the clusters of every (a, b) pair; each cluster's root is its smallest code"""
+        parent = self.parent
+        a, b = parent[a], parent[b]
+        while True:
+            differ = a != b
+            if not differ.any():
+                break
+            a, b = a[differ], b[differ]
+            # Hook the larger root of every edge under the smaller one, then jump to the roots
+            low, high = np.minimum(a, b), np.maximum(a, b)
+            np.minimum.at(parent, high, low)
+            while True:
+                grand = parent[parent]
+                if np.array_equal(grand, parent):
+                    break
+                parent = grand
+            a, b = parent[a], parent[b]
+        self.parent = parent
+
+
+def _runs(values: np.ndarray):
+    """(value, start, end) of each run of equal values in a sorted array"""
+    if len(values) == 0:
+        return []
+    starts = np.flatnonzero(np.append(True, values[1:] != values[:-1]))
+    ends = np.append(starts[1:], len(values))
+    return zip(values[starts].tolist(), starts.tolist(), ends.tolist())
+
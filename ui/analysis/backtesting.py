@@ -0,0 +1,214 @@
+"""Threshold backtesting against labelled transactions
+
+Tuning thresholds by re-running evaluate_dataframe per candidate repeats the
+whole pipeline. Backtester runs it once: it explodes the user rows, keeps the
+threshold-independent arrays (per-user sorted epoch-ms times, amounts and
+hours) and every feature the score rules read. A config then only recomputes
+the features that depend on the tunable thresholds,
+
+    high_velocity_window, high_velocity_count   -> high_velocity_periods
+    round_amount_threshold                      -> round_amount_ratio
+    large_amount_threshold                      -> large_transaction_count
+    off_hours_start, off_hours_end              -> off_hours_ratio
+
+with a few bincounts and one searchsorted pass (reused across configs that
+share a velocity window), and scores all users with the vectorized rules.
+Scores match evaluate_dataframe run with the same thresholds.
+
+Each config reports precision, recall and flag rate of `score >= cutoff` for
+every cutoff, against labelled fraud users (e.g. from
+SyntheticTransactionGenerator.labelled_transactions):
+
+    transactions, labels = SyntheticTransactionGenerator(seed=1).labelled_transactions(100000)
+    backtester = Backtester.from_transactions(transactions, labels)
+    configs = threshold_grid(high_velocity_window=[60, 300, 900], high_velocity_count=[3, 5])
+    results = backtester.sweep(configs, workers=4)
+
+With workers > 1 the arrays go into one shared memory block and configs are
+split across a process pool, as in parallel_scoring.
+"""
+import itertools
+import math
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from fraud_detection_model import FraudDetectionModel
+from parallel_scoring import _to_shared_memory
+
+TUNABLE_THRESHOLDS = ['high_velocity_window', 'high_velocity_count', 'large_amount_threshold',
+                      'off_hours_start', 'off_hours_end', 'round_amount_threshold']
+DEFAULT_CUTOFFS = (10, 20, 30, 40, 50, 60, 70, 80, 90)
+
+# Per-worker state, set up once by _init_worker
+_worker = {}
+
+
+def threshold_grid(**values: Sequence) -> List[Dict]:
+    """Every combination of the given threshold values"""
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def sample_thresholds(n: int, seed: int = 0, **ranges) -> List[Dict]:
+    """n random configs; each range is a list of choices or an inclusive (low, high) integer pair"""
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n):
+        config = {}
+        for name, values in ranges.items():
+            if isinstance(values, tuple):
+                config[name] = int(rng.integers(values[0], values[1], endpoint=True))
+            else:
+                config[name] = values[int(rng.integers(len(values)))]
+        configs.append(config)
+    return configs
+
+
+class Backtester:
+    """Scores threshold configs against labels, reusing precomputed per-user arrays"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], model: FraudDetectionModel, users: Optional[pd.Index] = None):
+        self.arrays = arrays
+        self.model = model
+        # Configs override these; every other threshold stays as the model has it
+        self.defaults = {name: model.thresholds[name] for name in TUNABLE_THRESHOLDS}
+        self.users = users
+        self.bounds = arrays['bounds']
+        self.n_users = len(self.bounds) - 1
+        self.base_columns = {name[len('base_'):]: values for name, values in arrays.items()
+                             if name.startswith('base_')}
+        self._velocity = (None, None)
+
+    @classmethod
+    def from_transactions(cls, transactions: List[Dict], labels: Iterable[str],
+                          model: Optional[FraudDetectionModel] = None) -> 'Backtester':
+        model = model or FraudDetectionModel()
+        return cls.from_dataframe(model.prepare_data(transactions), labels, model)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, labels: Iterable[str],
+                       model: Optional[FraudDetectionModel] = None) -> 'Backtester':
+        """Run the feature pipeline once and keep what the configs need"""
+        model = model or FraudDetectionModel()
+        df, _ = model.collapse_gifts(df)
+        user_rows = model._explode_user_rows(df)
+        if len(user_rows) == 0:
+            raise ValueError('no transactions to backtest')
+        cycle_features = model.calculate_cycle_features(df) if model.thresholds['cycle_max_length'] else None
+        all_features = model._features_from_user_rows(user_rows, cycle_features)
+
+        codes = user_rows['user_code'].to_numpy().astype(np.int64)
+        users = pd.Index(list(all_features), dtype=object)
+        arrays = {
+            'codes': codes,
+            'bounds': np.append(0, np.cumsum(np.bincount(codes))),
+            'times': model._to_epoch_ms(user_rows['createdAt']),
+            'amounts': user_rows['amount'].to_numpy(dtype=np.float64),
+            'hours': user_rows['createdAt'].dt.hour.to_numpy(dtype=np.int8),
+            'labels': users.isin(set(labels)),
+        }
+        for name, values in model.rules['users'].columns(list(all_features.values())).items():
+            arrays[f"base_{name}"] = values
+        return cls(arrays, model, users)
+
+    def scores(self, thresholds: Dict) -> np.ndarray:
+        """Score of every user under `thresholds` (tunable keys only, the rest keep their defaults)"""
+        unknown = set(thresholds) - set(TUNABLE_THRESHOLDS)
+        if unknown:
+            raise ValueError(f"thresholds that cannot be backtested: {', '.join(sorted(unknown))}")
+        thresholds = {**self.defaults, **thresholds}
+        arrays = self.arrays
+        codes, n = arrays['codes'], np.diff(self.bounds)
+        columns = dict(self.base_columns)
+
+        columns['high_velocity_periods'] = self._high_velocity_periods(
+            thresholds['high_velocity_window'], thresholds['high_velocity_count']
+        )
+        round_rows = arrays['amounts'] % thresholds['round_amount_threshold'] == 0
+        columns['round_amount_ratio'] = np.bincount(codes, weights=round_rows, minlength=self.n_users) / n
+        columns['large_transaction_count'] = np.bincount(
+            codes[arrays['amounts'] >= thresholds['large_amount_threshold']], minlength=self.n_users
+        )
+        hours = arrays['hours']
+        off_hours = (hours >= thresholds['off_hours_start']) | (hours < thresholds['off_hours_end'])
+        columns['off_hours_ratio'] = np.bincount(codes, weights=off_hours, minlength=self.n_users) / n
+
+        scores, _ = self.model.rules['users'].score_columns(columns, self.n_users)
+        return scores
+
+    def evaluate(self, thresholds: Dict, cutoffs: Sequence[float] = DEFAULT_CUTOFFS) -> Dict:
+        """Precision, recall and flag rate of one config at every score cutoff"""
+        scores = self.scores(thresholds)
+        labels = self.arrays['labels']
+        positives = int(labels.sum())
+        curve = []
+        for cutoff in cutoffs:
+            flagged = scores >= cutoff
+            n_flagged = int(flagged.sum())
+            true_positives = int((flagged & labels).sum())
+            curve.append({
+                'cutoff': cutoff,
+                'flagged': n_flagged,
+                'flag_rate': n_flagged / self.n_users if self.n_users else np.nan,
+                'precision': true_positives / n_flagged if n_flagged else np.nan,
+                'recall': true_positives / positives if positives else np.nan,
+            })
+        return {
+            'thresholds': {**self.defaults, **thresholds},
+            'users': self.n_users,
+            'positives': positives,
+            'curve': curve,
+        }
+
+    def sweep(self, configs: List[Dict], cutoffs: Sequence[float] = DEFAULT_CUTOFFS,
+              workers: Optional[int] = None) -> List[Dict]:
+        """evaluate() every config, in input order, across `workers` processes when > 1"""
+        # Configs sharing a velocity window run back to back, so its window counts are computed once
+        order = sorted(range(len(configs)),
+                       key=lambda i: configs[i].get('high_velocity_window', self.defaults['high_velocity_window']))
+        ordered = [configs[i] for i in order]
+        if workers is not None and workers > 1 and len(configs) > 1:
+            block, layout = _to_shared_memory(self.arrays)
+            try:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                         initargs=(block.name, layout, self.model)) as pool:
+                    chunksize = math.ceil(len(ordered) / (workers * 4))
+                    evaluated = list(pool.map(_evaluate_config, ordered, [cutoffs] * len(ordered),
+                                              chunksize=chunksize))
+            finally:
+                block.close()
+                block.unlink()
+        else:
+            evaluated = [self.evaluate(config, cutoffs) for config in ordered]
+
+        results = [None] * len(configs)
+        for i, result in zip(order, evaluated):
+            results[i] = result
+        return results
+
+    def _high_velocity_periods(self, window: int, count: int) -> np.ndarray:
+        """high_velocity_periods per user, keeping the window counts of the last window seen"""
+        if self._velocity[0] != window:
+            self._velocity = (window, self.model._velocity_window_counts(self.arrays['times'], self.bounds, window))
+        rapid = self._velocity[1] >= count
+        # The last transaction of each user never starts a window
+        rapid[self.bounds[1:] - 1] = False
+        return np.add.reduceat(rapid.astype(np.int64), self.bounds[:-1])
+
+
+def _init_worker(block_name: str, layout: List, model: FraudDetectionModel):
+    block = shared_memory.SharedMemory(name=block_name)
+    _worker['block'] = block
+    arrays = {
+        name: np.ndarray(length, dtype=dtype, buffer=block.buf, offset=start)
+        for name, dtype, start, length in layout
+    }
+    _worker['backtester'] = Backtester(arrays, model)
+
+
+def _evaluate_config(thresholds: Dict, cutoffs: Sequence[float]) -> Dict:
+    return _worker['backtester'].evaluate(thresholds, cutoffs)
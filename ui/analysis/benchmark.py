@@ -0,0 +1,156 @@
+"""Benchmark harness for the fraud detection pipeline
+
+Times and memory-profiles the pipeline stages on synthetic transaction sets of
+increasing size and records the results as JSON. A previous results file can
+be passed as a baseline to flag regressions:
+
+    python benchmark.py --sizes 1000 10000 100000 --output bench.json
+    python benchmark.py --sizes 1000 10000 --baseline bench.json --tolerance 0.25
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from fraud_detection_model import FraudDetectionModel, analyze_transactions
+from synthetic_transactions import generate_transactions
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def measure(fn: Callable, repeat: int = 3, profile_memory: bool = True) -> Dict:
+    """Best-of-`repeat` wall time and, in a separate run, the tracemalloc peak"""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    result = {'seconds': min(timings), 'seconds_all': timings}
+    if profile_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def benchmark_size(n_rows: int, repeat: int = 3, seed: int = 0, profile_memory: bool = True) -> List[Dict]:
+    """Benchmark every stage on one synthetic transaction set"""
+    transactions = generate_transactions(n_rows, seed=seed)
+    model = FraudDetectionModel()
+    df = model.prepare_data(transactions)
+
+    # The most active user is the worst case for the per-user path
+    busiest_user = pd.concat([df['senderId'], df['receiverId']]).value_counts().index[0]
+
+    def quiet_analyze():
+        with contextlib.redirect_stdout(io.StringIO()):
+            analyze_transactions(transactions)
+
+    stages = {
+        'prepare_data': lambda: model.prepare_data(transactions),
+        'calculate_user_features': lambda: model.calculate_user_features(df, busiest_user),
+        'evaluate_transactions': lambda: model.evaluate_transactions(transactions),
+        'analyze_transactions': quiet_analyze,
+    }
+
+    records = []
+    for stage, fn in stages.items():
+        record = {'size': len(transactions), 'stage': stage}
+        record.update(measure(fn, repeat=repeat, profile_memory=profile_memory))
+        records.append(record)
+        print(f"  {stage:<26} {record['seconds']:9.4f}s"
+              + (f"  peak {record['peak_bytes'] / 1e6:9.1f} MB" if 'peak_bytes' in record else ''),
+              file=sys.stderr)
+    return records
+
+
+def run_benchmarks(sizes: List[int], repeat: int = 3, seed: int = 0, profile_memory: bool = True) -> Dict:
+    """Benchmark all sizes and return the JSON-serializable report"""
+    records = []
+    for n_rows in sizes:
+        print(f"size {n_rows}:", file=sys.stderr)
+        records.extend(benchmark_size(n_rows, repeat=repeat, seed=seed, profile_memory=profile_memory))
+
+    return {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': records,
+    }
+
+
+def find_regressions(report: Dict, baseline: Dict, tolerance: float = 0.25) -> List[Dict]:
+    """Stages whose time or peak memory grew by more than `tolerance` relative to the baseline"""
+    previous = {(r['size'], r['stage']): r for r in baseline['results']}
+    regressions = []
+    for record in report['results']:
+        before = previous.get((record['size'], record['stage']))
+        if before is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if metric in record and before.get(metric) and record[metric] > before[metric] * (1 + tolerance):
+                regressions.append({
+                    'size': record['size'],
+                    'stage': record['stage'],
+                    'metric': metric,
+                    'baseline': before[metric],
+                    'current': record[metric],
+                    'ratio': record[metric] / before[metric],
+                })
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the fraud detection pipeline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='transaction counts to test')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage (best is reported)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', help='previous JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, repeat=args.repeat, seed=args.seed, profile_memory=not args.no_memory)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = find_regressions(report, json.load(f), args.tolerance)
+        for r in report['regressions']:
+            print(f"REGRESSION {r['stage']} @ {r['size']}: {r['metric']} {r['ratio']:.2f}x baseline",
+                  file=sys.stderr)
+        exit_code = 1 if report['regressions'] else 0
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
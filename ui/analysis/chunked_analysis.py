@@ -0,0 +1,494 @@
+"""Out-of-core analysis of transaction exports that do not fit in memory
+
+The export is read in bounded-size chunks (JSON Lines, CSV or Parquet) and
+each chunk is folded into per-user aggregates that merge exactly:
+
+- counts, sums and round / large / off-hours counters
+- a per-user amount histogram, from which the mean, standard deviation,
+  median and outlier count are finalized
+- a per-user transaction type histogram (entropy is computed at the end)
+- first / last timestamps, the sum of gaps and the minimum gap, including the
+  gap across a chunk boundary
+- sender / receiver counterparty pairs
+- velocity windows: rows whose window may still be extended by a later chunk
+  are carried over as a small per-user tail and counted once the window
+  has closed
+
+Peak memory therefore grows with the number of users (and their distinct
+amounts and counterparties), not with the number of transactions. Chunks must
+arrive in createdAt order, which is how the Convex `by_created_at` index and
+`npx convex export` produce them; a chunk that goes back in time raises
+ValueError. Scores match evaluate_dataframe on the same data; the standard
+deviation and the mean gap are computed from the aggregates, so they can
+differ from the in-memory values in the last bits.
+
+    results = analyze_file('transactions.jsonl', chunk_size=25000)
+
+With sketch=True the per-user amount histogram and counterparty pairs, the
+two aggregates that grow with the data, are replaced by bounded sketches (see
+sketches.py), so memory per user stays below about 7 KB while its sketches
+are exact and about 17 KB once they are not, however active the user is:
+
+- counterparties: two SetSketches (senders, receivers), exact up to 256
+  distinct counterparties each, then HyperLogLog with ~1.6% standard error;
+  circular_transactions uses an inclusion-exclusion estimate of the overlap,
+  which once a side is a HyperLogLog must exceed three standard errors of
+  the union (~5%), so only substantial overlaps are reported
+- median and outlier count: a KLLSketch of the amounts, exact up to ~200
+  amounts, then within ~1.65% of rank with 99% confidence
+- mean and standard deviation: exact running moments (Chan's parallel update)
+
+Users below those sizes get the same features as the exact mode.
+"""
+import os
+import random
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from fraud_detection_model import FraudDetectionModel
+from sketches import KLLSketch, SetSketch, hash64
+from transaction_ingest import TRANSACTION_TYPES, TransactionColumnBuilder, _Dictionary, iter_transaction_chunks
+
+DEFAULT_CHUNK_SIZE = 25000
+
+FORMATS = {
+    '.jsonl': 'json', '.ndjson': 'json', '.json': 'json',
+    '.csv': 'csv',
+    '.parquet': 'parquet', '.pq': 'parquet',
+}
+
+_NO_GAP = np.iinfo(np.int64).max
+
+# Fixed-width per-user state: name -> (dtype, fill value for new users)
+USER_ARRAYS = {
+    'count': (np.int64, 0),
+    'gap_sum_ms': (np.int64, 0),
+    'min_gap_ms': (np.int64, _NO_GAP),
+    'first_ms': (np.int64, 0),
+    'last_ms': (np.int64, 0),
+    'round': (np.int64, 0),
+    'large': (np.int64, 0),
+    'off_hours': (np.int64, 0),
+    'sender_volume': (np.float64, 0),
+    'sends': (bool, False),
+    'party': (bool, False),
+}
+
+# Running amount moments, kept instead of the amount histogram in sketch mode
+SKETCH_ARRAYS = {
+    'amount_sum': (np.float64, 0),
+    'amount_m2': (np.float64, 0),
+}
+
+
+class ChunkedAnalyzer:
+    """Folds createdAt-ordered chunks of prepared transactions into mergeable aggregates"""
+
+    def __init__(self, model: Optional[FraudDetectionModel] = None, sketch: bool = False):
+        self.model = model or FraudDetectionModel()
+        self.sketch = sketch
+        if self.model.thresholds['cycle_max_length']:
+            raise ValueError('cycle features need the whole transaction graph and are not available in chunked mode')
+        if self.model.thresholds['collapse_gift_triples']:
+            raise ValueError('gift triples can straddle chunk boundaries; collapse_gift_triples is not available in chunked mode')
+        thresholds = self.model.thresholds
+        self.windows = [thresholds['high_velocity_window']] + list(thresholds['velocity_windows'])
+        self.horizon = None
+
+        self.users = _Dictionary()
+        self.types = _Dictionary(TRANSACTION_TYPES)
+        self.capacity = 0
+        self.state: Dict[str, np.ndarray] = {}
+        self.type_counts = np.zeros((0, len(self.types.values)), dtype=np.int64)
+        self.velocity = {window: np.zeros(0, dtype=np.int64) for window in self.windows}
+
+        # Sorted unique (user, amount) histogram and (user << 32 | counterparty) pairs
+        self.hist_codes = np.empty(0, dtype=np.int64)
+        self.hist_amounts = np.empty(0, dtype=np.float64)
+        self.hist_counts = np.empty(0, dtype=np.int64)
+        self.sender_pairs = np.empty(0, dtype=np.int64)
+        self.receiver_pairs = np.empty(0, dtype=np.int64)
+
+        # Rows whose velocity windows are still open
+        self.tail_codes = np.empty(0, dtype=np.int64)
+        self.tail_times = np.empty(0, dtype=np.int64)
+
+        # Sketch mode: user code -> (sender SetSketch, receiver SetSketch, amount KLLSketch)
+        self.sketches: Dict[int, Tuple[SetSketch, SetSketch, KLLSketch]] = {}
+        # One compaction coin for every KLLSketch, rather than a generator per user
+        self.rng = random.Random(0)
+
+        self.total_transactions = 0
+        self.total_volume = 0.0
+        self.first_created = None
+        self.last_created = None
+
+    def add_chunk(self, df: pd.DataFrame):
+        """Fold one prepared chunk; chunks must not go back in createdAt"""
+        if len(df) == 0:
+            return
+        self.check_chunk(df)
+        df = df.sort_values('createdAt', kind='stable')
+        chunk_times = self.model._to_epoch_ms(df['createdAt'])
+        self.horizon = int(chunk_times[-1])
+
+        self._fold_overall(df, chunk_times)
+        user_rows = self.model._explode_user_rows(df)
+        codes = self.users.encode(user_rows['user_id'].to_numpy(dtype=object)).astype(np.int64)
+        sender_codes = self.users.encode(user_rows['senderId'].to_numpy(dtype=object)).astype(np.int64)
+        receiver_codes = self.users.encode(user_rows['receiverId'].to_numpy(dtype=object)).astype(np.int64)
+        self._grow(len(self.users.values))
+        n_users = self.capacity
+        state = self.state
+
+        times = self.model._to_epoch_ms(user_rows['createdAt'])
+        amounts = user_rows['amount'].to_numpy(dtype=np.float64)
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.append(starts[1:], len(codes))
+        seg_codes = codes[starts]
+
+        # Gaps inside the chunk and across the boundary with the previous one
+        same_user = codes[1:] == codes[:-1]
+        gaps = np.diff(times)[same_user]
+        gap_codes = codes[1:][same_user]
+        seen = state['count'][seg_codes] > 0
+        gaps = np.append(gaps, times[starts][seen] - state['last_ms'][seg_codes[seen]])
+        gap_codes = np.append(gap_codes, seg_codes[seen])
+        state['gap_sum_ms'] += np.bincount(gap_codes, weights=gaps, minlength=n_users).astype(np.int64)
+        np.minimum.at(state['min_gap_ms'], gap_codes, gaps)
+        state['first_ms'][seg_codes[~seen]] = times[starts][~seen]
+        state['last_ms'][seg_codes] = times[ends - 1]
+
+        thresholds = self.model.thresholds
+        hours = (times // 3600000) % 24
+        state['count'] += np.bincount(codes, minlength=n_users)
+        state['round'] += np.bincount(codes[amounts % thresholds['round_amount_threshold'] == 0], minlength=n_users)
+        state['large'] += np.bincount(codes[amounts >= thresholds['large_amount_threshold']], minlength=n_users)
+        state['off_hours'] += np.bincount(
+            codes[(hours >= thresholds['off_hours_start']) | (hours < thresholds['off_hours_end'])], minlength=n_users
+        )
+
+        type_codes = self.types.encode(user_rows['type'].to_numpy(dtype=object)).astype(np.int64)
+        if len(self.types.values) > self.type_counts.shape[1]:
+            widened = np.zeros((n_users, len(self.types.values)), dtype=np.int64)
+            widened[:, :self.type_counts.shape[1]] = self.type_counts
+            self.type_counts = widened
+        has_type = type_codes >= 0
+        np.add.at(self.type_counts, (codes[has_type], type_codes[has_type]), 1)
+
+        if self.sketch:
+            self._fold_sketches(codes, starts, ends, amounts, sender_codes, receiver_codes)
+        else:
+            self._fold_histogram(codes, amounts)
+            self.sender_pairs = _sorted_union(self.sender_pairs, (codes << 32 | sender_codes)[sender_codes >= 0])
+            self.receiver_pairs = _sorted_union(self.receiver_pairs, (codes << 32 | receiver_codes)[receiver_codes >= 0])
+        self._fold_velocity(codes, times)
+
+    def check_chunk(self, df: pd.DataFrame):
+        """Raise ValueError if the chunk goes back before the chunks already folded"""
+        if self.horizon is not None and len(df) and self.model._to_epoch_ms(df['createdAt']).min() < self.horizon:
+            raise ValueError('chunks must be in createdAt order; sort the export before chunked analysis')
+
+    def finalize(self) -> Dict:
+        """Score the folded aggregates, returning evaluate_dataframe's structure
+        
+        The aggregates are left untouched, so more chunks can be added afterwards.
+        """
+        increments, _, _ = self._close_windows(self.tail_codes, self.tail_times, final=True)
+        velocity = {window: self.velocity[window] + increments[window] for window in self.windows}
+        all_features = self._user_features(velocity)
+        results = self.model._score_users(all_features)
+        return self.model._build_results(results, self.model._overall_features_from_partial(self._overall_partial()))
+
+    def _grow(self, n_users: int):
+        """Resize the per-user arrays to hold at least n_users"""
+        if n_users <= self.capacity:
+            return
+        capacity = max(n_users, self.capacity * 2, 1024)
+        arrays = {**USER_ARRAYS, **SKETCH_ARRAYS} if self.sketch else USER_ARRAYS
+        for name, (dtype, fill) in arrays.items():
+            grown = np.full(capacity, fill, dtype=dtype)
+            grown[:self.capacity] = self.state.get(name, grown[:0])
+            self.state[name] = grown
+        type_counts = np.zeros((capacity, self.type_counts.shape[1]), dtype=np.int64)
+        type_counts[:self.capacity] = self.type_counts
+        self.type_counts = type_counts
+        for window, periods in self.velocity.items():
+            self.velocity[window] = np.append(periods, np.zeros(capacity - self.capacity, dtype=np.int64))
+        self.capacity = capacity
+
+    def _fold_overall(self, df: pd.DataFrame, chunk_times: np.ndarray):
+        """Overall aggregates; per-sender volumes are kept by user so senders may span chunks"""
+        self.total_transactions += len(df)
+        self.total_volume += df['amount'].sum()
+        first, last = pd.Timestamp(int(chunk_times[0]), unit='ms'), pd.Timestamp(int(chunk_times[-1]), unit='ms')
+        self.first_created = first if self.first_created is None else min(self.first_created, first)
+        self.last_created = last if self.last_created is None else max(self.last_created, last)
+
+        senders = self.users.encode(df['senderId'].to_numpy(dtype=object)).astype(np.int64)
+        receivers = self.users.encode(df['receiverId'].to_numpy(dtype=object)).astype(np.int64)
+        self._grow(len(self.users.values))
+        has_sender = senders >= 0
+        self.state['sender_volume'] += np.bincount(
+            senders[has_sender], weights=df['amount'].to_numpy(dtype=np.float64)[has_sender], minlength=self.capacity
+        )
+        self.state['sends'][senders[has_sender]] = True
+        self.state['party'][senders[has_sender]] = True
+        self.state['party'][receivers[receivers >= 0]] = True
+
+    def _overall_partial(self) -> Dict:
+        sends = self.state['sends'][:self.capacity]
+        volumes = self.state['sender_volume'][sends]
+        return {
+            'total_transactions': self.total_transactions,
+            'users': {self.users.values[code] for code in np.flatnonzero(self.state['party'])},
+            'total_volume': self.total_volume,
+            'first_created': self.first_created,
+            'last_created': self.last_created,
+            'sender_count': int(sends.sum()),
+            'max_sender_volume': volumes.max() if len(volumes) else 0,
+            'sender_volume_total': volumes.sum(),
+        }
+
+    def _fold_histogram(self, codes: np.ndarray, amounts: np.ndarray):
+        """Merge the chunk's (user, amount) counts into the running histogram"""
+        all_codes = np.concatenate([self.hist_codes, codes])
+        all_amounts = np.concatenate([self.hist_amounts, amounts])
+        all_counts = np.concatenate([self.hist_counts, np.ones(len(codes), dtype=np.int64)])
+        order = np.lexsort((all_amounts, all_codes))
+        all_codes, all_amounts, all_counts = all_codes[order], all_amounts[order], all_counts[order]
+        starts = np.flatnonzero(np.r_[True, (all_codes[1:] != all_codes[:-1]) | (all_amounts[1:] != all_amounts[:-1])])
+        self.hist_codes = all_codes[starts]
+        self.hist_amounts = all_amounts[starts]
+        self.hist_counts = np.add.reduceat(all_counts, starts) if len(starts) else all_counts
+
+    def _fold_sketches(self, codes: np.ndarray, starts: np.ndarray, ends: np.ndarray, amounts: np.ndarray,
+                       sender_codes: np.ndarray, receiver_codes: np.ndarray):
+        """Merge the chunk's amount moments and per-user sketches (after count has been updated)"""
+        state = self.state
+        seg_codes = codes[starts]
+        seg_counts = (ends - starts).astype(np.float64)
+        seg_sums = np.add.reduceat(amounts, starts)
+        seg_means = seg_sums / seg_counts
+        seg_m2 = np.add.reduceat((amounts - np.repeat(seg_means, ends - starts)) ** 2, starts)
+        previous = state['count'][seg_codes] - seg_counts
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = seg_means - np.where(previous > 0, state['amount_sum'][seg_codes] / previous, 0)
+        state['amount_m2'][seg_codes] += seg_m2 + np.where(
+            previous > 0, delta ** 2 * previous * seg_counts / (previous + seg_counts), 0
+        )
+        state['amount_sum'][seg_codes] += seg_sums
+
+        sender_hashes = hash64(sender_codes)
+        receiver_hashes = hash64(receiver_codes)
+        has_sender = sender_codes >= 0
+        has_receiver = receiver_codes >= 0
+        for code, start, end in zip(seg_codes.tolist(), starts.tolist(), ends.tolist()):
+            sketches = self.sketches.get(code)
+            if sketches is None:
+                sketches = self.sketches[code] = (SetSketch(), SetSketch(), KLLSketch(rng=self.rng))
+            senders, receivers, amount_sketch = sketches
+            senders.add_hashes(sender_hashes[start:end][has_sender[start:end]])
+            receivers.add_hashes(receiver_hashes[start:end][has_receiver[start:end]])
+            amount_sketch.update(amounts[start:end])
+
+    def _fold_velocity(self, codes: np.ndarray, times: np.ndarray):
+        """Count the velocity windows that can no longer change and carry the rest over"""
+        increments, self.tail_codes, self.tail_times = self._close_windows(
+            np.concatenate([self.tail_codes, codes]), np.concatenate([self.tail_times, times])
+        )
+        for window in self.windows:
+            self.velocity[window] += increments[window]
+
+    def _close_windows(self, all_codes: np.ndarray, all_times: np.ndarray, final: bool = False):
+        """Per-user rapid window counts of the rows whose windows have closed, and the rows still open"""
+        increments = {window: np.zeros(self.capacity, dtype=np.int64) for window in self.windows}
+        if len(all_codes) == 0:
+            return increments, all_codes, all_times
+        order = np.lexsort((all_times, all_codes))
+        all_codes, all_times = all_codes[order], all_times[order]
+        starts = np.flatnonzero(np.r_[True, all_codes[1:] != all_codes[:-1]])
+        bounds = np.append(starts, len(all_codes))
+
+        # A user's latest row only starts a window once a later row exists, and rows
+        # sharing its timestamp stay open with it because they fall in its window
+        is_last = np.zeros(len(all_codes), dtype=bool)
+        is_last[bounds[1:] - 1] = True
+        if final:
+            closed = ~is_last
+        else:
+            latest = np.repeat(all_times[bounds[1:] - 1], np.diff(bounds))
+            # Later chunks start at or after the horizon, so they cannot reach these windows
+            closed = (all_times + max(self.windows) * 1000 < self.horizon) & (all_times < latest)
+
+        for window in self.windows:
+            counts = self.model._velocity_window_counts(all_times, bounds, window)
+            rapid = closed & (counts >= self.model.thresholds['high_velocity_count'])
+            increments[window] = np.bincount(all_codes[rapid], minlength=self.capacity)
+        return increments, all_codes[~closed], all_times[~closed]
+
+    def _exact_statistics(self, n: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """Amount and counterparty features from the amount histogram and the counterparty pairs"""
+        n_users = len(n)
+        # Amount statistics from the histogram (sorted by user, then amount)
+        hist_codes, hist_amounts, hist_counts = self.hist_codes, self.hist_amounts, self.hist_counts
+        total_amount = np.bincount(hist_codes, weights=hist_amounts * hist_counts, minlength=n_users)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_amount = total_amount / n
+            squared_dev = (hist_amounts - avg_amount[hist_codes]) ** 2 * hist_counts
+            amount_std = np.sqrt(
+                np.bincount(hist_codes, weights=squared_dev, minlength=n_users) / np.where(n > 1, n - 1, np.nan)
+            )
+            z_scores = np.abs(hist_amounts - avg_amount[hist_codes]) / amount_std[hist_codes]
+        outliers = np.bincount(hist_codes[z_scores > 3], weights=hist_counts[z_scores > 3], minlength=n_users)
+
+        cumulative = np.cumsum(hist_counts)
+        offsets = np.concatenate([[0], cumulative])[np.searchsorted(hist_codes, np.arange(n_users))]
+        lower = hist_amounts[np.minimum(np.searchsorted(cumulative, offsets + (n - 1) // 2, side='right'),
+                                        len(hist_amounts) - 1)]
+        upper = hist_amounts[np.minimum(np.searchsorted(cumulative, offsets + n // 2, side='right'),
+                                        len(hist_amounts) - 1)]
+        median_amount = (lower + upper) / 2
+
+        # Counterparties
+        counterparty_pairs = _sorted_union(self.sender_pairs, self.receiver_pairs)
+        unique_counterparties = np.bincount(counterparty_pairs >> 32, minlength=n_users) - 1
+        both_sides = self.sender_pairs[np.isin(self.sender_pairs, self.receiver_pairs, assume_unique=True, kind='sort')]
+        circular = np.bincount(both_sides >> 32, minlength=n_users) > 1
+        return total_amount, avg_amount, median_amount, amount_std, outliers, unique_counterparties, circular
+
+    def _sketch_statistics(self, n: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """Amount and counterparty features from the running moments and the per-user sketches"""
+        n_users = len(n)
+        total_amount = self.state['amount_sum'][:n_users]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_amount = total_amount / n
+            amount_std = np.sqrt(self.state['amount_m2'][:n_users] / np.where(n > 1, n - 1, np.nan))
+        median_amount = np.full(n_users, np.nan)
+        outliers = np.zeros(n_users, dtype=np.int64)
+        unique_counterparties = np.full(n_users, -1, dtype=np.int64)
+        circular = np.zeros(n_users, dtype=bool)
+        for code, (senders, receivers, amount_sketch) in self.sketches.items():
+            median_amount[code] = amount_sketch.median()
+            if amount_std[code] > 0:
+                # |z| > 3 means below mean - 3 std or above mean + 3 std
+                spread = 3 * amount_std[code]
+                outside = amount_sketch.rank(avg_amount[code] - spread) + \
+                    1 - amount_sketch.rank(avg_amount[code] + spread, inclusive=True)
+                outliers[code] = round(outside * amount_sketch.n)
+            unique_counterparties[code] = round(senders.union_estimate(receivers)) - 1
+            # An overlap within the HyperLogLog error is no evidence of a loop
+            shared = senders.intersection_estimate(receivers)
+            circular[code] = round(shared) > 1 and shared > senders.intersection_error(receivers)
+        return total_amount, avg_amount, median_amount, amount_std, outliers, unique_counterparties, circular
+
+    def _user_features(self, velocity: Dict[int, np.ndarray]) -> Dict[str, Dict]:
+        """Finalize features for every user seen, in the same user order as evaluate_dataframe"""
+        state = self.state
+        n_users = len(self.users.values)
+        n = state['count'][:n_users]
+
+        statistics = self._sketch_statistics(n) if self.sketch else self._exact_statistics(n)
+        total_amount, avg_amount, median_amount, amount_std, outliers, unique_counterparties, circular = statistics
+
+        # Type entropy, summing terms in value_counts() order
+        type_counts = -np.sort(-self.type_counts[:n_users], axis=1)
+        type_totals = type_counts.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            probs = type_counts / type_totals
+            terms = np.where(type_counts > 0, probs * np.log2(np.where(probs > 0, probs, 1)), 0.0)
+        unique_types = (type_counts > 0).sum(axis=1)
+        entropy = -terms.sum(axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_gap = np.where(n > 1, state['gap_sum_ms'][:n_users] / 1000 / (n - 1), np.nan)
+        min_gap = np.where(state['min_gap_ms'][:n_users] == _NO_GAP, np.nan, state['min_gap_ms'][:n_users] / 1000)
+
+        all_features = {}
+        for code in sorted(np.flatnonzero(n > 0), key=lambda code: self.users.values[code]):
+            features = {
+                'transaction_count': int(n[code]),
+                'total_amount': total_amount[code],
+                'avg_amount': avg_amount[code],
+                'median_amount': median_amount[code],
+                'amount_std': amount_std[code],
+                'avg_time_between_txns': avg_gap[code],
+                'min_time_between_txns': min_gap[code],
+                'high_velocity_periods': int(velocity[self.windows[0]][code]),
+                'round_amount_ratio': state['round'][code] / n[code],
+                'large_transaction_count': int(state['large'][code]),
+                'off_hours_ratio': state['off_hours'][code] / n[code],
+                'unique_transaction_types': int(unique_types[code]),
+                'transaction_type_entropy': entropy[code] if unique_types[code] > 1 else 0,
+                'unique_counterparties': int(unique_counterparties[code]),
+                'circular_transactions': bool(circular[code]),
+                'amount_outliers': int(outliers[code]) if amount_std[code] > 0 else 0,
+            }
+            for window in self.model.thresholds['velocity_windows']:
+                features[f'high_velocity_periods_{window}s'] = int(velocity[window][code])
+            all_features[self.users.values[code]] = features
+        return all_features
+
+
+def iter_frame_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, file_format: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """Yield prepared DataFrames of at most chunk_size rows from a JSON Lines, CSV or Parquet export"""
+    file_format = file_format or FORMATS.get(os.path.splitext(path)[1].lower())
+    if file_format == 'json':
+        builder = TransactionColumnBuilder()
+        with open(path, 'rb') as f:
+            for records in iter_transaction_chunks(f, chunk_size):
+                builder.add_chunk(records)
+                yield builder.to_dataframe()
+    elif file_format == 'csv':
+        for frame in pd.read_csv(path, chunksize=chunk_size, dtype={'amount': str}):
+            yield _prepare_frame(frame)
+    elif file_format == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError('reading Parquet exports requires pyarrow') from exc
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield _prepare_frame(batch.to_pandas())
+    else:
+        raise ValueError(f"unknown export format for {path!r}, expected one of {sorted(set(FORMATS.values()))}")
+
+
+def analyze_file(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, model: Optional[FraudDetectionModel] = None,
+                 file_format: Optional[str] = None, sketch: bool = False) -> Dict:
+    """Evaluate a createdAt-ordered export chunk by chunk, with bounded per-user sketches if sketch=True"""
+    analyzer = ChunkedAnalyzer(model, sketch=sketch)
+    instrumentation = analyzer.model.instrumentation
+    with instrumentation.run():
+        chunks = iter_frame_chunks(path, chunk_size, file_format)
+        while True:
+            with instrumentation.stage('read_chunk'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            instrumentation.count('rows', len(chunk))
+            with instrumentation.stage('fold_chunk'):
+                analyzer.add_chunk(chunk)
+        with instrumentation.stage('finalize'):
+            results = analyzer.finalize()
+    return analyzer.model._attach_instrumentation(results)
+
+
+def _sorted_union(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Sorted unique values of both arrays (a sort is much faster than np.union1d's hashing for int64 keys)"""
+    values = np.concatenate([left, right])
+    values.sort()
+    return values[np.r_[True, values[1:] != values[:-1]]] if len(values) else values
+
+
+def _prepare_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize CSV / Parquet columns to the prepared dtypes (int64 amount, datetime64[ms] createdAt)"""
+    df = df.copy()
+    amount = pd.to_numeric(df['amount'])
+    df['amount'] = amount.astype(np.int64) if (amount % 1 == 0).all() else amount.astype(float)
+    if not pd.api.types.is_datetime64_any_dtype(df['createdAt']):
+        df['createdAt'] = pd.to_numeric(df['createdAt']).astype(np.int64).to_numpy().view('datetime64[ms]')
+    else:
+        df['createdAt'] = df['createdAt'].astype('datetime64[ms]')
+    return df
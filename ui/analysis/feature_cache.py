@@ -0,0 +1,97 @@
+"""Per-user cache of scored features, keyed by a fingerprint of the user's transactions
+
+FraudDetectionModel fingerprints each user's slice of the transaction set
+(a digest over the sorted per-row hashes of the columns the features read,
+plus the thresholds) and only recomputes features and scores for users whose
+fingerprint is not cached. Entries are evicted least-recently-used once
+`max_entries` is reached and can be persisted to disk between runs:
+
+    cache = FeatureCache(max_entries=50000, path='feature_cache.pkl')
+    model = FraudDetectionModel(cache=cache)
+    results = model.evaluate_transactions(transactions)
+    cache.save()
+    print(cache.stats())
+"""
+import os
+import pickle
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+class FeatureCache:
+    """Bounded LRU mapping of (user, fingerprint) to a scored user result"""
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, max_entries: int = 100000, path: Optional[str] = None):
+        if max_entries < 1:
+            raise ValueError('max_entries must be at least 1')
+        self.max_entries = max_entries
+        self.path = path
+        self.entries: 'OrderedDict[Hashable, Dict]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        """Cached result for `key`, or None; counts a hit or a miss"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, result: Dict):
+        """Store a result, evicting the least recently used entries beyond max_entries"""
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (the counters are kept)"""
+        self.entries.clear()
+
+    def stats(self) -> Dict:
+        """Hit / miss counters and the current size"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+        }
+
+    def save(self, path: Optional[str] = None):
+        """Write the entries to disk, atomically replacing any previous file"""
+        path = path or self.path
+        if path is None:
+            raise ValueError('no path given for the feature cache')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'version': self.FORMAT_VERSION, 'entries': list(self.entries.items())},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load(self, path: Optional[str] = None):
+        """Load entries saved by save(), most recently used last; unknown formats are ignored"""
+        path = path or self.path
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if not isinstance(data, dict) or data.get('version') != self.FORMAT_VERSION:
+            return
+        for key, result in data['entries']:
+            self.put(key, result)
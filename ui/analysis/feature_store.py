@@ -0,0 +1,241 @@
+"""Persistent per-user aggregate store, memory-mapped across runs
+
+Keeps the ChunkedAnalyzer aggregates on disk so a scheduled run only has to
+ingest the transactions created since the previous one:
+
+    store = FeatureStore.open('feature_store')
+    store.update_file('transactions.jsonl')     # or store.update(df)
+    results = store.results()
+
+Layout of the store directory:
+
+    meta.json           thresholds, createdAt high-water mark, overall totals
+    users.jsonl         stable user-ID dictionary, one JSON string per line (row = code)
+    <name>.npy          fixed-width per-user arrays, opened with mmap_mode='r+'
+                        and updated in place
+    hist_*.npy, *_pairs.npy, tail_*.npy
+                        variable-length aggregates, rewritten on each update
+
+Opening a store only reads meta.json; the user dictionary and arrays are
+mapped on first use. The high-water mark mirrors the Convex `by_created_at`
+index: rows with createdAt above the mark are new, and the _ids already seen
+at exactly the mark are remembered so ties are not ingested twice.
+
+Updates write arrays in place, so meta.json is flagged dirty while a chunk
+is being folded; a store left dirty by a crash refuses to open and must be
+rebuilt. A chunk that fails validation (out of createdAt order) is rejected
+before anything is written, and when reading a later chunk of an export
+fails, the chunks already folded are persisted before the error propagates,
+so the store stays usable.
+"""
+import json
+import os
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from chunked_analysis import DEFAULT_CHUNK_SIZE, USER_ARRAYS, ChunkedAnalyzer, iter_frame_chunks
+from fraud_detection_model import FraudDetectionModel
+from transaction_ingest import _Dictionary
+
+VARIABLE_ARRAYS = ['hist_codes', 'hist_amounts', 'hist_counts', 'sender_pairs', 'receiver_pairs',
+                   'tail_codes', 'tail_times']
+
+
+class FeatureStore:
+    """Memory-mapped ChunkedAnalyzer state with a createdAt high-water mark"""
+
+    VERSION = 1
+
+    def __init__(self, path: str, meta: Dict, model: FraudDetectionModel):
+        self.path = path
+        self.meta = meta
+        self.model = model
+        self._analyzer: Optional[ChunkedAnalyzer] = None
+
+    @classmethod
+    def open(cls, path: str, model: Optional[FraudDetectionModel] = None) -> 'FeatureStore':
+        """Open the store at `path`, creating an empty one if it does not exist"""
+        model = model or FraudDetectionModel()
+        thresholds = json.loads(json.dumps(model.thresholds))
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            os.makedirs(path, exist_ok=True)
+            store = cls(path, {
+                'version': cls.VERSION,
+                'thresholds': thresholds,
+                'high_water_mark': None,
+                'mark_ids': [],
+                'n_users': 0,
+                'capacity': 0,
+                'types': None,
+                'overall': None,
+                'dirty': False,
+            }, model)
+            store._write_meta()
+            return store
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') != cls.VERSION:
+            raise ValueError(f"feature store {path!r} has an unsupported version")
+        if meta['dirty']:
+            raise ValueError(f"feature store {path!r} was interrupted during an update and must be rebuilt")
+        if meta['thresholds'] != thresholds:
+            raise ValueError(f"feature store {path!r} was built with different thresholds and must be rebuilt")
+        return cls(path, meta, model)
+
+    @property
+    def high_water_mark(self) -> Optional[int]:
+        """Latest createdAt (epoch ms) ingested so far"""
+        return self.meta['high_water_mark']
+
+    @property
+    def user_count(self) -> int:
+        return self.meta['n_users']
+
+    @property
+    def analyzer(self) -> ChunkedAnalyzer:
+        """The aggregates, mapped from disk on first access"""
+        if self._analyzer is None:
+            self._analyzer = self._load()
+        return self._analyzer
+
+    def update(self, df: pd.DataFrame) -> int:
+        """Ingest the rows of a prepared frame that are newer than the high-water mark"""
+        return self._ingest([df])
+
+    def update_file(self, export_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    file_format: Optional[str] = None) -> int:
+        """Ingest the new rows of a createdAt-ordered export, chunk by chunk"""
+        return self._ingest(iter_frame_chunks(export_path, chunk_size, file_format))
+
+    def results(self) -> Dict:
+        """Score every user in the store, returning evaluate_dataframe's structure"""
+        return self.analyzer.finalize()
+
+    def _ingest(self, frames) -> int:
+        analyzer = self.analyzer
+        ingested = 0
+        folding = False
+        try:
+            for df in frames:
+                df = self._new_rows(df)
+                if len(df) == 0:
+                    continue
+                analyzer.check_chunk(df)
+                if not self.meta['dirty']:
+                    self.meta['dirty'] = True
+                    self._write_meta()
+                folding = True
+                analyzer.add_chunk(df)
+                folding = False
+                self._advance_mark(df)
+                ingested += len(df)
+        except Exception:
+            # Between chunks the aggregates are consistent, so keep what was folded;
+            # a failure inside add_chunk leaves the store flagged dirty
+            if not folding and ingested:
+                self._persist()
+            raise
+        if ingested:
+            self._persist()
+        return ingested
+
+    def _new_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        mark = self.meta['high_water_mark']
+        if mark is None or len(df) == 0:
+            return df
+        times = self.model._to_epoch_ms(df['createdAt'])
+        keep = times > mark
+        if '_id' in df.columns:
+            keep |= (times == mark) & ~df['_id'].isin(self.meta['mark_ids']).to_numpy()
+        return df[keep]
+
+    def _advance_mark(self, df: pd.DataFrame):
+        times = self.model._to_epoch_ms(df['createdAt'])
+        latest = int(times.max())
+        ids = [str(i) for i in df['_id'][times == latest]] if '_id' in df.columns else []
+        if self.meta['high_water_mark'] is None or latest > self.meta['high_water_mark']:
+            self.meta['high_water_mark'] = latest
+            self.meta['mark_ids'] = ids
+        elif latest == self.meta['high_water_mark']:
+            self.meta['mark_ids'] = sorted(set(self.meta['mark_ids']).union(ids))
+
+    def _load(self) -> ChunkedAnalyzer:
+        analyzer = ChunkedAnalyzer(self.model)
+        meta = self.meta
+        if meta['capacity'] == 0:
+            return analyzer
+
+        with open(os.path.join(self.path, 'users.jsonl')) as f:
+            analyzer.users = _Dictionary(json.loads(line) for line in f)
+        analyzer.types = _Dictionary(meta['types'])
+        analyzer.capacity = meta['capacity']
+        for name in USER_ARRAYS:
+            analyzer.state[name] = self._map(name, 'r+')
+        analyzer.type_counts = self._map('type_counts', 'r+')
+        analyzer.velocity = {window: self._map(f"velocity_{window}", 'r+') for window in analyzer.windows}
+        for name in VARIABLE_ARRAYS:
+            setattr(analyzer, name, self._map(name, 'r'))
+
+        analyzer.horizon = meta['high_water_mark']
+        overall = meta['overall']
+        analyzer.total_transactions = overall['total_transactions']
+        analyzer.total_volume = overall['total_volume']
+        analyzer.first_created = pd.Timestamp(overall['first_created'], unit='ms')
+        analyzer.last_created = pd.Timestamp(overall['last_created'], unit='ms')
+        return analyzer
+
+    def _persist(self):
+        """Flush in-place arrays, rewrite replaced ones and clear the dirty flag"""
+        analyzer = self.analyzer
+        for name in USER_ARRAYS:
+            analyzer.state[name] = self._save(name, analyzer.state[name], 'r+')
+        analyzer.type_counts = self._save('type_counts', analyzer.type_counts, 'r+')
+        for window in analyzer.windows:
+            analyzer.velocity[window] = self._save(f"velocity_{window}", analyzer.velocity[window], 'r+')
+        for name in VARIABLE_ARRAYS:
+            setattr(analyzer, name, self._save(name, getattr(analyzer, name), 'r'))
+
+        with open(os.path.join(self.path, 'users.jsonl'), 'a') as f:
+            for user_id in analyzer.users.values[self.meta['n_users']:]:
+                f.write(json.dumps(str(user_id)) + '\n')
+
+        self.meta.update({
+            'n_users': len(analyzer.users.values),
+            'capacity': analyzer.capacity,
+            'types': [str(t) for t in analyzer.types.values],
+            'overall': {
+                'total_transactions': int(analyzer.total_transactions),
+                'total_volume': float(analyzer.total_volume),
+                'first_created': int(analyzer.first_created.value // 10 ** 6),
+                'last_created': int(analyzer.last_created.value // 10 ** 6),
+            },
+            'dirty': False,
+        })
+        self._write_meta()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.npy")
+
+    def _map(self, name: str, mode: str) -> np.ndarray:
+        return np.load(self._file(name), mmap_mode=mode)
+
+    def _save(self, name: str, array: np.ndarray, mode: str) -> np.ndarray:
+        """Flush an array mapped from its own file, otherwise write it out and map the new file"""
+        path = self._file(name)
+        if isinstance(array, np.memmap) and array.filename == os.path.abspath(path) and mode == 'r+':
+            array.flush()
+            return array
+        tmp_path = f"{path}.tmp.npy"
+        np.save(tmp_path, np.ascontiguousarray(array))
+        os.replace(tmp_path, path)
+        return self._map(name, mode)
+
+    def _write_meta(self):
+        path = os.path.join(self.path, 'meta.json')
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(f"{path}.tmp", path)
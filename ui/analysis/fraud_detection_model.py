@@ -1,19 +1,46 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
+from typing import List, Dict, Iterable, Optional, Tuple
+import copy
+import hashlib
 import json
 
+from feature_cache import FeatureCache
+from gift_events import collapse_gift_triples
+from instrumentation import Instrumentation
+from scoring_rules import DEFAULT_THRESHOLDS, RuleSet, load_config_file, risk_level
+from transaction_graph import TransactionGraph
+
+# Columns that calculate_all_user_features reads, hashed into the cache fingerprints
+FINGERPRINT_COLUMNS = ['amount', 'createdAt', 'type', 'senderId', 'receiverId', 'owner']
+
+# Malformed gift triples listed in the 'gift_events' report (all are counted)
+MAX_REPORTED_MALFORMED = 1000
+
 class FraudDetectionModel:
-    def __init__(self):
-        self.thresholds = {
-            'high_velocity_window': 300,  # 5 minutes
-            'high_velocity_count': 3,
-            'large_amount_threshold': 1000000000,  # 1B units
-            'off_hours_start': 22,
-            'off_hours_end': 6,
-            'round_amount_threshold': 1000000  # 1M units
-        }
+    def __init__(self, cache: Optional[FeatureCache] = None, instrumentation: Optional[Instrumentation] = None,
+                 rules: Optional[RuleSet] = None):
+        self.thresholds = copy.deepcopy(DEFAULT_THRESHOLDS)
+        # Declarative score rules (see scoring_rules)
+        self.rules = rules or RuleSet()
+        self.cache = cache
+        # Set by index_transactions
+        self.time_index = None
+        # Set by update_clusters
+        self.account_clusters = None
+        # Falls back to FRAUD_INSTRUMENT, which is a no-op unless set
+        self.instrumentation = instrumentation or Instrumentation.from_env()
+    
+    def load_config(self, path: str) -> 'FraudDetectionModel':
+        """Apply the 'thresholds' and 'rules' sections of a JSON / YAML config file"""
+        config = load_config_file(path)
+        unknown = set(config.get('thresholds', {})) - set(self.thresholds)
+        if unknown:
+            raise ValueError(f"unknown thresholds in {path}: {', '.join(sorted(unknown))}")
+        self.thresholds.update(config.get('thresholds', {}))
+        if 'rules' in config:
+            self.rules = RuleSet(config['rules'])
+        return self
         
     def prepare_data(self, transactions: List[Dict]) -> pd.DataFrame:
         """Convert transaction list to DataFrame with proper types"""
@@ -53,17 +80,15 @@ class FraudDetectionModel:
         features['min_time_between_txns'] = time_diffs.min()
         
         # High velocity transactions (multiple within short window)
-        rapid_count = 0
-        for i in range(len(user_txns) - 1):
-            window_end = user_txns.iloc[i]['createdAt'] + timedelta(seconds=self.thresholds['high_velocity_window'])
-            window_txns = user_txns[
-                (user_txns['createdAt'] >= user_txns.iloc[i]['createdAt']) &
-                (user_txns['createdAt'] <= window_end)
-            ]
-            if len(window_txns) >= self.thresholds['high_velocity_count']:
-                rapid_count += 1
-        
-        features['high_velocity_periods'] = rapid_count
+        times = self._to_epoch_ms(user_txns['createdAt'])
+        bounds = np.array([0, len(times)])
+        features['high_velocity_periods'] = int(self._high_velocity_periods(
+            times, bounds, self.thresholds['high_velocity_window']
+        )[0])
+        for window in self.thresholds['velocity_windows']:
+            features[f'high_velocity_periods_{window}s'] = int(
+                self._high_velocity_periods(times, bounds, window)[0]
+            )
         
         # Amount patterns
         features['round_amount_ratio'] = (
@@ -100,9 +125,259 @@ class FraudDetectionModel:
             features['amount_outliers'] = (z_scores > 3).sum()
         else:
             features['amount_outliers'] = 0
+        
+        # Multi-hop transaction loops
+        if self.thresholds['cycle_max_length']:
+            features.update(self._cycle_features(self.calculate_cycle_features(df), user_id))
             
         return features
     
+    def calculate_all_user_features(self, df: pd.DataFrame, users: Optional[Iterable[str]] = None,
+                                    cycle_features: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+        """Calculate features for every user (or only `users`) in a single grouped pass
+        
+        `cycle_features` can carry precomputed calculate_cycle_features() output when
+        `df` is only part of the transaction graph.
+        """
+        with self.instrumentation.stage('explode_user_rows'):
+            user_rows = self._explode_user_rows(df, users)
+        if len(user_rows) == 0:
+            return {}
+        if self.thresholds['cycle_max_length'] and cycle_features is None:
+            cycle_features = self.calculate_cycle_features(df)
+        return self._features_from_user_rows(user_rows, cycle_features)
+    
+    def _features_from_user_rows(self, user_rows: pd.DataFrame,
+                                 cycle_features: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+        """Grouped feature engine over _explode_user_rows() output"""
+        laps = self.instrumentation.laps('user_features')
+        user_ids, columns = self._feature_columns(user_rows, laps)
+        all_features = {}
+        for i, user_id in enumerate(user_ids):
+            all_features[user_id] = {
+                'transaction_count': int(columns['transaction_count'][i]),
+                'total_amount': columns['total_amount'][i],
+                'avg_amount': columns['avg_amount'][i],
+                'median_amount': columns['median_amount'][i],
+                'amount_std': columns['amount_std'][i],
+                'avg_time_between_txns': columns['avg_time_between_txns'][i],
+                'min_time_between_txns': columns['min_time_between_txns'][i],
+                'high_velocity_periods': int(columns['high_velocity_periods'][i]),
+                'round_amount_ratio': columns['round_amount_ratio'][i],
+                'large_transaction_count': columns['large_transaction_count'][i],
+                'off_hours_ratio': columns['off_hours_ratio'][i],
+                'unique_transaction_types': int(columns['unique_transaction_types'][i]),
+                'transaction_type_entropy': columns['transaction_type_entropy'][i],
+                'unique_counterparties': int(columns['unique_counterparties'][i]),
+                'circular_transactions': bool(columns['circular_transactions'][i]),
+                'amount_outliers': columns['amount_outliers'][i],
+            }
+            for window in self.thresholds['velocity_windows']:
+                all_features[user_id][f'high_velocity_periods_{window}s'] = int(columns[f'high_velocity_periods_{window}s'][i])
+        
+        laps.split('assemble')
+        # Multi-hop transaction loops
+        if self.thresholds['cycle_max_length']:
+            for user_id, features in all_features.items():
+                features.update(self._cycle_features(cycle_features, user_id))
+        
+        return all_features
+    
+    def _feature_columns(self, user_rows: pd.DataFrame, laps=None) -> Tuple[pd.Index, Dict[str, np.ndarray]]:
+        """Per-user feature arrays (without cycle features) over _explode_user_rows() output, in user order"""
+        laps = laps or self.instrumentation.laps('user_features')
+        
+        # Rows are contiguous per user, so factorized codes run 0..U-1 in row order
+        codes, user_ids = pd.factorize(user_rows['user_id'])
+        user_rows['user_code'] = codes
+        n = np.bincount(codes)
+        bounds = np.append(0, np.cumsum(n))
+        grouped = user_rows.groupby('user_code', observed=True)
+        
+        laps.split('grouping')
+        # Basic stats, using the same two-pass sums as Series.mean()/std()
+        amounts = user_rows['amount'].to_numpy()
+        total_amount = self._segment_sums(amounts, bounds)
+        avg_amount = total_amount / n
+        median_amount = grouped['amount'].median().to_numpy()
+        squared_dev = (np.repeat(avg_amount, n) - amounts) ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            amount_std = np.sqrt(self._segment_sums(squared_dev, bounds) / np.where(n > 1, n - 1, np.nan))
+        
+        laps.split('basic_stats')
+        # Velocity features
+        time_diffs = grouped['createdAt'].diff().dt.total_seconds()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_time_between = np.where(
+                n > 1, self._segment_sums(time_diffs.fillna(0).to_numpy(), bounds) / (n - 1), np.nan
+            )
+        min_time_between = time_diffs.groupby(codes).min().to_numpy()
+        
+        times = self._to_epoch_ms(user_rows['createdAt'])
+        high_velocity = {
+            window: self._high_velocity_periods(times, bounds, window)
+            for window in [self.thresholds['high_velocity_window']] + list(self.thresholds['velocity_windows'])
+        }
+        
+        laps.split('velocity')
+        # Amount patterns
+        round_ratio = (
+            user_rows['amount'] % self.thresholds['round_amount_threshold'] == 0
+        ).groupby(codes).mean().to_numpy()
+        large_count = (
+            user_rows['amount'] >= self.thresholds['large_amount_threshold']
+        ).groupby(codes).sum().to_numpy()
+        
+        laps.split('amount_patterns')
+        # Off-hours activity
+        hours = user_rows['createdAt'].dt.hour
+        off_hours_ratio = (
+            (hours >= self.thresholds['off_hours_start']) |
+            (hours < self.thresholds['off_hours_end'])
+        ).groupby(codes).mean().to_numpy()
+        
+        laps.split('off_hours')
+        # Transaction type diversity
+        unique_types = grouped['type'].nunique().reindex(range(len(user_ids)), fill_value=0).to_numpy()
+        type_entropy = self._calculate_grouped_entropy(user_rows)
+        
+        laps.split('type_entropy')
+        # Network features
+        senders = user_rows[['user_code', 'senderId']].dropna().drop_duplicates()
+        receivers = user_rows[['user_code', 'receiverId']].dropna().drop_duplicates()
+        counterparties = pd.concat([
+            senders.rename(columns={'senderId': 'counterparty'}),
+            receivers.rename(columns={'receiverId': 'counterparty'}),
+        ]).drop_duplicates()
+        unique_counterparties = np.bincount(counterparties['user_code'], minlength=len(user_ids)) - 1
+        both_sides = senders.merge(
+            receivers, left_on=['user_code', 'senderId'], right_on=['user_code', 'receiverId']
+        )
+        circular = np.bincount(both_sides['user_code'], minlength=len(user_ids)) > 1
+        
+        laps.split('network')
+        # Amount outliers
+        row_std = np.repeat(amount_std, n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_scores = np.abs((amounts - np.repeat(avg_amount, n)) / row_std)
+        amount_outliers = pd.Series((row_std > 0) & (z_scores > 3)).groupby(codes).sum().to_numpy()
+        
+        laps.split('amount_outliers')
+        columns = {
+            'transaction_count': n,
+            'total_amount': total_amount,
+            'avg_amount': avg_amount,
+            'median_amount': median_amount,
+            'amount_std': amount_std,
+            'avg_time_between_txns': avg_time_between,
+            'min_time_between_txns': min_time_between,
+            'high_velocity_periods': high_velocity[self.thresholds['high_velocity_window']],
+            'round_amount_ratio': round_ratio,
+            'large_transaction_count': large_count,
+            'off_hours_ratio': off_hours_ratio,
+            'unique_transaction_types': unique_types,
+            'transaction_type_entropy': type_entropy.reindex(range(len(user_ids)), fill_value=0).to_numpy(),
+            'unique_counterparties': unique_counterparties,
+            'circular_transactions': circular,
+            'amount_outliers': np.where(amount_std > 0, amount_outliers, 0),
+        }
+        for window in self.thresholds['velocity_windows']:
+            columns[f'high_velocity_periods_{window}s'] = high_velocity[window]
+        
+        self.instrumentation.count('users', len(user_ids))
+        self.instrumentation.count('user_rows', len(user_rows))
+        
+        return user_ids, columns
+    
+    def calculate_cycle_features(self, df: pd.DataFrame) -> Dict[str, Dict]:
+        """Find time-ordered transaction loops and return cycle features for the users on them"""
+        with self.instrumentation.stage('cycle_detection'):
+            graph = TransactionGraph.from_dataframe(df)
+            return graph.user_cycle_features(
+                max_length=self.thresholds['cycle_max_length'],
+                window=self.thresholds['cycle_window']
+            )
+    
+    def _cycle_features(self, cycle_features: Dict[str, Dict], user_id: str) -> Dict:
+        """Cycle features for one user, zero when they are on no loop"""
+        return cycle_features.get(user_id, {'cycle_count': 0, 'cycle_volume': 0})
+    
+    def _explode_user_rows(self, df: pd.DataFrame, users: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Expand each transaction into one row per involved user, grouped by user in time order"""
+        df = df.reset_index(drop=True)
+        positions = np.arange(len(df))
+        
+        pairs = pd.concat([
+            pd.DataFrame({'user_id': df[col], 'row': positions})
+            for col in ['senderId', 'receiverId', 'owner'] if col in df.columns
+        ]).dropna(subset=['user_id']).drop_duplicates()
+        if users is not None:
+            pairs = pairs[pairs['user_id'].isin(list(users))]
+        pairs = pairs.sort_values(['user_id', 'row'], kind='stable')
+        
+        user_rows = df.iloc[pairs['row'].to_numpy()].reset_index(drop=True)
+        user_rows.insert(0, 'user_id', pairs['user_id'].to_numpy())
+        return user_rows
+    
+    def _segment_sums(self, values: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+        """Sum each contiguous segment with np.sum so results are bit-identical to per-user sums"""
+        return np.array([values[start:end].sum() for start, end in zip(bounds[:-1], bounds[1:])])
+    
+    def _to_epoch_ms(self, timestamps: pd.Series) -> np.ndarray:
+        """Convert a datetime column to int64 milliseconds since the epoch"""
+        return timestamps.to_numpy().astype('datetime64[ms]').astype(np.int64)
+    
+    def _velocity_window_counts(self, times: np.ndarray, bounds: np.ndarray, window: int) -> np.ndarray:
+        """Count, for every row, the same-user transactions in [t, t + window seconds]
+        
+        `times` holds int64 ms sorted within each user segment [bounds[i], bounds[i + 1]).
+        All segments are searched at once by offsetting each one into its own key range.
+        """
+        window_ms = int(window) * 1000
+        sizes = np.diff(bounds)
+        rebased = times - times.min()
+        stride = int(rebased.max()) + window_ms + 1
+        
+        if len(sizes) * stride >= 2 ** 62:
+            # Key space would overflow int64, fall back to one search per segment
+            counts = np.empty(len(times), dtype=np.int64)
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                segment = times[start:end]
+                counts[start:end] = (
+                    np.searchsorted(segment, segment + window_ms, side='right') -
+                    np.searchsorted(segment, segment, side='left')
+                )
+            return counts
+        
+        keys = np.repeat(np.arange(len(sizes), dtype=np.int64) * stride, sizes) + rebased
+        return (
+            np.searchsorted(keys, keys + window_ms, side='right') -
+            np.searchsorted(keys, keys, side='left')
+        )
+    
+    def _high_velocity_periods(self, times: np.ndarray, bounds: np.ndarray, window: int) -> np.ndarray:
+        """Per segment, count transactions that start a window holding at least high_velocity_count transactions"""
+        rapid = self._velocity_window_counts(times, bounds, window) >= self.thresholds['high_velocity_count']
+        # The last transaction of each user never starts a window
+        rapid[bounds[1:] - 1] = False
+        return np.add.reduceat(rapid.astype(np.int64), bounds[:-1])
+    
+    def _calculate_grouped_entropy(self, user_rows: pd.DataFrame) -> pd.Series:
+        """Calculate transaction type entropy for every user at once"""
+        type_counts = user_rows.groupby(['user_code', 'type'], sort=False, observed=True).size()
+        # Match value_counts() ordering so the summation order is identical
+        type_counts = type_counts.reset_index(name='count').sort_values(
+            ['user_code', 'count'], ascending=[True, False], kind='stable'
+        )
+        
+        totals = type_counts.groupby('user_code', sort=False)['count'].transform('sum')
+        probs = type_counts['count'] / totals
+        type_counts['term'] = probs * np.log2(probs)
+        
+        grouped = type_counts.groupby('user_code', sort=False)['term']
+        entropy = -grouped.agg(lambda terms: np.sum(terms.to_numpy()))
+        return entropy[grouped.size() > 1]
+    
     def _calculate_entropy(self, value_counts):
         """Calculate entropy of a distribution"""
         if len(value_counts) <= 1:
@@ -112,81 +387,235 @@ class FraudDetectionModel:
         return -np.sum(probs * np.log2(probs))
     
     def calculate_fraud_score(self, features: Dict) -> Tuple[float, Dict]:
-        """Calculate fraud score based on features"""
-        if features['transaction_count'] == 0:
-            return 0.0, {}
-        
-        score = 0.0
-        reasons = {}
-        
-        # High velocity scoring (0-25 points)
-        if features['high_velocity_periods'] > 0:
-            velocity_score = min(features['high_velocity_periods'] * 10, 25)
-            score += velocity_score
-            reasons['high_velocity'] = f"{features['high_velocity_periods']} rapid transaction periods"
-        
-        # Amount anomaly scoring (0-20 points)
-        if features['amount_outliers'] > 0:
-            outlier_score = min(features['amount_outliers'] * 5, 20)
-            score += outlier_score
-            reasons['amount_outliers'] = f"{features['amount_outliers']} transactions with unusual amounts"
-        
-        # Round amounts scoring (0-15 points)
-        if features['round_amount_ratio'] > 0.5:
-            round_score = features['round_amount_ratio'] * 15
-            score += round_score
-            reasons['round_amounts'] = f"{features['round_amount_ratio']:.1%} of amounts are round numbers"
-        
-        # Large transaction scoring (0-20 points)
-        if features['large_transaction_count'] > 0:
-            large_txn_ratio = features['large_transaction_count'] / features['transaction_count']
-            large_score = min(large_txn_ratio * 20, 20)
-            score += large_score
-            reasons['large_transactions'] = f"{features['large_transaction_count']} very large transactions"
-        
-        # Off-hours activity scoring (0-15 points)
-        if features['off_hours_ratio'] > 0.3:
-            off_hours_score = features['off_hours_ratio'] * 15
-            score += off_hours_score
-            reasons['off_hours'] = f"{features['off_hours_ratio']:.1%} of transactions during off hours"
-        
-        # Circular transaction scoring (0-10 points)
-        if features['circular_transactions']:
-            score += 10
-            reasons['circular_transactions'] = "Potential circular transaction patterns detected"
-        
-        # Low diversity scoring (0-5 points)
-        if features['transaction_count'] > 5 and features['unique_counterparties'] <= 2:
-            score += 5
-            reasons['low_diversity'] = f"Only {features['unique_counterparties']} unique counterparties"
-        
-        return min(score, 100.0), reasons
-    
-    def evaluate_transactions(self, transactions: List[Dict]) -> Dict:
-        """Main method to evaluate a list of transactions"""
-        df = self.prepare_data(transactions)
-        
-        # Get all unique users
-        all_users = set()
-        for col in ['senderId', 'receiverId', 'owner']:
-            if col in df.columns:
-                all_users.update(df[col].dropna().unique())
+        """Calculate fraud score based on features, using the 'users' rules"""
+        return self.rules['users'].score(features)
+    
+    def evaluate_transactions(self, transactions: List[Dict], workers: Optional[int] = None, columnar: bool = False):
+        """Main method to evaluate a list of transactions
+        
+        With columnar=True the users come back as a ResultTable (see evaluate_table).
+        """
+        if columnar and workers is not None and workers > 1:
+            raise ValueError('columnar results are scored in one process, drop workers')
+        with self.instrumentation.run():
+            with self.instrumentation.stage('prepare_data'):
+                df = self.prepare_data(transactions)
+            if columnar:
+                results = self.evaluate_table(df)
+            else:
+                results = self.evaluate_dataframe(df, workers=workers)
+        if columnar:
+            self._attach_instrumentation(results.extras)
+            return results
+        return self._attach_instrumentation(results)
+    
+    def evaluate_dataframe(self, df: pd.DataFrame, workers: Optional[int] = None) -> Dict:
+        """Evaluate transactions that are already in a prepared DataFrame
+        
+        With workers > 1, users are sharded across a process pool (see parallel_scoring).
+        When instrumentation is enabled the results also carry an 'instrumentation' report,
+        with collapse_gift_triples set they carry a 'gift_events' report, and with
+        cluster_accounts set they carry 'clusters' (see evaluate_clusters).
+        """
+        instrumentation = self.instrumentation
+        with instrumentation.run():
+            instrumentation.count('rows', len(df))
+            df, gift_report = self.collapse_gifts(df)
+            if workers is not None and workers > 1:
+                from parallel_scoring import evaluate_parallel
+                with instrumentation.stage('parallel_scoring'):
+                    results = evaluate_parallel(self, df, workers)
+            else:
+                if self.cache is not None:
+                    with instrumentation.stage('cached_scoring'):
+                        results = self._score_users_cached(df)
+                else:
+                    all_features = self.calculate_all_user_features(df)
+                    with instrumentation.stage('scoring'):
+                        results = self._score_users(all_features)
+                
+                # Overall transaction analysis
+                with instrumentation.stage('overall_features'):
+                    overall_features = self._calculate_overall_features(df)
+                results = self._build_results(results, overall_features)
+            if self.thresholds['cluster_accounts']:
+                results['clusters'] = self.evaluate_clusters(df, results['users'])
+            if gift_report is not None:
+                results['gift_events'] = gift_report
+        return self._attach_instrumentation(results)
+    
+    def evaluate_table(self, df: pd.DataFrame):
+        """Evaluate a prepared DataFrame into a columnar ResultTable (see result_table)
         
+        Scores equal evaluate_dataframe's; per-user dicts and reasons are only built on demand.
+        """
+        from result_table import evaluate_table
+        return evaluate_table(self, df)
+    
+    def evaluate_clusters(self, df: pd.DataFrame, user_results: Dict[str, Dict]) -> Dict[str, Dict]:
+        """Score clusters of accounts linked by shared funding or lockstep co-gifting (see account_clusters)
+        
+        Keyed by the cluster's root user ID; each carries its members and aggregated features.
+        """
+        from account_clusters import AccountClusters
+        with self.instrumentation.stage('account_clusters'):
+            clusters = AccountClusters(self.thresholds).update(df)
+            return clusters.cluster_results(user_results, self.rules)
+    
+    def update_clusters(self, df: pd.DataFrame):
+        """Add a batch of transactions to the model's incremental AccountClusters, returning it"""
+        from account_clusters import AccountClusters
+        if self.account_clusters is None:
+            self.account_clusters = AccountClusters(self.thresholds)
+        with self.instrumentation.stage('account_clusters'):
+            return self.account_clusters.update(df)
+    
+    def collapse_gifts(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, Optional[Dict]]:
+        """Fuse gift triples when collapse_gift_triples is set, returning the frame and a report (else None)"""
+        if not self.thresholds['collapse_gift_triples']:
+            return df, None
+        with self.instrumentation.stage('collapse_gifts'):
+            events, malformed = collapse_gift_triples(df)
+        gift_events = int((events['type'] == 'gift').sum())
+        self.instrumentation.count('gift_events', gift_events)
+        listed = malformed.head(MAX_REPORTED_MALFORMED)
+        listed = listed.assign(createdAt=self._to_epoch_ms(listed['createdAt'])).astype(object)
+        return events, {
+            'rows': len(df),
+            'normalized_rows': len(events),
+            'gift_events': gift_events,
+            'malformed_triples': len(malformed),
+            'malformed': listed.where(listed.notna(), None).to_dict('records'),
+        }
+    
+    def evaluate_livestreams(self, df: pd.DataFrame, by: str = 'livestreamId') -> Dict[str, Dict]:
+        """Score every livestream (or gift type with by='giftId') of a prepared DataFrame
+        
+        See livestream_analysis for the features; scores use the same risk levels as users.
+        """
+        from livestream_analysis import LivestreamAnalyzer
+        return LivestreamAnalyzer(self).evaluate_dataframe(df, by)
+    
+    def top_risk_users(self, df: pd.DataFrame, k: int = 10) -> List[Dict]:
+        """Full results of the k highest-scoring users only, highest first (see risk_feed)"""
+        from risk_feed import top_risk_users
+        return top_risk_users(self, df, k)
+    
+    def risk_changes(self, df: pd.DataFrame, snapshot_path: str) -> List[Dict]:
+        """Users whose risk level changed since the snapshot at snapshot_path, which is then replaced"""
+        from risk_feed import risk_changes
+        return risk_changes(self, df, snapshot_path)
+    
+    def index_transactions(self, df: pd.DataFrame):
+        """Build the time index that evaluate_window queries (see time_index)"""
+        from time_index import TimeIndex
+        with self.instrumentation.stage('time_index'):
+            self.time_index = TimeIndex(self, df)
+        return self.time_index
+    
+    def evaluate_window(self, t0=None, t1=None, users: Optional[Iterable[str]] = None) -> Dict:
+        """Evaluate the indexed transactions with t0 <= createdAt <= t1, optionally only for `users`
+        
+        Bounds are epoch milliseconds or anything pd.Timestamp accepts; None leaves that side open.
+        """
+        if self.time_index is None:
+            raise ValueError('no transactions are indexed, call index_transactions first')
+        return self.time_index.evaluate(t0, t1, users)
+    
+    def evaluate_overall_windows(self, df: pd.DataFrame, window_seconds: int = 3600, step_seconds: Optional[int] = None,
+                                 bucket_seconds: int = 60) -> Dict:
+        """Overall score of every rolling window, plus the worst window (see platform_metrics)
+        
+        Windows start every step_seconds (default: window_seconds) from the first bucket;
+        both must be multiples of bucket_seconds.
+        """
+        from platform_metrics import PlatformMetrics
+        df, _ = self.collapse_gifts(df)
+        with self.instrumentation.stage('platform_buckets'):
+            metrics = PlatformMetrics(self, df, bucket_seconds)
+        return metrics.evaluate(window_seconds, step_seconds)
+    
+    def _attach_instrumentation(self, results: Dict) -> Dict:
+        """Add the instrumentation report once the outermost run has finished"""
+        if self.instrumentation.enabled and self.instrumentation.depth == 0:
+            results['instrumentation'] = self.instrumentation.report()
+        return results
+    
+    def _score_users(self, all_features: Dict[str, Dict]) -> Dict[str, Dict]:
+        """Score every user's features in one pass over the rule table; reasons render on access"""
+        scored = {user_id: features for user_id, features in all_features.items() if features['transaction_count'] > 0}
+        group = self.rules['users']
+        scores, masks = group.score_table(list(scored.values()))
         results = {}
+        for (user_id, features), fraud_score, mask in zip(scored.items(), scores.tolist(), masks.tolist()):
+            results[user_id] = {
+                'fraud_score': fraud_score,
+                'risk_level': self._get_risk_level(fraud_score),
+                'reasons': group.reasons(features, mask),
+                'features': features
+            }
+        return results
+    
+    def _score_users_cached(self, df: pd.DataFrame) -> Dict[str, Dict]:
+        """Score every user, reusing cached results for users whose transactions are unchanged
         
-        for user_id in all_users:
-            features = self.calculate_user_features(df, user_id)
-            if features['transaction_count'] > 0:
-                fraud_score, reasons = self.calculate_fraud_score(features)
-                results[user_id] = {
-                    'fraud_score': fraud_score,
-                    'risk_level': self._get_risk_level(fraud_score),
-                    'reasons': reasons,
-                    'features': features
-                }
-        
-        # Overall transaction analysis
-        overall_features = self._calculate_overall_features(df)
+        Results are shallow copies of the cache entries (features and reasons included), so callers
+        may edit them without corrupting later cache hits.
+        """
+        # Rows are hashed once, before being repeated for each user they involve
+        user_rows = self._explode_user_rows(df.assign(_row_hash=self._row_hashes(df)))
+        if len(user_rows) == 0:
+            return {}
+        cycle_features = self.calculate_cycle_features(df) if self.thresholds['cycle_max_length'] else None
+        
+        codes, user_ids = pd.factorize(user_rows['user_id'])
+        keys = list(zip(user_ids, self._user_fingerprints(user_rows, codes, len(user_ids), cycle_features)))
+        cached = {}
+        for user_id, key in zip(user_ids, keys):
+            entry = self.cache.get(key)
+            if entry is not None:
+                cached[user_id] = entry
+        
+        computed = {}
+        if len(cached) < len(user_ids):
+            stale = ~user_ids.isin(list(cached))
+            computed = self._score_users(self._features_from_user_rows(
+                user_rows[stale[codes]].reset_index(drop=True), cycle_features
+            ))
+            for i in np.flatnonzero(stale):
+                self.cache.put(keys[i], computed[user_ids[i]])
+        
+        return {
+            user_id: _copy_result(cached[user_id] if user_id in cached else computed[user_id])
+            for user_id in user_ids
+        }
+    
+    def _row_hashes(self, df: pd.DataFrame) -> np.ndarray:
+        """64-bit hash of the feature inputs of every transaction"""
+        columns = {col: df[col] for col in FINGERPRINT_COLUMNS if col in df.columns}
+        columns['createdAt'] = self._to_epoch_ms(df['createdAt'])
+        return pd.util.hash_pandas_object(pd.DataFrame(columns), index=False).to_numpy()
+    
+    def _user_fingerprints(self, user_rows: pd.DataFrame, codes: np.ndarray, n_users: int,
+                           cycle_features: Optional[Dict[str, Dict]] = None) -> List[bytes]:
+        """Digest of each user's row hashes (independent of row order), the thresholds and the rules"""
+        row_hashes = user_rows['_row_hash'].to_numpy()
+        row_hashes = row_hashes[np.lexsort((row_hashes, codes))]
+        bounds = np.append(0, np.cumsum(np.bincount(codes, minlength=n_users)))
+        
+        settings = json.dumps([self.thresholds, self.rules.spec], sort_keys=True).encode()
+        user_ids = user_rows['user_id'].to_numpy()[bounds[:-1]]
+        fingerprints = []
+        for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            digest = hashlib.blake2b(settings, digest_size=16)
+            digest.update(row_hashes[start:end].tobytes())
+            if cycle_features is not None:
+                digest.update(repr(sorted(self._cycle_features(cycle_features, user_ids[i]).items())).encode())
+            fingerprints.append(digest.digest())
+        return fingerprints
+    
+    def _build_results(self, results: Dict[str, Dict], overall_features: Dict) -> Dict:
+        """Score the overall features and assemble the result structure"""
         overall_score, overall_reasons = self._calculate_overall_score(overall_features)
         
         return {
@@ -201,53 +630,80 @@ class FraudDetectionModel:
     
     def _calculate_overall_features(self, df: pd.DataFrame) -> Dict:
         """Calculate features for the entire transaction set"""
+        return self._overall_features_from_partial(self._overall_partial(df))
+    
+    def _overall_partial(self, df: pd.DataFrame) -> Dict:
+        """Mergeable aggregates behind the overall features
+        
+        Partials of disjoint row sets can be combined with _merge_overall_partials,
+        provided every sender's rows fall in the same set.
+        """
+        user_volumes = df.groupby('senderId', observed=True)['amount'].sum()
+        return {
+            'total_transactions': len(df),
+            'users': set(df['senderId'].dropna()).union(set(df['receiverId'].dropna())),
+            'total_volume': df['amount'].sum(),
+            'first_created': df['createdAt'].min() if len(df) else None,
+            'last_created': df['createdAt'].max() if len(df) else None,
+            'sender_count': len(user_volumes),
+            'max_sender_volume': user_volumes.max() if len(user_volumes) else 0,
+            'sender_volume_total': user_volumes.sum(),
+        }
+    
+    def _merge_overall_partials(self, partials: List[Dict]) -> Dict:
+        """Combine overall partial aggregates from disjoint row sets"""
+        firsts = [p['first_created'] for p in partials if p['first_created'] is not None]
+        lasts = [p['last_created'] for p in partials if p['last_created'] is not None]
+        return {
+            'total_transactions': sum(p['total_transactions'] for p in partials),
+            'users': set().union(*(p['users'] for p in partials)),
+            'total_volume': sum(p['total_volume'] for p in partials),
+            'first_created': min(firsts) if firsts else None,
+            'last_created': max(lasts) if lasts else None,
+            'sender_count': sum(p['sender_count'] for p in partials),
+            'max_sender_volume': max(p['max_sender_volume'] for p in partials),
+            'sender_volume_total': sum(p['sender_volume_total'] for p in partials),
+        }
+    
+    def _overall_features_from_partial(self, partial: Dict) -> Dict:
+        """Finalize overall features from (possibly merged) partial aggregates"""
         features = {}
         
-        features['total_transactions'] = len(df)
-        features['unique_users'] = len(set(df['senderId'].dropna()).union(set(df['receiverId'].dropna())))
-        features['total_volume'] = df['amount'].sum()
-        features['avg_transaction_size'] = df['amount'].mean()
+        features['total_transactions'] = partial['total_transactions']
+        features['unique_users'] = len(partial['users'])
+        features['total_volume'] = partial['total_volume']
+        features['avg_transaction_size'] = (
+            partial['total_volume'] / partial['total_transactions'] if partial['total_transactions'] else np.nan
+        )
         
         # Time span analysis
-        time_span = (df['createdAt'].max() - df['createdAt'].min()).total_seconds()
+        time_span = (
+            (partial['last_created'] - partial['first_created']).total_seconds()
+            if partial['first_created'] is not None else 0.0
+        )
         features['time_span_hours'] = time_span / 3600
-        features['transaction_rate'] = len(df) / max(time_span / 3600, 0.01)  # per hour
+        features['transaction_rate'] = partial['total_transactions'] / max(time_span / 3600, 0.01)  # per hour
         
         # Concentration analysis
-        user_volumes = df.groupby('senderId')['amount'].sum()
-        features['volume_concentration'] = (user_volumes.max() / user_volumes.sum()) if len(user_volumes) > 0 else 0
+        features['volume_concentration'] = (
+            partial['max_sender_volume'] / partial['sender_volume_total']
+        ) if partial['sender_count'] > 0 else 0
         
         return features
     
     def _calculate_overall_score(self, features: Dict) -> Tuple[float, Dict]:
-        """Calculate overall fraud score for the transaction set"""
-        score = 0.0
-        reasons = {}
-        
-        # High transaction rate
-        if features['transaction_rate'] > 10:  # More than 10 transactions per hour
-            rate_score = min((features['transaction_rate'] - 10) * 2, 20)
-            score += rate_score
-            reasons['high_rate'] = f"High transaction rate: {features['transaction_rate']:.1f} per hour"
-        
-        # Volume concentration
-        if features['volume_concentration'] > 0.8:
-            conc_score = features['volume_concentration'] * 15
-            score += conc_score
-            reasons['concentration'] = f"High volume concentration: {features['volume_concentration']:.1%}"
-        
-        return min(score, 100.0), reasons
+        """Calculate overall fraud score for the transaction set, using the 'overall' rules"""
+        return self.rules['overall'].score(features)
     
     def _get_risk_level(self, score: float) -> str:
         """Convert numeric score to risk level"""
-        if score >= 70:
-            return "HIGH"
-        elif score >= 40:
-            return "MEDIUM"
-        elif score >= 20:
-            return "LOW"
-        else:
-            return "MINIMAL"
+        return risk_level(score)
+
+def _copy_result(result: Dict) -> Dict:
+    """Shallow copy of a cached user result; LazyReasons are read-only and stay shared"""
+    reasons = result['reasons']
+    return {**result, 'features': dict(result['features']),
+            'reasons': dict(reasons) if isinstance(reasons, dict) else reasons}
 
 # Example usage
 def analyze_transactions(transactions_json):
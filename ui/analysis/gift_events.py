@@ -0,0 +1,132 @@
+"""Fuse fee / gift-receive / gift-give triples into single gift events
+
+transactions.sendGift writes three rows per gift, all sharing giftId,
+livestreamId, senderId and createdAt:
+
+    fee            sender -> admin      fee share of the price
+    gift-receive   sender -> streamer   price minus the fee
+    gift-give      sender -> streamer   full price
+
+Scoring the raw rows counts every gift three times towards the sender's and
+the streamer's transaction_count, velocity windows and amount ratios. With
+collapse_gift_triples each complete triple becomes one row of type 'gift'
+(the gift-give row, so its _id, owner and receiverId are kept) carrying:
+
+    amount          gross price (the gift-give amount)
+    creator_amount  the gift-receive amount
+    fee_amount      the fee amount
+
+Top-ups and cash-outs pass through unchanged, with zero creator and fee
+amounts. A triple is malformed when a member is missing or duplicated, when
+fee + gift-receive differs from gift-give by more than `tolerance` units, or
+when gift-receive and gift-give name different receivers. Malformed triples
+are not fused; their rows pass through unchanged and are listed in the
+returned report.
+
+FraudDetectionModel applies this before scoring when its
+'collapse_gift_triples' threshold is set.
+"""
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+GIFT_TYPES = ('fee', 'gift-receive', 'gift-give')
+TRIPLE_KEYS = ['giftId', 'livestreamId', 'senderId', 'createdAt']
+EVENT_TYPE = 'gift'
+
+
+def collapse_gift_triples(df: pd.DataFrame, tolerance: int = 1) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Fuse each complete triple into one gift event
+
+    Returns the normalized frame (row order preserved) and one report row per
+    malformed triple: its key columns, the fee / gift-receive / gift-give row
+    counts and the reason.
+    """
+    slot = np.full(len(df), -1, dtype=np.int64)
+    for i, gift_type in enumerate(GIFT_TYPES):
+        slot[(df['type'] == gift_type).to_numpy()] = i
+    gift_rows = np.flatnonzero(slot >= 0)
+    keys = [col for col in TRIPLE_KEYS if col in df.columns]
+    if len(gift_rows) == 0:
+        return _with_event_columns(df, np.zeros(len(df), dtype=bool), 0, 0), _report(df, keys, [], [], [])
+
+    group, n_groups = _group_ids(df, gift_rows, keys)
+    counts = np.bincount(group * 3 + slot[gift_rows], minlength=3 * n_groups).reshape(n_groups, 3)
+    complete = (counts == 1).all(axis=1)
+
+    # Row of each member; only meaningful for complete triples
+    members = np.zeros((n_groups, 3), dtype=np.int64)
+    members[group, slot[gift_rows]] = gift_rows
+    amounts = df['amount'].to_numpy()
+    fee, receive, give = (amounts[members[:, i]] for i in range(3))
+    split_ok = np.abs(fee + receive - give) <= tolerance
+    receivers = pd.factorize(df['receiverId'])[0] if 'receiverId' in df.columns else np.zeros(len(df), dtype=np.int64)
+    receiver_ok = receivers[members[:, 1]] == receivers[members[:, 2]]
+    fused = complete & split_ok & receiver_ok
+
+    # Keep non-gift rows, every row of a malformed triple and the gift-give row of each fused one
+    keep = np.ones(len(df), dtype=bool)
+    keep[gift_rows] = ~fused[group]
+    event_rows = members[fused, 2]
+    keep[event_rows] = True
+    is_event = np.zeros(len(df), dtype=bool)
+    is_event[event_rows] = True
+    creator_amount = np.zeros(len(df), dtype=amounts.dtype)
+    creator_amount[event_rows] = receive[fused]
+    fee_amount = np.zeros(len(df), dtype=amounts.dtype)
+    fee_amount[event_rows] = fee[fused]
+    events = _with_event_columns(df, is_event, creator_amount, fee_amount)[keep]
+
+    bad = np.flatnonzero(~fused)
+    first_rows = np.full(n_groups, len(df), dtype=np.int64)
+    np.minimum.at(first_rows, group, gift_rows)
+    reasons = [_malformed_reason(counts[g], complete[g], split_ok[g], receiver_ok[g]) for g in bad]
+    return events, _report(df, keys, first_rows[bad], counts[bad], reasons)
+
+
+def _group_ids(df: pd.DataFrame, rows: np.ndarray, keys: List[str]) -> Tuple[np.ndarray, int]:
+    """Dense group number of each selected row by its key columns (a lexsort over codes beats a multi-key groupby)"""
+    columns = []
+    for col in keys:
+        if col == 'createdAt':
+            columns.append(df[col].to_numpy().astype('datetime64[ms]').astype(np.int64)[rows])
+        else:
+            columns.append(pd.factorize(df[col])[0][rows])
+    order = np.lexsort(columns[::-1])
+    changed = np.zeros(len(rows), dtype=bool)
+    changed[0] = True
+    for column in columns:
+        changed[1:] |= column[order][1:] != column[order][:-1]
+    group = np.empty(len(rows), dtype=np.int64)
+    group[order] = np.cumsum(changed) - 1
+    return group, int(changed.sum())
+
+
+def _with_event_columns(df: pd.DataFrame, is_event: np.ndarray, creator_amount, fee_amount) -> pd.DataFrame:
+    """Copy of df with the event rows retyped and the creator / fee amount columns added"""
+    df = df.assign(creator_amount=creator_amount, fee_amount=fee_amount)
+    types = df['type']
+    if isinstance(types.dtype, pd.CategoricalDtype) and EVENT_TYPE not in types.cat.categories:
+        types = types.cat.add_categories([EVENT_TYPE])
+    df['type'] = types.where(~is_event, EVENT_TYPE)
+    return df
+
+
+def _malformed_reason(counts: np.ndarray, complete: bool, split_ok: bool, receiver_ok: bool) -> str:
+    if not complete:
+        problems = [f"missing {t}" for t, c in zip(GIFT_TYPES, counts) if c == 0]
+        problems += [f"{c} {t} rows" for t, c in zip(GIFT_TYPES, counts) if c > 1]
+        return ', '.join(problems)
+    if not split_ok:
+        return 'fee + gift-receive does not add up to gift-give'
+    return 'gift-receive and gift-give have different receivers'
+
+
+def _report(df: pd.DataFrame, keys: List[str], rows, counts, reasons: List[str]) -> pd.DataFrame:
+    report = df.iloc[np.asarray(rows, dtype=np.int64)][keys].reset_index(drop=True)
+    counts = np.asarray(counts, dtype=np.int64).reshape(-1, 3)
+    for i, name in enumerate(['fee_rows', 'receive_rows', 'give_rows']):
+        report[name] = counts[:, i]
+    report['reason'] = reasons
+    return report
@@ -0,0 +1,266 @@
+"""Stage timers, counters and optional profiling for the fraud pipeline
+
+Instrumentation is off unless a model is given an Instrumentation instance or
+the FRAUD_INSTRUMENT environment variable is set. It takes comma separated
+options:
+
+    FRAUD_INSTRUMENT=1                 stage timers, counters and RSS samples
+    FRAUD_INSTRUMENT=memory            + tracemalloc peak of each run
+    FRAUD_INSTRUMENT=cprofile          + cProfile top functions
+    FRAUD_INSTRUMENT=sample            + sampling profiler (stack sampled every 5 ms)
+
+When enabled, evaluate_transactions / evaluate_dataframe add an
+'instrumentation' report next to 'users' and 'overall'. When disabled the
+model holds NULL_INSTRUMENTATION, whose hooks are no-ops that allocate nothing.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+ENV_VAR = 'FRAUD_INSTRUMENT'
+PROFILERS = ('cprofile', 'sample')
+
+_NULL_CONTEXT = nullcontext()
+
+
+def _current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes, where /proc is available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _peak_rss() -> Optional[int]:
+    """Lifetime peak RSS of this process in bytes, where the resource module is available (Unix)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _Laps:
+    """Splits one stage into consecutive named sections"""
+    __slots__ = ('instrumentation', 'prefix', 'last')
+
+    def __init__(self, instrumentation: 'Instrumentation', prefix: str):
+        self.instrumentation = instrumentation
+        self.prefix = prefix
+        self.last = time.perf_counter()
+
+    def split(self, name: str):
+        """Record the time since the previous split (or creation) as `<prefix>.<name>`"""
+        now = time.perf_counter()
+        self.instrumentation._record(f"{self.prefix}.{name}", now - self.last)
+        self.last = now
+
+
+class _NullLaps:
+    __slots__ = ()
+
+    def split(self, name: str):
+        pass
+
+
+_NULL_LAPS = _NullLaps()
+
+
+class _StackSampler(threading.Thread):
+    """Samples the innermost frames of one thread at a fixed interval"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005, depth: int = 3):
+        super().__init__(daemon=True, name='stack-sampler')
+        self.thread_id = thread_id
+        self.interval = interval
+        self.depth = depth
+        self.samples = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[' <- '.join(stack)] += 1
+
+    def top(self, limit: int) -> List[Dict]:
+        total = sum(self.samples.values()) or 1
+        return [
+            {'stack': stack, 'samples': count, 'fraction': count / total}
+            for stack, count in self.samples.most_common(limit)
+        ]
+
+
+class Instrumentation:
+    """Collects per-stage timings, counters and memory samples for pipeline runs"""
+
+    enabled = True
+
+    def __init__(self, trace_memory: bool = False, profiler: Optional[str] = None,
+                 sample_interval: float = 0.005, profile_limit: int = 30):
+        if profiler is not None and profiler not in PROFILERS:
+            raise ValueError(f"unknown profiler {profiler!r}, expected one of {PROFILERS}")
+        self.trace_memory = trace_memory
+        self.profiler = profiler
+        self.sample_interval = sample_interval
+        self.profile_limit = profile_limit
+        self.depth = 0
+        self.reset()
+
+    @classmethod
+    def from_env(cls, value: Optional[str] = None):
+        """Instrumentation configured by FRAUD_INSTRUMENT, or NULL_INSTRUMENTATION when it is unset"""
+        value = os.environ.get(ENV_VAR, '') if value is None else value
+        options = {option.strip().lower() for option in value.split(',') if option.strip()}
+        if not options or options <= {'0', 'false', 'off'}:
+            return NULL_INSTRUMENTATION
+        profiler = next((p for p in PROFILERS if p in options), None)
+        return cls(trace_memory='memory' in options, profiler=profiler)
+
+    def reset(self):
+        self.timings: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.rss: Dict[str, int] = {}
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.profile: Optional[List[Dict]] = None
+        self.traced_peak: Optional[int] = None
+        self.wall_seconds = 0.0
+
+    @contextmanager
+    def run(self):
+        """Wrap one pipeline run; only the outermost run resets state and drives the profilers"""
+        self.depth += 1
+        if self.depth > 1:
+            try:
+                yield self
+            finally:
+                self.depth -= 1
+            return
+
+        self.reset()
+        started_tracing = False
+        if self.trace_memory:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+                started_tracing = True
+        profile = sampler = None
+        if self.profiler == 'cprofile':
+            profile = cProfile.Profile()
+            profile.enable()
+        elif self.profiler == 'sample':
+            sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+            sampler.start()
+
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.wall_seconds = time.perf_counter() - start
+            self.depth -= 1
+            if profile is not None:
+                profile.disable()
+                self.profile = self._cprofile_top(profile)
+            if sampler is not None:
+                sampler.stopped.set()
+                sampler.join()
+                self.profile = sampler.top(self.profile_limit)
+            if self.trace_memory:
+                self.traced_peak = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block and sample RSS when it ends"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - start)
+            rss = _current_rss()
+            if rss is not None:
+                self.rss[name] = max(self.rss.get(name, 0), rss)
+
+    def laps(self, prefix: str) -> _Laps:
+        """Lap timer for consecutive sections of a stage"""
+        return _Laps(self, prefix)
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] += int(value)
+
+    def report(self) -> Dict:
+        """Structured summary of the last run"""
+        stages = {}
+        for name, seconds in self.timings.items():
+            stages[name] = {'seconds': seconds, 'calls': self.calls[name]}
+            if name in self.rss:
+                stages[name]['rss_bytes'] = self.rss[name]
+        report = {
+            'wall_seconds': self.wall_seconds,
+            'stages': stages,
+            'counters': dict(self.counters),
+            'peak_rss_bytes': _peak_rss(),
+        }
+        if self.traced_peak is not None:
+            report['tracemalloc_peak_bytes'] = self.traced_peak
+        if self.profile is not None:
+            report['profile'] = {'profiler': self.profiler, 'top': self.profile}
+        return report
+
+    def _record(self, name: str, seconds: float):
+        self.timings[name] += seconds
+        self.calls[name] += 1
+
+    def _cprofile_top(self, profile: cProfile.Profile) -> List[Dict]:
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        rows = []
+        for (filename, line, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                'function': f"{function} ({os.path.basename(filename)}:{line})",
+                'calls': ncalls,
+                'tottime': tottime,
+                'cumtime': cumtime,
+            })
+        rows.sort(key=lambda row: row['cumtime'], reverse=True)
+        return rows[:self.profile_limit]
+
+
+class _NullInstrumentation:
+    """Disabled instrumentation: every hook is a no-op"""
+
+    enabled = False
+
+    def run(self):
+        return _NULL_CONTEXT
+
+    def stage(self, name: str):
+        return _NULL_CONTEXT
+
+    def laps(self, prefix: str) -> _NullLaps:
+        return _NULL_LAPS
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def report(self) -> Dict:
+        return {}
+
+
+NULL_INSTRUMENTATION = _NullInstrumentation()
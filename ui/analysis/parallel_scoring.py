@@ -0,0 +1,132 @@
+"""Multi-process scoring of a prepared transaction frame, sharded by user
+
+The columns the feature engine needs are encoded once into numeric arrays
+(integer codes for IDs and types, int64 ms for createdAt) and copied into a
+single shared memory block. Workers map that block without copying, select
+the rows that involve their shard's users, and return per-user results plus
+mergeable overall aggregates for the rows whose sender belongs to the shard.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+ID_COLUMNS = ['senderId', 'receiverId', 'owner']
+
+# Per-worker state, set up once by _init_worker
+_worker = {}
+
+
+def evaluate_parallel(model, df: pd.DataFrame, workers: int, shards_per_worker: int = 4) -> Dict:
+    """Evaluate a prepared frame across `workers` processes, returning evaluate_dataframe's structure"""
+    id_columns = [col for col in ID_COLUMNS if col in df.columns]
+    id_codes, users = pd.factorize(pd.concat([df[col] for col in id_columns], ignore_index=True))
+    type_codes, types = pd.factorize(df['type'])
+
+    arrays = {
+        'amount': df['amount'].to_numpy(),
+        'createdAt': model._to_epoch_ms(df['createdAt']),
+        'type': type_codes.astype(np.int32),
+    }
+    for col in ID_COLUMNS:
+        if col in id_columns:
+            position = id_columns.index(col)
+            arrays[col] = id_codes[position * len(df):(position + 1) * len(df)].astype(np.int32)
+        else:
+            arrays[col] = np.full(len(df), -1, dtype=np.int32)
+
+    # Loops span shards, so the transaction graph is searched once up front
+    cycle_features = model.calculate_cycle_features(df) if model.thresholds['cycle_max_length'] else None
+
+    block, layout = _to_shared_memory(arrays)
+    try:
+        n_shards = workers * shards_per_worker
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(model, block.name, layout, list(users), list(types), cycle_features)
+        ) as pool:
+            shard_results = list(pool.map(_score_shard, range(n_shards), [n_shards] * n_shards))
+    finally:
+        block.close()
+        block.unlink()
+
+    results = {}
+    for shard_users, _ in shard_results:
+        results.update(shard_users)
+    overall_features = model._overall_features_from_partial(
+        model._merge_overall_partials([partial for _, partial in shard_results])
+    )
+    return model._build_results(results, overall_features)
+
+
+def _to_shared_memory(arrays: Dict[str, np.ndarray]) -> Tuple[shared_memory.SharedMemory, List]:
+    """Copy arrays into one shared memory block, returning it and the (name, dtype, offset, length) layout"""
+    layout = []
+    offset = 0
+    for name, values in arrays.items():
+        layout.append((name, values.dtype.str, offset, len(values)))
+        # Keep every column 8-byte aligned
+        offset += -(-values.nbytes // 8) * 8
+
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, dtype, start, length in layout:
+        np.ndarray(length, dtype=dtype, buffer=block.buf, offset=start)[:] = arrays[name]
+    return block, layout
+
+
+def _init_worker(model, block_name: str, layout: List, users: List, types: List,
+                 cycle_features: Optional[Dict[str, Dict]]):
+    block = shared_memory.SharedMemory(name=block_name)
+    _worker['block'] = block
+    _worker['model'] = model
+    _worker['arrays'] = {
+        name: np.ndarray(length, dtype=dtype, buffer=block.buf, offset=start)
+        for name, dtype, start, length in layout
+    }
+    _worker['users'] = pd.Index(users, dtype=object)
+    _worker['types'] = pd.Index(types, dtype=object)
+    _worker['cycle_features'] = cycle_features
+
+
+def _score_shard(shard: int, n_shards: int) -> Tuple[Dict, Dict]:
+    """Score the users whose code falls in `shard` and aggregate the rows they sent"""
+    model = _worker['model']
+    arrays = _worker['arrays']
+    users = _worker['users']
+
+    def in_shard(codes):
+        return (codes >= 0) & (codes % n_shards == shard)
+
+    rows = np.flatnonzero(in_shard(arrays['senderId']) | in_shard(arrays['receiverId']) | in_shard(arrays['owner']))
+    frame = _build_frame(rows)
+    shard_users = users[shard::n_shards]
+    results = model._score_users(model.calculate_all_user_features(
+        frame, users=shard_users, cycle_features=_worker['cycle_features']
+    ))
+
+    # Each row counts towards the overall aggregates of exactly one shard:
+    # its sender's, falling back to its receiver's and then its owner's
+    home = np.where(arrays['senderId'] >= 0, arrays['senderId'],
+                    np.where(arrays['receiverId'] >= 0, arrays['receiverId'], arrays['owner']))
+    home_rows = (home >= 0) & (home % n_shards == shard)
+    if shard == 0:
+        home_rows |= home < 0
+    partial = model._overall_partial(_build_frame(np.flatnonzero(home_rows)))
+
+    return results, partial
+
+
+def _build_frame(rows: np.ndarray) -> pd.DataFrame:
+    """Materialize the selected rows as a prepared DataFrame"""
+    arrays = _worker['arrays']
+    frame = pd.DataFrame({
+        'amount': arrays['amount'][rows],
+        'createdAt': arrays['createdAt'][rows].view('datetime64[ms]'),
+        'type': pd.Categorical.from_codes(arrays['type'][rows], categories=_worker['types']),
+    })
+    for col in ID_COLUMNS:
+        frame[col] = pd.Categorical.from_codes(arrays[col][rows], categories=_worker['users'])
+    return frame
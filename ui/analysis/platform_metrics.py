@@ -0,0 +1,154 @@
+"""Time-bucketed platform metrics and per-window overall scores
+
+_calculate_overall_features reports one transaction_rate and
+volume_concentration over the whole span, so a 10-minute spike disappears
+into a quiet day. PlatformMetrics bins the transactions once into fixed,
+clock-aligned buckets (1 minute by default) and keeps:
+
+- per bucket: transaction count, volume and sender volume
+- per (sender, bucket): the sender's volume
+- per (user, bucket): whether the user sent or received anything
+
+Windows of any multiple of the bucket length are assembled from the bins:
+counts and volumes from prefix sums, the top sender's volume and the
+distinct users from the sparse per-bucket entries. Rolling windows (step
+shorter than the window) are split into window / step interleaved tilings,
+each one a single pass over the sparse entries. Every window gets the
+overall features, with transaction_rate over the window length, and is
+scored with the 'overall' rules, giving a rate / concentration time series
+and the worst window to alert on.
+
+    metrics = model.evaluate_overall_windows(df, window_seconds=600, step_seconds=60)
+    metrics['worst']['fraud_score'], metrics['worst']['start']
+"""
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+ID_COLUMNS = ['senderId', 'receiverId']
+
+
+class PlatformMetrics:
+    """Per-bucket aggregates of a prepared DataFrame"""
+
+    def __init__(self, model, df: pd.DataFrame, bucket_seconds: int = 60):
+        self.model = model
+        self.bucket_ms = int(bucket_seconds) * 1000
+        absolute = model._to_epoch_ms(df['createdAt']) // self.bucket_ms
+        self.first_bucket = int(absolute.min()) if len(absolute) else 0
+        buckets = absolute - self.first_bucket
+        self.n_buckets = int(buckets.max()) + 1 if len(buckets) else 0
+        amounts = df['amount'].to_numpy(dtype=np.float64)
+
+        user_codes, _ = pd.factorize(pd.concat([df[col] for col in ID_COLUMNS], ignore_index=True))
+        senders = user_codes[:len(df)]
+        has_sender = senders >= 0
+        self.counts = np.bincount(buckets, minlength=self.n_buckets)
+        self.volumes = np.bincount(buckets, weights=amounts, minlength=self.n_buckets)
+        self.sender_rows = np.bincount(buckets[has_sender], minlength=self.n_buckets)
+        self.sender_volumes = np.bincount(buckets[has_sender], weights=amounts[has_sender], minlength=self.n_buckets)
+
+        self.sender_entries = self._entries(senders[has_sender], buckets[has_sender], amounts[has_sender])
+        both_buckets = np.concatenate([buckets, buckets])
+        present = user_codes >= 0
+        self.user_entries = self._entries(user_codes[present], both_buckets[present], np.ones(int(present.sum())))
+
+    def windows(self, window_seconds: int, step_seconds: int = None) -> Dict[str, np.ndarray]:
+        """Overall features of every window starting at a multiple of `step_seconds` from the first bucket"""
+        step_seconds = window_seconds if step_seconds is None else step_seconds
+        if window_seconds * 1000 % self.bucket_ms or step_seconds * 1000 % self.bucket_ms:
+            raise ValueError('window and step must be multiples of the bucket length')
+        width = window_seconds * 1000 // self.bucket_ms
+        step = step_seconds * 1000 // self.bucket_ms
+        if step <= 0 or width % step:
+            raise ValueError('the window must be a positive multiple of the step')
+
+        starts = np.arange(0, self.n_buckets, step)
+        ends = np.minimum(starts + width, self.n_buckets)
+
+        def window_sums(values):
+            prefix = np.append(0, np.cumsum(values))
+            return prefix[ends] - prefix[starts]
+
+        total_transactions = window_sums(self.counts)
+        total_volume = window_sums(self.volumes)
+        sender_rows = window_sums(self.sender_rows)
+        sender_volume_total = window_sums(self.sender_volumes)
+        top_sender_volume = self._window_reduce(self.sender_entries, width, step, len(starts), 'max')
+        unique_users = self._window_reduce(self.user_entries, width, step, len(starts), 'count')
+
+        time_span_hours = width * self.bucket_ms / 3600000
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {
+                'start': (self.first_bucket + starts) * self.bucket_ms,
+                'end': (self.first_bucket + starts + width) * self.bucket_ms,
+                'total_transactions': total_transactions,
+                'unique_users': unique_users.astype(np.int64),
+                'total_volume': total_volume,
+                'avg_transaction_size': np.where(total_transactions > 0, total_volume / total_transactions, np.nan),
+                'time_span_hours': np.full(len(starts), time_span_hours),
+                'transaction_rate': total_transactions / max(time_span_hours, 0.01),
+                'volume_concentration': np.where(sender_rows > 0, top_sender_volume / sender_volume_total, 0.0),
+            }
+
+    def evaluate(self, window_seconds: int, step_seconds: int = None) -> Dict:
+        """Score every window with the 'overall' rules; returns the windows and the worst one"""
+        columns = self.windows(window_seconds, step_seconds)
+        n = len(columns['start'])
+        group = self.model.rules['overall']
+        with self.model.instrumentation.stage('overall_windows'):
+            scores, masks = group.score_columns(columns, n)
+        values = {name: column.tolist() for name, column in columns.items()}
+        names = [name for name in values if name not in ('start', 'end')]
+        windows = []
+        for i, (score, mask) in enumerate(zip(scores.tolist(), masks.tolist())):
+            features = {name: values[name][i] for name in names}
+            windows.append({
+                'start': values['start'][i],
+                'end': values['end'][i],
+                'fraud_score': score,
+                'risk_level': self.model._get_risk_level(score),
+                'reasons': group.reasons(features, mask),
+                'features': features
+            })
+        return {
+            'bucket_seconds': self.bucket_ms // 1000,
+            'window_seconds': window_seconds,
+            'step_seconds': window_seconds if step_seconds is None else step_seconds,
+            'windows': windows,
+            'worst': windows[int(np.argmax(scores))] if windows else None,
+        }
+
+    def _entries(self, entities: np.ndarray, buckets: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """(entity, bucket, summed value) per distinct pair, sorted by entity then bucket"""
+        keys = entities.astype(np.int64) * max(self.n_buckets, 1) + buckets
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        first = np.flatnonzero(np.append(True, keys[1:] != keys[:-1])) if len(keys) else np.zeros(0, dtype=np.int64)
+        sums = np.add.reduceat(values[order], first) if len(keys) else np.zeros(0)
+        return keys[first] // max(self.n_buckets, 1), keys[first] % max(self.n_buckets, 1), sums
+
+    def _window_reduce(self, entries: Tuple[np.ndarray, ...], width: int, step: int, n_windows: int,
+                       how: str) -> np.ndarray:
+        """Per window, the largest per-entity sum ('max') or the number of entities present ('count')"""
+        entities, buckets, values = entries
+        result = np.zeros(n_windows)
+        phases = width // step
+        for phase in range(phases):
+            # Windows phase, phase + phases, ... tile the buckets from phase * step on without overlap
+            shifted = buckets - phase * step
+            valid = shifted >= 0
+            if not valid.any():
+                continue
+            tile = shifted[valid] // width
+            entity = entities[valid]
+            # Still sorted by entity then tile, so each (entity, tile) run is contiguous
+            first = np.flatnonzero(np.append(True, (entity[1:] != entity[:-1]) | (tile[1:] != tile[:-1])))
+            window = phase + tile[first] * phases
+            keep = window < n_windows
+            if how == 'max':
+                np.maximum.at(result, window[keep], np.add.reduceat(values[valid], first)[keep])
+            else:
+                np.add.at(result, window[keep], 1)
+        return result
@@ -0,0 +1,219 @@
+"""Columnar evaluation results
+
+evaluate_dataframe returns one dict per user with a features dict of numpy
+scalars and rendered reasons, which at a few hundred thousand users costs
+more memory and serialization time than the scoring itself. A ResultTable
+keeps the same results as arrays, straight from the feature engine's
+columns (_feature_columns) and the rule table (RuleGroup.score_columns):
+
+- user_id, fraud_score, risk_level (codes into LEVEL_NAMES), reason_mask
+  (bit i set when rule i of the 'users' group fired)
+- one array per feature
+
+Nothing per user is built until asked for: row(i) and to_dict() give the
+legacy shape, with reasons rendered on access (LazyReasons). Numeric columns
+export to Arrow without copying (to_arrow / to_parquet, which need pyarrow),
+and to_npz / load_npz store the table in a plain .npz file.
+
+    table = model.evaluate_table(df)
+    table.to_parquet('results.parquet')
+    legacy = table.to_dict()
+"""
+import json
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from risk_feed import LEVEL_NAMES, _LEVEL_MINIMUMS
+from scoring_rules import RuleGroup
+
+FEATURE_PREFIX = 'feature.'
+
+
+class ResultTable:
+    """Per-user scores, risk levels, reason bitmasks and features as arrays"""
+
+    def __init__(self, user_ids, scores: np.ndarray, reason_masks: np.ndarray, features: Dict[str, np.ndarray],
+                 group: RuleGroup, overall: Dict, extras: Optional[Dict] = None):
+        self.user_ids = np.asarray(user_ids, dtype=object)
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.risk_codes = np.searchsorted(_LEVEL_MINIMUMS, self.scores, side='right').astype(np.int8)
+        self.reason_masks = np.asarray(reason_masks, dtype=np.int64)
+        self.features = features
+        self.group = group
+        self.overall = overall
+        # 'clusters', 'gift_events' and 'instrumentation', as evaluate_dataframe attaches them
+        self.extras = extras if extras is not None else {}
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    @property
+    def reason_names(self) -> List[str]:
+        """Rule names by reason_mask bit"""
+        return [rule.name for rule in self.group.rules]
+
+    def risk_levels(self) -> np.ndarray:
+        return np.array(LEVEL_NAMES, dtype=object)[self.risk_codes]
+
+    def row(self, i: int) -> Dict:
+        """One user's result in the evaluate_dataframe shape"""
+        features = {name: column[i].item() for name, column in self.features.items()}
+        return {
+            'fraud_score': float(self.scores[i]),
+            'risk_level': LEVEL_NAMES[self.risk_codes[i]],
+            'reasons': self.group.reasons(features, self.reason_masks[i]),
+            'features': features
+        }
+
+    def to_dict(self) -> Dict:
+        """The evaluate_dataframe result structure, reasons rendering on access"""
+        names = list(self.features)
+        columns = [self.features[name].tolist() for name in names]
+        levels = self.risk_levels().tolist()
+        users = {}
+        for i, (user_id, score, mask) in enumerate(zip(self.user_ids.tolist(), self.scores.tolist(),
+                                                       self.reason_masks.tolist())):
+            features = {name: column[i] for name, column in zip(names, columns)}
+            users[user_id] = {
+                'fraud_score': score,
+                'risk_level': levels[i],
+                'reasons': self.group.reasons(features, mask),
+                'features': features
+            }
+        return {'users': users, 'overall': self.overall, **self.extras}
+
+    def to_pandas(self) -> pd.DataFrame:
+        """One row per user: user_id, fraud_score, risk_level, reason_mask and the features"""
+        return pd.DataFrame({
+            'user_id': self.user_ids,
+            'fraud_score': self.scores,
+            'risk_level': pd.Categorical.from_codes(self.risk_codes, LEVEL_NAMES),
+            'reason_mask': self.reason_masks,
+            **self.features,
+        })
+
+    def to_arrow(self):
+        """pyarrow.Table of the users; numeric columns share the arrays' memory"""
+        try:
+            import pyarrow as pa
+        except ImportError as exc:
+            raise ImportError('Arrow and Parquet export requires pyarrow') from exc
+        columns = {
+            'user_id': pa.array(self.user_ids, type=pa.string()),
+            'fraud_score': pa.array(self.scores),
+            'risk_level': pa.DictionaryArray.from_arrays(pa.array(self.risk_codes), LEVEL_NAMES),
+            'reason_mask': pa.array(self.reason_masks),
+        }
+        columns.update((name, pa.array(column)) for name, column in self.features.items())
+        return pa.table(columns).replace_schema_metadata({
+            'reason_names': json.dumps(self.reason_names),
+            'overall': json.dumps(self.overall, default=_json_default),
+        })
+
+    def to_parquet(self, path: str):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError('Arrow and Parquet export requires pyarrow') from exc
+        pq.write_table(self.to_arrow(), path)
+
+    def to_npz(self, path: str):
+        """Store the table in a .npz file (no pickled objects)"""
+        np.savez(
+            path,
+            user_id=self.user_ids.astype(str),
+            fraud_score=self.scores,
+            risk_level=self.risk_codes,
+            reason_mask=self.reason_masks,
+            reason_names=np.array(self.reason_names, dtype=str),
+            overall=np.array(json.dumps(self.overall, default=_json_default)),
+            **{FEATURE_PREFIX + name: column for name, column in self.features.items()}
+        )
+
+    @classmethod
+    def load_npz(cls, path: str, group: RuleGroup) -> 'ResultTable':
+        """Read a to_npz file; `group` renders the reasons and must have the same rules"""
+        with np.load(path, allow_pickle=False) as data:
+            if data['reason_names'].tolist() != [rule.name for rule in group.rules]:
+                raise ValueError('the stored reason bits were produced by different rules')
+            features = {key[len(FEATURE_PREFIX):]: data[key] for key in data.files if key.startswith(FEATURE_PREFIX)}
+            return cls(data['user_id'].astype(object), data['fraud_score'], data['reason_mask'], features, group,
+                       json.loads(data['overall'].item()))
+
+
+class _Rows(Mapping):
+    """User ID -> ResultTable.row, built on access"""
+
+    def __init__(self, table: ResultTable):
+        self.table = table
+        self.index = pd.Index(table.user_ids)
+
+    def __getitem__(self, user_id: str) -> Dict:
+        return self.table.row(self.index.get_loc(user_id))
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+def evaluate_table(model, df: pd.DataFrame) -> ResultTable:
+    """Score a prepared DataFrame into a ResultTable, as evaluate_dataframe does in one process"""
+    instrumentation = model.instrumentation
+    group = model.rules['users']
+    extras = {}
+    with instrumentation.run():
+        instrumentation.count('rows', len(df))
+        df, gift_report = model.collapse_gifts(df)
+        if gift_report is not None:
+            extras['gift_events'] = gift_report
+        user_ids, features, scores, masks = score_user_columns(model, df)
+        with instrumentation.stage('overall_features'):
+            overall = model._build_results({}, model._calculate_overall_features(df))['overall']
+        table = ResultTable(user_ids, scores, masks, features, group, overall, extras)
+        if model.thresholds['cluster_accounts']:
+            # Only the cluster members' rows are built
+            extras['clusters'] = model.evaluate_clusters(df, _Rows(table))
+    model._attach_instrumentation(extras)
+    return table
+
+
+def score_user_columns(model, df: pd.DataFrame) -> Tuple[List, Dict[str, np.ndarray], np.ndarray, np.ndarray]:
+    """User IDs, feature columns, scores and fired-rule masks of every user of an (already collapsed) frame"""
+    instrumentation = model.instrumentation
+    group = model.rules['users']
+    with instrumentation.stage('explode_user_rows'):
+        user_rows = model._explode_user_rows(df)
+    user_ids, features = [], {}
+    if len(user_rows):
+        user_ids, features = model._feature_columns(user_rows)
+        if model.thresholds['cycle_max_length']:
+            cycle_features = model.calculate_cycle_features(df)
+            user_cycles = [model._cycle_features(cycle_features, user_id) for user_id in user_ids]
+            for name in ('cycle_count', 'cycle_volume'):
+                features[name] = np.array([cycles[name] for cycles in user_cycles])
+    n = len(user_ids)
+    with instrumentation.stage('scoring'):
+        if n:
+            columns = {name: features[name] if name in features else np.full(n, group.defaults[name])
+                       for name in group.names}
+            scores, masks = group.score_columns(columns, n)
+        else:
+            scores, masks = np.zeros(0), np.zeros(0, dtype=np.int64)
+    return user_ids, features, scores, masks
+
+
+def _json_default(value):
+    """numpy scalars and lazy reason mappings in json.dumps"""
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
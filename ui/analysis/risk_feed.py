@@ -0,0 +1,117 @@
+"""Top-K risk queries and a risk-level change feed
+
+The dashboard needs the riskiest users and the users whose risk level moved
+since the previous run, not every user's full result. Both work from a
+RiskSnapshot: user IDs and scores only, scored from the feature engine's
+columns in one vectorized pass with the rule set (RuleGroup.score_columns),
+after gift collapsing, as evaluate_table does.
+
+- top_risk_users picks the k highest scores with np.argpartition and builds
+  the full result (reasons, features) for those k users only.
+- risk_changes compares a run against the snapshot stored at `path` by the
+  previous one and returns only the users whose risk level changed. Users
+  missing from either side count as MINIMAL (no activity scores 0), so new
+  low-risk accounts are not reported. The new snapshot replaces the old.
+
+Snapshots are .npz files (user IDs as a unicode array, no pickling).
+"""
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from scoring_rules import RISK_LEVELS
+
+# Risk levels by rank, lowest first
+LEVEL_NAMES = ['MINIMAL'] + [level for _, level in reversed(RISK_LEVELS)]
+_LEVEL_MINIMUMS = np.array([minimum for minimum, _ in reversed(RISK_LEVELS)], dtype=np.float64)
+
+
+class RiskSnapshot:
+    """User IDs and fraud scores of one run"""
+
+    def __init__(self, user_ids, scores: np.ndarray):
+        self.user_ids = pd.Index(user_ids, dtype=object)
+        self.scores = np.asarray(scores, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def top(self, k: int) -> np.ndarray:
+        """Positions of the k highest scores, best first (ties in user order)"""
+        k = min(k, len(self.scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        candidates = np.argpartition(-self.scores, k - 1)[:k] if k < len(self.scores) else np.arange(k)
+        return candidates[np.lexsort((candidates, -self.scores[candidates]))]
+
+    def changes(self, previous: 'RiskSnapshot') -> List[Dict]:
+        """Users whose risk level differs from `previous`, missing users counting as MINIMAL"""
+        user_ids = self.user_ids.append(previous.user_ids[~previous.user_ids.isin(self.user_ids)])
+        current = np.zeros(len(user_ids))
+        current[:len(self)] = self.scores
+        positions = previous.user_ids.get_indexer(user_ids)
+        before = np.zeros(len(user_ids))
+        before[positions >= 0] = previous.scores[positions[positions >= 0]]
+        current_levels = np.searchsorted(_LEVEL_MINIMUMS, current, side='right')
+        before_levels = np.searchsorted(_LEVEL_MINIMUMS, before, side='right')
+        return [
+            {
+                'userId': user_ids[i],
+                'previous_risk_level': LEVEL_NAMES[before_levels[i]],
+                'risk_level': LEVEL_NAMES[current_levels[i]],
+                'previous_fraud_score': float(before[i]),
+                'fraud_score': float(current[i]),
+            }
+            for i in np.flatnonzero(current_levels != before_levels)
+        ]
+
+    def save(self, path: str):
+        """Write the snapshot atomically"""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, user_ids=np.array([str(user_id) for user_id in self.user_ids], dtype=str),
+                 scores=self.scores)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'RiskSnapshot':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['user_ids'].tolist(), data['scores'])
+
+
+def user_scores(model, df: pd.DataFrame) -> Tuple[Dict[str, np.ndarray], RiskSnapshot, np.ndarray]:
+    """Feature columns of every active user, their scores as a snapshot and their fired-rule masks"""
+    # result_table imports the level tables from here
+    from result_table import score_user_columns
+    df, _ = model.collapse_gifts(df)
+    user_ids, features, scores, masks = score_user_columns(model, df)
+    return features, RiskSnapshot(user_ids, scores), masks
+
+
+def top_risk_users(model, df: pd.DataFrame, k: int = 10) -> List[Dict]:
+    """Full results of the k highest-scoring users, highest first"""
+    features, snapshot, masks = user_scores(model, df)
+    group = model.rules['users']
+    top = []
+    for i in snapshot.top(k):
+        user_features = {name: column[i].item() for name, column in features.items()}
+        score = float(snapshot.scores[i])
+        top.append({
+            'userId': snapshot.user_ids[i],
+            'fraud_score': score,
+            'risk_level': model._get_risk_level(score),
+            'reasons': group.reasons(user_features, masks[i]),
+            'features': user_features,
+        })
+    return top
+
+
+def risk_changes(model, df: pd.DataFrame, path: str, save: bool = True) -> List[Dict]:
+    """Users whose risk level changed since the snapshot at `path`, then store the new snapshot"""
+    _, snapshot, _ = user_scores(model, df)
+    previous = RiskSnapshot.load(path) if os.path.exists(path) else RiskSnapshot([], [])
+    changes = snapshot.changes(previous)
+    if save:
+        snapshot.save(path)
+    return changes
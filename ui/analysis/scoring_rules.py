@@ -0,0 +1,399 @@
+"""Declarative scoring rules, evaluated over whole feature tables
+
+A rule set holds one group of rules per scoring target ('users', 'overall',
+'clusters' and 'livestreams'). Each rule names:
+
+    name       reason key
+    feature    the feature it scores; `default` stands in for users that lack it
+    when       condition, e.g. "round_amount_ratio > 0.5"
+    score      score formula, e.g. "round_amount_ratio * 15"
+    cap        optional upper bound of the rule's score
+    reason     str.format template over the features, e.g. "{round_amount_ratio:.1%} of amounts are round numbers"
+
+Conditions and formulas are Python expressions restricted to feature names,
+numbers, arithmetic, comparisons, and / or / not, and min / max / abs. A
+group's own `when` gates every rule (unmatched rows score 0) and its `cap`
+bounds the total. Fired rules add their scores in rule order, so scores are
+bit-identical to the hand-written chain they replace.
+
+score_table() evaluates every rule once as numpy array expressions over all
+users. Reason strings are not built there: each user gets a LazyReasons
+mapping holding a bitmask of the fired rules, and a template is only
+formatted when that reason is read (display, JSON export).
+
+Rule sets load from JSON or YAML, optionally next to thresholds:
+
+    {"thresholds": {"high_velocity_count": 4}, "rules": {"users": {...}}}
+
+Groups left out of "rules" keep their defaults, so a config can retune one
+target without restating the others.
+See FraudDetectionModel.load_config. The default thresholds and risk levels
+live here too; like the scalar rule path they need only the standard library.
+"""
+import ast
+import json
+import os
+from collections import ChainMap
+from collections.abc import Mapping
+from functools import reduce
+from typing import Dict, List, Optional, Tuple
+
+# numpy is imported where the array path needs it, so the scalar path (and the
+# small-batch CLI path built on it) starts without loading numpy or pandas
+
+DEFAULT_THRESHOLDS = {
+    'high_velocity_window': 300,  # 5 minutes
+    'high_velocity_count': 3,
+    'large_amount_threshold': 1000000000,  # 1B units
+    'off_hours_start': 22,
+    'off_hours_end': 6,
+    'round_amount_threshold': 1000000,  # 1M units
+    'velocity_windows': [],  # extra windows (seconds) reported as high_velocity_periods_<n>s
+    'cycle_max_length': 0,  # longest transaction loop to search for, 0 disables cycle features
+    'cycle_window': 86400,  # 1 day, max time from first to last transfer of a loop
+    'collapse_gift_triples': False,  # score fused gift events instead of raw rows (see gift_events)
+    'cluster_accounts': False,  # add results for accounts linked by funding / co-gifting (see account_clusters)
+    'cluster_max_funded_accounts': 20,  # a source funding more accounts is a platform hub and links none
+    'co_gift_window': 10,  # seconds between gifts to one receiver that count as lockstep
+    'co_gift_min_events': 3,
+    'co_gift_min_share': 0.5,  # of each account's gifts
+    'burst_window': 60,  # seconds, livestream gift bursts (see livestream_analysis)
+    'burst_count': 10,  # gifts within burst_window
+    'burst_factor': 4  # times the stream's average rate over burst_window
+}
+
+# Lowest score of each risk level, highest first
+RISK_LEVELS = [(70, 'HIGH'), (40, 'MEDIUM'), (20, 'LOW')]
+
+DEFAULT_RULES = {
+    'users': {
+        'when': 'transaction_count > 0',
+        'cap': 100.0,
+        'rules': [
+            {'name': 'high_velocity', 'feature': 'high_velocity_periods',
+             'when': 'high_velocity_periods > 0', 'score': 'high_velocity_periods * 10', 'cap': 25,
+             'reason': '{high_velocity_periods} rapid transaction periods'},
+            {'name': 'amount_outliers', 'feature': 'amount_outliers',
+             'when': 'amount_outliers > 0', 'score': 'amount_outliers * 5', 'cap': 20,
+             'reason': '{amount_outliers} transactions with unusual amounts'},
+            {'name': 'round_amounts', 'feature': 'round_amount_ratio',
+             'when': 'round_amount_ratio > 0.5', 'score': 'round_amount_ratio * 15',
+             'reason': '{round_amount_ratio:.1%} of amounts are round numbers'},
+            {'name': 'large_transactions', 'feature': 'large_transaction_count',
+             'when': 'large_transaction_count > 0', 'score': 'large_transaction_count / transaction_count * 20',
+             'cap': 20, 'reason': '{large_transaction_count} very large transactions'},
+            {'name': 'off_hours', 'feature': 'off_hours_ratio',
+             'when': 'off_hours_ratio > 0.3', 'score': 'off_hours_ratio * 15',
+             'reason': '{off_hours_ratio:.1%} of transactions during off hours'},
+            {'name': 'circular_transactions', 'feature': 'circular_transactions',
+             'when': 'circular_transactions', 'score': '10',
+             'reason': 'Potential circular transaction patterns detected'},
+            {'name': 'low_diversity', 'feature': 'unique_counterparties',
+             'when': 'transaction_count > 5 and unique_counterparties <= 2', 'score': '5',
+             'reason': 'Only {unique_counterparties} unique counterparties'},
+            # Only present when cycle detection is enabled
+            {'name': 'transaction_cycles', 'feature': 'cycle_count', 'default': 0,
+             'when': 'cycle_count > 0', 'score': 'cycle_count * 5', 'cap': 15,
+             'reason': '{cycle_count} closed transaction loops'},
+        ],
+    },
+    'overall': {
+        'cap': 100.0,
+        'rules': [
+            {'name': 'high_rate', 'feature': 'transaction_rate',
+             'when': 'transaction_rate > 10', 'score': '(transaction_rate - 10) * 2', 'cap': 20,
+             'reason': 'High transaction rate: {transaction_rate:.1f} per hour'},
+            {'name': 'concentration', 'feature': 'volume_concentration',
+             'when': 'volume_concentration > 0.8', 'score': 'volume_concentration * 15',
+             'reason': 'High volume concentration: {volume_concentration:.1%}'},
+        ],
+    },
+    'clusters': {
+        'cap': 100.0,
+        'rules': [
+            {'name': 'shared_funding', 'feature': 'funding_links',
+             'when': 'funding_links > 0', 'score': 'funding_links * 10', 'cap': 25,
+             'reason': '{funding_links} accounts funded from a shared source'},
+            {'name': 'lockstep_gifting', 'feature': 'co_gift_links',
+             'when': 'co_gift_links > 0', 'score': 'co_gift_links * 10', 'cap': 30,
+             'reason': '{co_gift_links} account pairs gifting in lockstep'},
+            {'name': 'cluster_size', 'feature': 'cluster_size',
+             'when': 'cluster_size >= 3', 'score': 'cluster_size * 5', 'cap': 20,
+             'reason': '{cluster_size} linked accounts'},
+            {'name': 'risky_members', 'feature': 'risky_members',
+             'when': 'risky_members >= 2', 'score': 'risky_members * 10', 'cap': 25,
+             'reason': '{risky_members} members at MEDIUM risk or above'},
+        ],
+    },
+    # Concentration, repeat and rate rules are ignored below 10 gifts
+    'livestreams': {
+        'cap': 100.0,
+        'rules': [
+            {'name': 'gift_bursts', 'feature': 'burst_periods',
+             'when': 'burst_periods > 0', 'score': 'burst_periods * 3', 'cap': 30,
+             'reason': '{burst_periods} gifts opening a burst (peak {max_burst} gifts)'},
+            {'name': 'high_gift_rate', 'feature': 'gift_rate',
+             'when': 'gift_rate > 600 and gift_count >= 10', 'score': '(gift_rate / 600 - 1) * 20', 'cap': 20,
+             'reason': 'High gift rate: {gift_rate:.1f} per hour'},
+            {'name': 'gifter_concentration', 'feature': 'gifter_concentration',
+             'when': 'gifter_concentration > 0.8 and gift_count >= 10', 'score': 'gifter_concentration * 20',
+             'reason': 'Top gifter sent {gifter_concentration:.1%} of the gift volume'},
+            {'name': 'repeat_gifters', 'feature': 'repeat_gifter_ratio',
+             'when': 'repeat_gifter_ratio > 0.9 and gift_count >= 10', 'score': 'repeat_gifter_ratio * 10',
+             'reason': '{repeat_gifter_ratio:.1%} of gifters gifted repeatedly'},
+            {'name': 'split_inconsistency', 'feature': 'split_mismatch',
+             'when': 'split_mismatch > 0.01', 'score': '20',
+             'reason': 'Fee and receive amounts differ from gift volume by {split_mismatch:.1%}'},
+        ],
+    },
+}
+
+_FUNCTIONS = {'min', 'max', 'abs'}
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Constant, ast.Load,
+    ast.And, ast.Or, ast.Not, ast.USub, ast.UAdd, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.Pow, ast.Gt, ast.GtE, ast.Lt, ast.LtE, ast.Eq, ast.NotEq,
+)
+
+_SCALAR_GLOBALS = {'__builtins__': {}, 'min': min, 'max': max, 'abs': abs}
+_VECTOR_GLOBALS = {}
+
+
+def risk_level(score: float) -> str:
+    """Convert numeric score to risk level"""
+    for minimum, level in RISK_LEVELS:
+        if score >= minimum:
+            return level
+    return 'MINIMAL'
+
+
+def _vector_globals() -> Dict:
+    if not _VECTOR_GLOBALS:
+        import numpy as np
+        _VECTOR_GLOBALS.update({
+            '__builtins__': {},
+            '_and': lambda *values: reduce(np.logical_and, values),
+            '_or': lambda *values: reduce(np.logical_or, values),
+            '_not': np.logical_not,
+            '_min': lambda *values: reduce(np.minimum, values),
+            '_max': lambda *values: reduce(np.maximum, values),
+            '_abs': np.abs,
+        })
+    return _VECTOR_GLOBALS
+
+
+class _Expression:
+    """A validated rule expression compiled for scalar and for array evaluation"""
+    __slots__ = ('source', 'names', 'scalar', 'vector')
+
+    def __init__(self, source: str, context: str):
+        self.source = str(source)
+        try:
+            tree = ast.parse(self.source, mode='eval')
+        except SyntaxError as exc:
+            raise ValueError(f"{context}: invalid expression {self.source!r}") from exc
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise ValueError(f"{context}: {type(node).__name__} is not allowed in {self.source!r}")
+            if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS
+                                                   and not node.keywords):
+                raise ValueError(f"{context}: only min / max / abs calls are allowed in {self.source!r}")
+            if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+                raise ValueError(f"{context}: only numeric constants are allowed in {self.source!r}")
+        self.names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)} - _FUNCTIONS
+        self.scalar = compile(tree, context, 'eval')
+        self.vector = compile(ast.fix_missing_locations(_Vectorize().visit(tree)), context, 'eval')
+
+    def evaluate(self, values: Mapping):
+        return eval(self.scalar, _SCALAR_GLOBALS, values)
+
+    def evaluate_table(self, columns: Mapping):
+        return eval(self.vector, _vector_globals(), columns)
+
+
+class _Vectorize(ast.NodeTransformer):
+    """Rewrites and / or / not, chained comparisons and min / max / abs into element-wise calls"""
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        return _call('_and' if isinstance(node.op, ast.And) else '_or', node.values)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        return _call('_not', [node.operand]) if isinstance(node.op, ast.Not) else node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        operands = [node.left] + node.comparators
+        return _call('_and', [ast.Compare(left=left, ops=[op], comparators=[right])
+                              for left, op, right in zip(operands, node.ops, operands[1:])])
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        return _call(f"_{node.func.id}", node.args)
+
+
+def _call(name: str, args: List[ast.expr]) -> ast.Call:
+    return ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=args, keywords=[])
+
+
+class _Rule:
+    __slots__ = ('name', 'feature', 'default', 'when', 'score', 'cap', 'reason')
+
+    def __init__(self, spec: Dict, group: str):
+        context = f"rule {group}.{spec.get('name')}"
+        missing = [key for key in ('name', 'when', 'score', 'reason') if key not in spec]
+        if missing:
+            raise ValueError(f"{context} is missing {', '.join(missing)}")
+        self.name = spec['name']
+        self.feature = spec.get('feature')
+        self.default = spec.get('default')
+        self.when = _Expression(spec['when'], context)
+        self.score = _Expression(spec['score'], context)
+        self.cap = spec.get('cap')
+        self.reason = spec['reason']
+
+
+class RuleGroup:
+    """The ordered rules that score one target"""
+
+    def __init__(self, name: str, spec: Dict):
+        self.name = name
+        self.when = _Expression(spec['when'], f"rule group {name}") if spec.get('when') else None
+        self.cap = spec.get('cap')
+        self.rules = [_Rule(rule, name) for rule in spec['rules']]
+        if len({rule.name for rule in self.rules}) != len(self.rules):
+            raise ValueError(f"rule group {name} has duplicate rule names")
+        self.defaults = {rule.feature: rule.default for rule in self.rules
+                         if rule.feature is not None and rule.default is not None}
+        self.names = set().union(*(rule.when.names | rule.score.names for rule in self.rules),
+                                 self.when.names if self.when else set())
+
+    def score(self, features: Dict) -> Tuple[float, Dict[str, str]]:
+        """Score one feature dict, returning the score and rendered reasons"""
+        values = ChainMap(features, self.defaults)
+        if self.when is not None and not self.when.evaluate(values):
+            return 0.0, {}
+        score = 0.0
+        reasons = {}
+        for rule in self.rules:
+            if rule.when.evaluate(values):
+                rule_score = rule.score.evaluate(values)
+                score += rule_score if rule.cap is None else min(rule_score, rule.cap)
+                reasons[rule.name] = rule.reason.format_map(values)
+        return (score if self.cap is None else min(score, self.cap)), reasons
+
+    def score_table(self, feature_dicts: List[Dict]) -> Tuple['np.ndarray', 'np.ndarray']:
+        """Score many feature dicts at once, returning scores and fired-rule bitmasks"""
+        return self.score_columns(self.columns(feature_dicts), len(feature_dicts))
+
+    def columns(self, feature_dicts: List[Dict]) -> Dict[str, 'np.ndarray']:
+        """One array per feature the rules read"""
+        import numpy as np
+        columns = {}
+        for name in self.names:
+            if name in self.defaults:
+                default = self.defaults[name]
+                columns[name] = np.array([features.get(name, default) for features in feature_dicts])
+            else:
+                columns[name] = np.array([features[name] for features in feature_dicts])
+        return columns
+
+    def score_columns(self, columns: Dict[str, 'np.ndarray'], n: int) -> Tuple['np.ndarray', 'np.ndarray']:
+        """Score n rows given as feature columns, returning scores and fired-rule bitmasks"""
+        import numpy as np
+        score = np.zeros(n)
+        masks = np.zeros(n, dtype=np.int64)
+        with np.errstate(all='ignore'):
+            active = np.ones(n, dtype=bool)
+            if self.when is not None:
+                active = np.broadcast_to(self.when.evaluate_table(columns), (n,)).astype(bool)
+            for i, rule in enumerate(self.rules):
+                fired = active & np.broadcast_to(rule.when.evaluate_table(columns), (n,)).astype(bool)
+                rule_score = rule.score.evaluate_table(columns)
+                if rule.cap is not None:
+                    rule_score = np.minimum(rule_score, rule.cap)
+                score = score + np.where(fired, rule_score, 0.0)
+                masks |= fired.astype(np.int64) << i
+        if self.cap is not None:
+            score = np.minimum(score, self.cap)
+        return np.where(active, score, 0.0), masks
+
+    def reasons(self, features: Dict, mask: int) -> 'LazyReasons':
+        return LazyReasons(self, features, mask)
+
+
+class LazyReasons(Mapping):
+    """Read-only reason mapping that formats a rule's template on first access"""
+    __slots__ = ('group', 'features', 'mask', 'rendered')
+
+    def __init__(self, group: RuleGroup, features: Dict, mask: int):
+        self.group = group
+        self.features = features
+        self.mask = int(mask)
+        self.rendered: Dict[str, str] = {}
+
+    def __getitem__(self, name: str) -> str:
+        if name not in self.rendered:
+            for i, rule in enumerate(self.group.rules):
+                if rule.name == name and self.mask >> i & 1:
+                    self.rendered[name] = rule.reason.format_map(ChainMap(self.features, self.group.defaults))
+                    break
+            else:
+                raise KeyError(name)
+        return self.rendered[name]
+
+    def __iter__(self):
+        return (rule.name for i, rule in enumerate(self.group.rules) if self.mask >> i & 1)
+
+    def __len__(self) -> int:
+        return bin(self.mask).count('1')
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def __reduce__(self):
+        # Compiled rules do not pickle (feature cache, worker processes), so ship the rendered dict
+        return dict, (dict(self),)
+
+
+class RuleSet:
+    """Named rule groups, built from a DEFAULT_RULES-shaped spec
+
+    The groups `spec` names replace the default ones; the others keep DEFAULT_RULES.
+    A group given as a bare list of rules keeps the default group's when and cap.
+    """
+
+    def __init__(self, spec: Optional[Dict] = None):
+        merged = dict(DEFAULT_RULES)
+        for name, group in (spec or {}).items():
+            merged[name] = {**DEFAULT_RULES.get(name, {}), 'rules': group} if isinstance(group, list) else group
+        self.spec = json.loads(json.dumps(merged))
+        self.groups = {name: RuleGroup(name, group) for name, group in self.spec.items()}
+
+    def __getitem__(self, name: str) -> RuleGroup:
+        return self.groups[name]
+
+    def __reduce__(self):
+        # Rebuilt from the spec, as compiled expressions do not pickle
+        return RuleSet, (self.spec,)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'RuleSet':
+        """Load the rules of a JSON / YAML file (its 'rules' section when it also holds thresholds)"""
+        config = load_config_file(path)
+        return cls(config.get('rules', config))
+
+
+def load_config_file(path: str) -> Dict:
+    """Parse a JSON or YAML (.yaml / .yml) configuration file"""
+    with open(path) as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError as exc:
+                raise ImportError('loading YAML configuration requires PyYAML') from exc
+            return yaml.safe_load(f)
+        return json.load(f)
@@ -0,0 +1,474 @@
+"""Long-running asyncio scoring service
+
+Loads FraudDetectionModel once and serves HTTP/1.1 on a TCP port or a Unix
+socket. Every request carries an analysis session token (created by the
+admin dashboard via `analysis:createAnalysisSession`), which is checked with
+`analysis:getAnalysisSessionOwner`:
+
+    POST /score     Authorization: Bearer <token>
+                    body: JSON array or JSON Lines of transactions; an empty
+                    body scores the session's transactions from
+                    `analysis:getTransactionsByToken`
+    GET  /metrics   latency, throughput, batching and backpressure counters
+    GET  /health
+
+Results are streamed back as JSON Lines: one {"userId": ..., "fraud_score": ...}
+line per user followed by an {"overall": {...}} line (then a {"clusters": {...}}
+line when the model clusters accounts, and a final {"gift_events": {...}} line
+when it collapses gift triples).
+
+Requests that arrive close together are coalesced into one micro-batch and
+scored with a single grouped feature pass; user IDs are namespaced per request
+so no features leak between batches. When more than `max_pending_rows`
+transactions are waiting, new requests are rejected with 503 and Retry-After.
+
+`LocalConvexStub` implements the same queries in memory, so the service can
+run without a Convex deployment:
+
+    python scoring_service.py --port 8765 --stub
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import struct
+import sys
+import time
+import urllib.request
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+import pandas as pd
+
+from fraud_detection_model import FraudDetectionModel
+from transaction_ingest import read_transactions
+
+ID_COLUMNS = ['senderId', 'receiverId', 'owner']
+
+# Separates the request number from the user ID inside a micro-batch
+_NAMESPACE_SEP = '\x1f'
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+            411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error',
+            503: 'Service Unavailable'}
+
+
+class ConvexClient:
+    """Minimal client for the Convex HTTP query API"""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def query(self, path: str, args: Dict):
+        request = urllib.request.Request(
+            f"{self.url}/api/query",
+            data=json.dumps({'path': path, 'args': args, 'format': 'json'}).encode(),
+            headers={'Content-Type': 'application/json'},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            body = json.load(response)
+        if body.get('status') != 'success':
+            raise RuntimeError(body.get('errorMessage', 'Convex query failed'))
+        return _decode_convex_value(body['value'])
+
+
+class LocalConvexStub:
+    """In-memory stand-in for the Convex analysis queries"""
+
+    def __init__(self, transactions: Optional[List[Dict]] = None):
+        self.transactions = list(transactions or [])
+        self.sessions: Dict[str, Dict] = {}
+
+    def create_analysis_session(self, owner: str = 'admin', ttl: float = 3600) -> str:
+        """Create a session the way analysis:createAnalysisSession does and return its token"""
+        token = str(uuid4())
+        self.sessions[token] = {'owner': owner, 'expires': (time.time() + ttl) * 1000}
+        return token
+
+    def query(self, path: str, args: Dict):
+        session = self.sessions.get(args.get('token'))
+        valid = session is not None and session['expires'] >= time.time() * 1000
+        if path == 'analysis:getAnalysisSessionOwner':
+            return session['owner'] if valid else None
+        if path == 'analysis:getTransactionsByToken':
+            if not valid:
+                raise RuntimeError('Invalid analysis session token')
+            return sorted(self.transactions, key=lambda t: t['createdAt'], reverse=True)
+        raise KeyError(path)
+
+
+class ServiceMetrics:
+    """Counters and recent latencies of a running service"""
+
+    def __init__(self, latency_samples: int = 2048):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.rejected = 0
+        self.unauthorized = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.rows_scored = 0
+        self.scoring_seconds = 0.0
+        self.pending_rows = 0
+        self.latencies = deque(maxlen=latency_samples)
+
+    def snapshot(self) -> Dict:
+        uptime = time.monotonic() - self.started
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {
+            'uptime_seconds': uptime,
+            'requests': self.requests,
+            'rejected': self.rejected,
+            'unauthorized': self.unauthorized,
+            'errors': self.errors,
+            'batches': self.batches,
+            'avg_batch_requests': self.batched_requests / self.batches if self.batches else 0.0,
+            'rows_scored': self.rows_scored,
+            'rows_per_second': self.rows_scored / uptime if uptime else 0.0,
+            'scoring_rows_per_second': self.rows_scored / self.scoring_seconds if self.scoring_seconds else 0.0,
+            'pending_rows': self.pending_rows,
+            'latency_ms': {
+                'p50': float(np.percentile(latencies, 50)) * 1000,
+                'p95': float(np.percentile(latencies, 95)) * 1000,
+                'p99': float(np.percentile(latencies, 99)) * 1000,
+                'max': float(latencies.max()) * 1000,
+            },
+        }
+
+
+class ScoringService:
+    """Asyncio HTTP front end that micro-batches scoring requests"""
+
+    def __init__(self, backend, model: Optional[FraudDetectionModel] = None, max_batch_rows: int = 200000,
+                 max_batch_delay: float = 0.005, max_pending_rows: int = 2000000,
+                 max_body_bytes: int = 512 * 1024 * 1024, session_ttl: float = 30.0):
+        self.backend = backend
+        self.model = model or FraudDetectionModel()
+        self.max_batch_rows = max_batch_rows
+        self.max_batch_delay = max_batch_delay
+        self.max_pending_rows = max_pending_rows
+        self.max_body_bytes = max_body_bytes
+        self.session_ttl = session_ttl
+        self.metrics = ServiceMetrics()
+        self.sessions: Dict[str, Tuple[str, float]] = {}
+        # One scoring thread: batches are CPU bound and the model is not shared across threads
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scoring')
+        self.queue: Optional[asyncio.Queue] = None
+        self.batcher: Optional[asyncio.Task] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765, unix_path: Optional[str] = None):
+        """Start listening and return the asyncio server"""
+        self.queue = asyncio.Queue()
+        self.batcher = asyncio.create_task(self._batch_loop())
+        if unix_path:
+            return await asyncio.start_unix_server(self._handle_connection, path=unix_path)
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def stop(self):
+        if self.batcher is not None:
+            self.batcher.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def score(self, df: pd.DataFrame) -> Dict:
+        """Queue a prepared frame for the next micro-batch and wait for its results"""
+        rows = len(df)
+        if self.metrics.pending_rows + rows > self.max_pending_rows and self.metrics.pending_rows:
+            self.metrics.rejected += 1
+            raise _HttpError(503, 'scoring queue is full', {'Retry-After': '1'})
+        self.metrics.pending_rows += rows
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((df, future))
+        try:
+            return await future
+        finally:
+            self.metrics.pending_rows -= rows
+
+    async def owner_for(self, token: Optional[str]) -> str:
+        """Session owner for a token, with a short-lived cache of successful lookups"""
+        if not token:
+            raise _HttpError(401, 'missing session token')
+        cached = self.sessions.get(token)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        owner = await self._query('analysis:getAnalysisSessionOwner', {'token': token})
+        if owner is None:
+            self.sessions.pop(token, None)
+            raise _HttpError(401, 'invalid or expired session token')
+        self.sessions[token] = (owner, time.monotonic() + self.session_ttl)
+        return owner
+
+    async def _query(self, path: str, args: Dict):
+        return await asyncio.get_running_loop().run_in_executor(None, self.backend.query, path, args)
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            rows = len(batch[0][0])
+            deadline = loop.time() + self.max_batch_delay
+            while rows < self.max_batch_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                rows += len(item[0])
+
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, self._score_batch, [df for df, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.metrics.scoring_seconds += time.perf_counter() - start
+            self.metrics.batches += 1
+            self.metrics.batched_requests += len(batch)
+            self.metrics.rows_scored += rows
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _score_batch(self, frames: List[pd.DataFrame]) -> List[Dict]:
+        """Score several requests with one grouped feature pass"""
+        model = self.model
+        if len(frames) == 1:
+            return [model.evaluate_dataframe(frames[0])]
+
+        normalized = [model.collapse_gifts(df) for df in frames]
+        namespaced = []
+        for i, (df, _) in enumerate(normalized):
+            df = df.copy()
+            for col in ID_COLUMNS:
+                if col in df.columns:
+                    df[col] = f"{i}{_NAMESPACE_SEP}" + df[col].astype('string')
+            namespaced.append(df)
+        combined = pd.concat(namespaced, ignore_index=True).sort_values('createdAt', kind='stable')
+
+        users = [{} for _ in frames]
+        for key, result in model._score_users(model.calculate_all_user_features(combined)).items():
+            i, user_id = key.split(_NAMESPACE_SEP, 1)
+            users[int(i)][user_id] = result
+        results = []
+        for i, (df, gift_report) in enumerate(normalized):
+            results.append(model._build_results(users[i], model._calculate_overall_features(df)))
+            if model.thresholds['cluster_accounts']:
+                results[-1]['clusters'] = model.evaluate_clusters(df, users[i])
+            if gift_report is not None:
+                results[-1]['gift_events'] = gift_report
+        return results
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await _read_request(reader, self.max_body_bytes)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                try:
+                    await self._dispatch(method, path, headers, body, writer)
+                except _HttpError as exc:
+                    await _write_json(writer, exc.status, {'error': exc.message}, exc.headers)
+                except Exception as exc:
+                    self.metrics.errors += 1
+                    await _write_json(writer, 500, {'error': str(exc)})
+                if not keep_alive:
+                    break
+        except (_HttpError, asyncio.IncompleteReadError, ConnectionError) as exc:
+            if isinstance(exc, _HttpError):
+                await _write_json(writer, exc.status, {'error': exc.message}, {'Connection': 'close'})
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, headers: Dict, body: bytes, writer: asyncio.StreamWriter):
+        if path == '/health' and method == 'GET':
+            await _write_json(writer, 200, {'status': 'ok'})
+        elif path == '/metrics' and method == 'GET':
+            await _write_json(writer, 200, self.metrics.snapshot())
+        elif path == '/score' and method == 'POST':
+            await self._handle_score(headers, body, writer)
+        else:
+            raise _HttpError(404, f"no route for {method} {path}")
+
+    async def _handle_score(self, headers: Dict, body: bytes, writer: asyncio.StreamWriter):
+        start = time.perf_counter()
+        self.metrics.requests += 1
+        authorization = headers.get('authorization', '')
+        token = authorization[7:].strip() if authorization.lower().startswith('bearer ') else None
+        try:
+            await self.owner_for(token)
+        except _HttpError:
+            self.metrics.unauthorized += 1
+            raise
+
+        loop = asyncio.get_running_loop()
+        if body.strip():
+            try:
+                df = await loop.run_in_executor(None, read_transactions, body)
+            except (ValueError, KeyError, TypeError) as exc:
+                raise _HttpError(400, f"could not parse transactions: {exc}")
+        else:
+            transactions = await self._query('analysis:getTransactionsByToken', {'token': token})
+            df = await loop.run_in_executor(None, read_transactions, json.dumps(transactions))
+        if len(df) == 0:
+            raise _HttpError(400, 'no transactions to score')
+
+        results = await self.score(df)
+        await _stream_results(writer, results)
+        self.metrics.latencies.append(time.perf_counter() - start)
+
+
+class _HttpError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+async def _read_request(reader: asyncio.StreamReader, max_body_bytes: int):
+    """Read one HTTP/1.1 request, or None when the client closed the connection"""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, path, _ = request_line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise _HttpError(400, 'malformed request line')
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    body = b''
+    if method == 'POST':
+        if 'content-length' not in headers:
+            raise _HttpError(411, 'Content-Length is required')
+        value = headers['content-length']
+        # Digits only: int() would also take signs, spaces and underscores
+        if not (value.isascii() and value.isdigit()):
+            raise _HttpError(400, 'invalid Content-Length')
+        length = int(value)
+        if length > max_body_bytes:
+            raise _HttpError(413, 'request body too large')
+        body = await reader.readexactly(length)
+    return method, path.split('?', 1)[0], headers, body
+
+
+async def _write_json(writer: asyncio.StreamWriter, status: int, payload: Dict, headers: Optional[Dict] = None):
+    data = json.dumps(_jsonable(payload)).encode()
+    head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", 'Content-Type: application/json',
+            f"Content-Length: {len(data)}"]
+    head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + data)
+    await writer.drain()
+
+
+async def _stream_results(writer: asyncio.StreamWriter, results: Dict, lines_per_chunk: int = 256):
+    """Write results as chunked JSON Lines, waiting for the client to drain each chunk"""
+    writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n')
+
+    async def send(lines):
+        data = ''.join(lines).encode()
+        writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+        await writer.drain()
+
+    lines = []
+    for user_id, result in results['users'].items():
+        lines.append(json.dumps(_jsonable({'userId': user_id, **result})) + '\n')
+        if len(lines) == lines_per_chunk:
+            await send(lines)
+            lines = []
+    lines.append(json.dumps(_jsonable({'overall': results['overall']})) + '\n')
+    if 'clusters' in results:
+        lines.append(json.dumps(_jsonable({'clusters': results['clusters']})) + '\n')
+    if 'gift_events' in results:
+        lines.append(json.dumps(_jsonable({'gift_events': results['gift_events']})) + '\n')
+    await send(lines)
+    writer.write(b'0\r\n\r\n')
+    await writer.drain()
+
+
+def _jsonable(value):
+    """Convert numpy scalars, NaN and lazy mappings so the value can be encoded as strict JSON"""
+    if isinstance(value, Mapping):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _decode_convex_value(value):
+    """Decode Convex JSON-format values (int64 arrives as {"$integer": base64})"""
+    if isinstance(value, dict):
+        if set(value) == {'$integer'}:
+            return str(struct.unpack('<q', base64.b64decode(value['$integer']))[0])
+        return {key: _decode_convex_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode_convex_value(item) for item in value]
+    return value
+
+
+async def serve(service: ScoringService, host: str, port: int, unix_path: Optional[str] = None):
+    server = await service.start(host, port, unix_path)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Run the fraud scoring service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--convex-url', help='Convex deployment URL used to validate session tokens')
+    parser.add_argument('--stub', action='store_true', help='use an in-memory Convex stub and print a session token')
+    parser.add_argument('--stub-transactions', help='JSON / JSON Lines file served by the stub for empty requests')
+    parser.add_argument('--max-batch-rows', type=int, default=200000)
+    parser.add_argument('--max-batch-delay', type=float, default=0.005, help='seconds to wait for more requests')
+    parser.add_argument('--max-pending-rows', type=int, default=2000000)
+    args = parser.parse_args(argv)
+
+    if args.stub:
+        transactions = []
+        if args.stub_transactions:
+            from transaction_ingest import iter_transactions
+            with open(args.stub_transactions, 'rb') as f:
+                transactions = list(iter_transactions(f))
+        backend = LocalConvexStub(transactions)
+        print(f"session token: {backend.create_analysis_session()}", file=sys.stderr)
+    elif args.convex_url:
+        backend = ConvexClient(args.convex_url)
+    else:
+        parser.error('either --convex-url or --stub is required')
+
+    service = ScoringService(backend, max_batch_rows=args.max_batch_rows, max_batch_delay=args.max_batch_delay,
+                             max_pending_rows=args.max_pending_rows)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
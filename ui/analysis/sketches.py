@@ -0,0 +1,239 @@
+"""Mergeable bounded-memory sketches for the approximate feature mode
+
+- SetSketch counts distinct 64-bit hashes. It keeps them exactly, as a sorted
+  uint64 array of up to `max_exact` values (2 KB at the default 256), and
+  then switches to a HyperLogLog with 2**p one-byte registers, read with
+  Ertl's improved estimator. The relative standard error is
+  1.04 / sqrt(2**p): 1.6% at the default p=12, using 4 KB per sketch.
+- KLLSketch answers rank and quantile queries over a stream of numbers. It is
+  exact until its first compaction (about k values). After that the
+  normalized rank error is about 1.65% at k=200 with 99% confidence (the
+  figure published for the KLL sketch). It holds O(k) items (at most about
+  3k, 5 KB at k=200) however long the stream is; sketches built together
+  should share one random.Random for their compaction coin flips.
+
+Both sketches merge losslessly with respect to these bounds, so partial
+sketches built on different shards or time ranges can be combined.
+"""
+import math
+import random
+from typing import List, Optional
+
+import numpy as np
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def hash64(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, mapping int64 codes to well-mixed uint64 hashes"""
+    with np.errstate(over='ignore'):
+        z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Number of significant bits of each uint64"""
+    lengths = np.zeros(len(values), dtype=np.int64)
+    values = values.copy()
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= (np.uint64(1) << np.uint64(shift))
+        lengths[high] += shift
+        values[high] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+
+def _sigma(x: float) -> float:
+    """sigma series of Ertl's estimator, covering registers that are still zero"""
+    if x == 1:
+        return float('inf')
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x: float) -> float:
+    """tau series of Ertl's estimator, covering registers at the maximum rank"""
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+class SetSketch:
+    """Distinct-count sketch: an exact hash set that becomes a HyperLogLog past max_exact values"""
+    __slots__ = ('p', 'max_exact', 'exact', 'registers')
+
+    def __init__(self, p: int = 12, max_exact: int = 256):
+        self.p = p
+        self.max_exact = max_exact
+        # Sorted distinct hashes while exact, 8 bytes each
+        self.exact: Optional[np.ndarray] = np.zeros(0, dtype=np.uint64)
+        self.registers: Optional[np.ndarray] = None
+
+    def add_hashes(self, hashes: np.ndarray):
+        if len(hashes) == 0:
+            return
+        if self.exact is not None:
+            self.exact = np.unique(np.concatenate([self.exact, hashes.astype(np.uint64)]))
+            if len(self.exact) > self.max_exact:
+                self._promote()
+            return
+        self._add_registers(hashes)
+
+    def merge(self, other: 'SetSketch'):
+        """Fold another sketch with the same p into this one"""
+        if other.exact is not None:
+            self.add_hashes(other.exact)
+            return
+        if self.exact is not None:
+            self._promote()
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> float:
+        if self.exact is not None:
+            return float(len(self.exact))
+        return self._estimate_registers(self.registers)
+
+    def union_estimate(self, other: 'SetSketch') -> float:
+        """Distinct count of the union of two sketches, without modifying either"""
+        if self.exact is not None and other.exact is not None:
+            return float(len(np.union1d(self.exact, other.exact)))
+        return self._estimate_registers(np.maximum(self._as_registers(), other._as_registers()))
+
+    def intersection_estimate(self, other: 'SetSketch') -> float:
+        """Inclusion-exclusion estimate of the shared values (exact while both sides are exact)"""
+        if self.exact is not None and other.exact is not None:
+            return float(len(np.intersect1d(self.exact, other.exact, assume_unique=True)))
+        return max(self.estimate() + other.estimate() - self.union_estimate(other), 0.0)
+
+    def intersection_error(self, other: 'SetSketch') -> float:
+        """Bound on the error of intersection_estimate: 0 while both sides are exact, else three
+        standard errors of the union estimate (the inclusion-exclusion error is about half of one)"""
+        if self.exact is not None and other.exact is not None:
+            return 0.0
+        return 3 * 1.04 / math.sqrt(1 << self.p) * self.union_estimate(other)
+
+    def _promote(self):
+        hashes = self.exact
+        self.exact = None
+        self.registers = np.zeros(1 << self.p, dtype=np.uint8)
+        self._add_registers(hashes)
+
+    def _as_registers(self) -> np.ndarray:
+        if self.registers is not None:
+            return self.registers
+        registers = np.zeros(1 << self.p, dtype=np.uint8)
+        self._add_registers(self.exact, registers)
+        return registers
+
+    def _add_registers(self, hashes: np.ndarray, registers: Optional[np.ndarray] = None):
+        registers = self.registers if registers is None else registers
+        hashes = hashes.astype(np.uint64)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & (_MASK64 >> np.uint64(self.p))
+        rank = (64 - self.p) - _bit_length(rest) + 1
+        np.maximum.at(registers, index, rank.astype(np.uint8))
+
+    def _estimate_registers(self, registers: np.ndarray) -> float:
+        """Ertl's improved estimator, which needs no empirical bias correction at small cardinalities"""
+        m = len(registers)
+        q = 64 - self.p
+        counts = np.bincount(registers, minlength=q + 2).astype(np.float64)
+        z = m * _tau(1 - counts[q + 1] / m)
+        for k in range(q, 0, -1):
+            z = 0.5 * (z + counts[k])
+        z += m * _sigma(counts[0] / m)
+        return m * m / (2 * math.log(2) * z) if z else float('inf')
+
+
+class KLLSketch:
+    """KLL quantile sketch over floats; exact until the first compaction"""
+    __slots__ = ('k', 'n', 'levels', 'rng')
+
+    def __init__(self, k: int = 200, seed: int = 0, rng: Optional[random.Random] = None):
+        self.k = k
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        # A Random is about 2.5 KB, so many small sketches should share one
+        self.rng = rng if rng is not None else random.Random(seed)
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: 'KLLSketch'):
+        """Fold another sketch into this one"""
+        self.n += other.n
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self._compress()
+
+    @property
+    def is_exact(self) -> bool:
+        return len(self.levels) == 1
+
+    def rank(self, value: float, inclusive: bool = False) -> float:
+        """Fraction of the stream below `value` (or at most `value` when inclusive)"""
+        if self.n == 0:
+            return 0.0
+        side = 'right' if inclusive else 'left'
+        weight = sum(np.searchsorted(np.sort(items), value, side=side) << h for h, items in enumerate(self.levels))
+        return weight / self.n
+
+    def quantile_at_rank(self, rank: int) -> float:
+        """Value at a 0-based rank of the stream"""
+        items, weights = self._weighted_items()
+        return float(items[min(np.searchsorted(np.cumsum(weights), rank, side='right'), len(items) - 1)])
+
+    def median(self) -> float:
+        """Mean of the two middle values, as pandas' median (exact while is_exact)"""
+        return (self.quantile_at_rank((self.n - 1) // 2) + self.quantile_at_rank(self.n // 2)) / 2
+
+    def nbytes(self) -> int:
+        return sum(items.nbytes for items in self.levels)
+
+    def _weighted_items(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 1 << h, dtype=np.int64) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        while True:
+            for h, items in enumerate(self.levels):
+                if len(items) > self._capacity(h):
+                    break
+            else:
+                return
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[h])
+            # An odd item stays behind; the rest halve into the next level
+            keep = items[:1] if len(items) % 2 else items[:0]
+            pairs = items[len(keep):]
+            promoted = pairs[self.rng.randint(0, 1)::2]
+            self.levels[h] = keep
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
@@ -0,0 +1,189 @@
+"""Pure-Python scoring for small batches
+
+Importing pandas and numpy costs far more than scoring a few hundred
+transactions, which dominates short-lived jobs (cron containers, the CLI on
+incremental batches). SmallBatchScorer computes the same user and overall
+features as FraudDetectionModel from plain records with the standard library
+only, and scores them with the scalar path of the rule set.
+
+Records are read the way transaction_ingest reads them: amount as an exact
+integer and createdAt as integer milliseconds. Float sums follow numpy's
+pairwise summation order (_pairwise_sum), so features match evaluate_dataframe
+on a read_transactions() frame. The one exception is the last bit of
+amount_std for users with rows sharing a createdAt, since the frame's sort does
+not keep their order. Cycle detection, gift collapsing and account clusters
+need the full model and are rejected.
+"""
+import bisect
+import copy
+import math
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from scoring_rules import DEFAULT_THRESHOLDS, RuleSet, risk_level
+
+
+class SmallBatchScorer:
+    """FraudDetectionModel's features and scores for a list of records, without pandas"""
+
+    def __init__(self, thresholds: Optional[Dict] = None, rules: Optional[RuleSet] = None):
+        self.thresholds = copy.deepcopy(DEFAULT_THRESHOLDS)
+        unknown = set(thresholds or {}) - set(self.thresholds)
+        if unknown:
+            raise ValueError(f"unknown thresholds: {', '.join(sorted(unknown))}")
+        self.thresholds.update(thresholds or {})
+        if (self.thresholds['cycle_max_length'] or self.thresholds['collapse_gift_triples']
+                or self.thresholds['cluster_accounts']):
+            raise ValueError('cycle detection, gift collapsing and account clusters need FraudDetectionModel')
+        self.rules = rules or RuleSet()
+
+    def evaluate_transactions(self, transactions: List[Dict]) -> Dict:
+        """Score every user and the whole batch, returning evaluate_dataframe's structure"""
+        rows = sorted(
+            ((int(txn['createdAt']), int(txn['amount']), txn.get('type'), txn.get('senderId'),
+              txn.get('receiverId'), txn.get('owner')) for txn in transactions),
+            key=lambda row: row[0]
+        )
+        user_rows = defaultdict(list)
+        for row in rows:
+            for user_id in {row[3], row[4], row[5]} - {None}:
+                user_rows[user_id].append(row)
+
+        users = {}
+        for user_id in sorted(user_rows):
+            features = self.calculate_user_features(user_rows[user_id])
+            score, reasons = self.rules['users'].score(features)
+            users[user_id] = {
+                'fraud_score': score,
+                'risk_level': risk_level(score),
+                'reasons': reasons,
+                'features': features
+            }
+
+        overall_features = self.calculate_overall_features(rows)
+        overall_score, overall_reasons = self.rules['overall'].score(overall_features)
+        return {
+            'users': users,
+            'overall': {
+                'fraud_score': overall_score,
+                'risk_level': risk_level(overall_score),
+                'reasons': overall_reasons,
+                'features': overall_features
+            }
+        }
+
+    def calculate_user_features(self, rows: List[tuple]) -> Dict:
+        """Features of one user's (createdAt, amount, type, sender, receiver, owner) rows, in time order"""
+        thresholds = self.thresholds
+        n = len(rows)
+        times = [row[0] for row in rows]
+        amounts = [row[1] for row in rows]
+
+        total_amount = sum(amounts)
+        avg_amount = total_amount / n
+        ordered = sorted(amounts)
+        median_amount = (float(ordered[(n - 1) // 2]) + float(ordered[n // 2])) / 2
+        squared_dev = [(avg_amount - amount) * (avg_amount - amount) for amount in amounts]
+        amount_std = math.sqrt(_pairwise_sum(squared_dev) / (n - 1)) if n > 1 else math.nan
+
+        time_diffs = [(later - earlier) / 1000 for earlier, later in zip(times, times[1:])]
+        # The model sums the diffs with the first (missing) one filled as 0
+        avg_time_between = _pairwise_sum([0.0] + time_diffs) / (n - 1) if n > 1 else math.nan
+
+        # Amount outliers: more than 3 standard deviations from the mean
+        outliers = 0
+        if amount_std > 0:
+            outliers = sum(abs((amount - avg_amount) / amount_std) > 3 for amount in amounts)
+
+        hours = [time // 3600000 % 24 for time in times]
+        off_hours = sum(
+            hour >= thresholds['off_hours_start'] or hour < thresholds['off_hours_end'] for hour in hours
+        )
+
+        senders = {row[3] for row in rows} - {None}
+        receivers = {row[4] for row in rows} - {None}
+
+        features = {
+            'transaction_count': n,
+            'total_amount': total_amount,
+            'avg_amount': avg_amount,
+            'median_amount': median_amount,
+            'amount_std': amount_std,
+            'avg_time_between_txns': avg_time_between,
+            'min_time_between_txns': min(time_diffs) if time_diffs else math.nan,
+            'high_velocity_periods': self._high_velocity_periods(times, thresholds['high_velocity_window']),
+            'round_amount_ratio': sum(amount % thresholds['round_amount_threshold'] == 0 for amount in amounts) / n,
+            'large_transaction_count': sum(amount >= thresholds['large_amount_threshold'] for amount in amounts),
+            'off_hours_ratio': off_hours / n,
+            'unique_transaction_types': len({row[2] for row in rows} - {None}),
+            'transaction_type_entropy': self._type_entropy([row[2] for row in rows]),
+            'unique_counterparties': len(senders | receivers) - 1,
+            'circular_transactions': len(senders & receivers) > 1,
+            'amount_outliers': outliers,
+        }
+        for window in thresholds['velocity_windows']:
+            features[f'high_velocity_periods_{window}s'] = self._high_velocity_periods(times, window)
+        return features
+
+    def calculate_overall_features(self, rows: List[tuple]) -> Dict:
+        """Features of the whole batch, as FraudDetectionModel._calculate_overall_features"""
+        sender_volumes = defaultdict(int)
+        for row in rows:
+            if row[3] is not None:
+                sender_volumes[row[3]] += row[1]
+        total_volume = sum(row[1] for row in rows)
+        time_span = (rows[-1][0] - rows[0][0]) / 1000 if rows else math.nan
+        sender_volume_total = sum(sender_volumes.values())
+        volume_concentration = 0
+        if sender_volumes:
+            volume_concentration = max(sender_volumes.values()) / sender_volume_total if sender_volume_total else math.nan
+        return {
+            'total_transactions': len(rows),
+            'unique_users': len(({row[3] for row in rows} | {row[4] for row in rows}) - {None}),
+            'total_volume': total_volume,
+            'avg_transaction_size': total_volume / len(rows) if rows else math.nan,
+            'time_span_hours': time_span / 3600,
+            'transaction_rate': len(rows) / max(time_span / 3600, 0.01),
+            'volume_concentration': volume_concentration,
+        }
+
+    def _high_velocity_periods(self, times: List[int], window: int) -> int:
+        """Transactions (except the last) that start a window of at least high_velocity_count transactions"""
+        window_ms = int(window) * 1000
+        count = self.thresholds['high_velocity_count']
+        return sum(
+            bisect.bisect_right(times, time + window_ms) - bisect.bisect_left(times, time) >= count
+            for time in times[:-1]
+        )
+
+    def _type_entropy(self, types: List) -> float:
+        """Shannon entropy of the type mix, 0 for a single type"""
+        counts = Counter(value for value in types if value is not None)
+        if len(counts) <= 1:
+            return 0
+        total = sum(counts.values())
+        # Most common first, as value_counts() orders the terms
+        return -sum(count / total * math.log2(count / total) for _, count in counts.most_common())
+
+
+def _pairwise_sum(values: List[float], start: int = 0, n: Optional[int] = None) -> float:
+    """Sum in the order numpy's pairwise summation uses, so results are bit-identical to ndarray.sum()"""
+    n = len(values) if n is None else n
+    if n < 8:
+        total = 0.0
+        for value in values[start:start + n]:
+            total += value
+        return total
+    if n <= 128:
+        partial = values[start:start + 8]
+        i = 8
+        while i < n - n % 8:
+            partial = [partial[j] + values[start + i + j] for j in range(8)]
+            i += 8
+        total = ((partial[0] + partial[1]) + (partial[2] + partial[3])) + ((partial[4] + partial[5]) + (partial[6] + partial[7]))
+        for value in values[start + i:start + n]:
+            total += value
+        return total
+    half = n // 2
+    half -= half % 8
+    return _pairwise_sum(values, start, half) + _pairwise_sum(values, start + half, n - half)
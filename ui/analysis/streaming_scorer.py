@@ -0,0 +1,246 @@
+"""Incremental per-user scoring for transactions that arrive in batches
+
+analyze_transactions recomputes every feature from the full history, which is
+not viable when a big livestream sends thousands of gifts a minute.
+StreamingFraudScorer keeps running aggregates per user instead and folds each
+batch into them:
+
+- count, Welford mean / variance and an amount multiset (median, outliers)
+- first / last timestamps and the smallest gap
+- round, large and off-hours counts, transaction type counts
+- sender and receiver sets (counterparties, circular transactions)
+- one _VelocityCounter per velocity window, O(1) amortized per transaction,
+  giving the same rapid-window counts as _high_velocity_periods
+
+Features come out in calculate_user_features' shape and are scored with the
+model's rules; update() returns only the users whose score changed.
+
+    scorer = StreamingFraudScorer(model)
+    changed = scorer.update(new_transactions)
+"""
+import math
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from fraud_detection_model import FraudDetectionModel
+
+
+class _VelocityCounter:
+    """Rapid-window count for one user and one window length, O(1) amortized per transaction
+
+    The window started by transaction i holds every transaction from the first
+    one at its timestamp on, so it reaches min_count transactions exactly when
+    the transaction at index tie_start + min_count - 1 arrives, and is rapid if
+    that one is still within window_ms. Pending windows wait in a FIFO ordered
+    by that trigger index, and each is resolved once.
+    """
+    __slots__ = ('window_ms', 'pending', 'rapid_count', 'n', 'tie_start', 'last_ts')
+
+    def __init__(self, window: int):
+        self.window_ms = int(window) * 1000
+        self.pending = deque()  # (trigger index, window end) of windows not yet resolved
+        self.rapid_count = 0
+        self.n = 0
+        self.tie_start = 0  # index of the first transaction at last_ts
+        self.last_ts = None
+
+    def add(self, timestamp: int, min_count: int):
+        """Register a transaction, timestamps must be non-decreasing"""
+        index = self.n
+        if timestamp != self.last_ts:
+            self.tie_start = index
+            self.last_ts = timestamp
+        self.n += 1
+        self.pending.append((self.tie_start + min_count - 1, timestamp + self.window_ms))
+        # Trigger indexes never decrease, so every window due by now is at the front
+        while self.pending and self.pending[0][0] <= index:
+            _, window_end = self.pending.popleft()
+            if timestamp <= window_end:
+                self.rapid_count += 1
+
+    def periods(self, min_count: int) -> int:
+        """Rapid windows, excluding the one started by the latest transaction"""
+        return self.rapid_count - (1 if self.n - self.tie_start >= min_count else 0)
+
+
+class _UserState:
+    """Compact running aggregates for one user"""
+    __slots__ = (
+        'count', 'mean', 'm2', 'amount_counts', 'first_ts', 'last_ts', 'min_gap_ms',
+        'round_count', 'large_count', 'off_hours_count', 'type_counts',
+        'senders', 'receivers', 'velocity'
+    )
+
+    def __init__(self, windows: List[int]):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.amount_counts = Counter()
+        self.first_ts = None
+        self.last_ts = None
+        self.min_gap_ms = None
+        self.round_count = 0
+        self.large_count = 0
+        self.off_hours_count = 0
+        self.type_counts = Counter()
+        self.senders = set()
+        self.receivers = set()
+        self.velocity = {window: _VelocityCounter(window) for window in windows}
+
+
+class StreamingFraudScorer:
+    """Incrementally maintains per-user fraud scores as new transactions arrive
+
+    Uses the thresholds and scoring rules of a FraudDetectionModel, but keeps
+    only running aggregates per user instead of the full transaction history.
+    Transactions are expected to arrive roughly in createdAt order (as read from
+    the Convex by_created_at index); each batch is sorted before it is applied,
+    and a transaction older than a user's latest one is treated as if it happened
+    at that latest time for the time-based features.
+    """
+
+    def __init__(self, model: Optional[FraudDetectionModel] = None):
+        self.model = model or FraudDetectionModel()
+        self.thresholds = self.model.thresholds
+        if self.thresholds['collapse_gift_triples']:
+            raise ValueError('collapse_gift_triples needs whole gift triples and is not available to the streaming scorer')
+        self.windows = [self.thresholds['high_velocity_window']] + list(self.thresholds['velocity_windows'])
+        self.users: Dict[str, _UserState] = {}
+        self.scores: Dict[str, float] = {}
+
+    def update(self, transactions: List[Dict]) -> Dict[str, Dict]:
+        """Fold a batch of new transactions into the state and return users whose score changed"""
+        touched = set()
+        for txn in sorted(transactions, key=lambda t: t['createdAt']):
+            involved = {txn.get(col) for col in ('senderId', 'receiverId', 'owner')}
+            involved.discard(None)
+            for user_id in involved:
+                state = self.users.get(user_id)
+                if state is None:
+                    state = self.users[user_id] = _UserState(self.windows)
+                self._apply(state, txn)
+                touched.add(user_id)
+
+        changed = {}
+        for user_id in touched:
+            result = self.get_user_result(user_id)
+            if result['fraud_score'] != self.scores.get(user_id, 0.0):
+                changed[user_id] = result
+            self.scores[user_id] = result['fraud_score']
+        return changed
+
+    def get_user_result(self, user_id: str) -> Dict:
+        """Current score, risk level, reasons and features for a user"""
+        features = self.get_user_features(user_id)
+        fraud_score, reasons = self.model.calculate_fraud_score(features)
+        return {
+            'fraud_score': fraud_score,
+            'risk_level': self.model._get_risk_level(fraud_score),
+            'reasons': reasons,
+            'features': features
+        }
+
+    def get_user_features(self, user_id: str) -> Dict:
+        """Build the same feature dict as calculate_user_features from the running state"""
+        state = self.users.get(user_id)
+        if state is None or state.count == 0:
+            return {'transaction_count': 0, 'fraud_score': 0}
+
+        n = state.count
+        amount_std = math.sqrt(state.m2 / (n - 1)) if n > 1 else np.nan
+
+        features = {}
+        features['transaction_count'] = n
+        features['total_amount'] = float(sum(amount * c for amount, c in state.amount_counts.items()))
+        features['avg_amount'] = state.mean
+        features['median_amount'] = self._median(state.amount_counts, n)
+        features['amount_std'] = amount_std
+        features['avg_time_between_txns'] = (state.last_ts - state.first_ts) / 1000 / (n - 1) if n > 1 else np.nan
+        features['min_time_between_txns'] = state.min_gap_ms / 1000 if state.min_gap_ms is not None else np.nan
+
+        min_count = self.thresholds['high_velocity_count']
+        features['high_velocity_periods'] = state.velocity[self.windows[0]].periods(min_count)
+
+        features['round_amount_ratio'] = state.round_count / n
+        features['large_transaction_count'] = state.large_count
+        features['off_hours_ratio'] = state.off_hours_count / n
+        features['unique_transaction_types'] = len(state.type_counts)
+        features['transaction_type_entropy'] = self._entropy(state.type_counts)
+        features['unique_counterparties'] = len(state.senders | state.receivers) - 1
+        features['circular_transactions'] = len(state.senders & state.receivers) > 1
+
+        if amount_std > 0:
+            features['amount_outliers'] = sum(
+                c for amount, c in state.amount_counts.items()
+                if abs(amount - state.mean) / amount_std > 3
+            )
+        else:
+            features['amount_outliers'] = 0
+
+        for window in self.thresholds['velocity_windows']:
+            features[f'high_velocity_periods_{window}s'] = state.velocity[window].periods(min_count)
+
+        return features
+
+    def _apply(self, state: _UserState, txn: Dict):
+        """Update one user's running aggregates with a single transaction"""
+        amount = int(txn['amount'])
+        timestamp = int(txn['createdAt'])
+
+        # Welford running mean/variance
+        state.count += 1
+        delta = amount - state.mean
+        state.mean += delta / state.count
+        state.m2 += delta * (amount - state.mean)
+        state.amount_counts[amount] += 1
+
+        if state.last_ts is None:
+            state.first_ts = timestamp
+        else:
+            timestamp = max(timestamp, state.last_ts)
+            gap = timestamp - state.last_ts
+            state.min_gap_ms = gap if state.min_gap_ms is None else min(state.min_gap_ms, gap)
+        state.last_ts = timestamp
+
+        for counter in state.velocity.values():
+            counter.add(timestamp, self.thresholds['high_velocity_count'])
+
+        if amount % self.thresholds['round_amount_threshold'] == 0:
+            state.round_count += 1
+        if amount >= self.thresholds['large_amount_threshold']:
+            state.large_count += 1
+
+        hour = (timestamp // 3600000) % 24
+        if hour >= self.thresholds['off_hours_start'] or hour < self.thresholds['off_hours_end']:
+            state.off_hours_count += 1
+
+        if txn.get('type') is not None:
+            state.type_counts[txn['type']] += 1
+        if txn.get('senderId') is not None:
+            state.senders.add(txn['senderId'])
+        if txn.get('receiverId') is not None:
+            state.receivers.add(txn['receiverId'])
+
+    def _median(self, amount_counts: Counter, n: int) -> float:
+        """Median of a multiset of amounts"""
+        lower_rank, upper_rank = (n - 1) // 2, n // 2
+        lower = upper = None
+        seen = 0
+        for amount in sorted(amount_counts):
+            seen += amount_counts[amount]
+            if lower is None and seen > lower_rank:
+                lower = amount
+            if seen > upper_rank:
+                upper = amount
+                break
+        return (lower + upper) / 2
+
+    def _entropy(self, type_counts: Counter) -> float:
+        """Entropy of the transaction type distribution"""
+        if len(type_counts) <= 1:
+            return 0
+        counts = np.array(sorted(type_counts.values(), reverse=True), dtype=float)
+        probs = counts / counts.sum()
+        return -np.sum(probs * np.log2(probs))
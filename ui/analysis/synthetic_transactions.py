@@ -0,0 +1,273 @@
+"""Synthetic TTCoin transaction generator
+
+Produces rows shaped like the Convex `transactions` table:
+
+- gifts as fee / gift-receive / gift-give triples sharing giftId, livestreamId,
+  sender and createdAt, split by the livestream fee ratio (10% by default)
+- top-ups with a txHash from a funding account, separate from the admin
+  account that collects fees, and streamer cash-outs to the admin account
+- power-law activity: a few gifters and livestreams account for most volume
+- injected fraud patterns, with the involved accounts exposed as labels
+
+Rows are generated in time-ordered blocks, so exports of 10M+ rows can be
+streamed to JSON Lines without holding them in memory.
+"""
+import json
+from typing import Dict, Iterator, List, Set, Tuple
+
+import numpy as np
+
+ID_ALPHABET = np.frombuffer(b'0123456789abcdefghjkmnpqrstvwxyz', dtype='S1')
+GIFT_PRICES = np.array([1000000, 5000000, 10000000, 50000000, 100000000, 500000000, 1000000000, 5000000000])
+GIFT_WEIGHTS = np.array([30, 25, 18, 12, 8, 4, 2, 1], dtype=float)
+FRAUD_PATTERNS = ['burst', 'ring', 'off_hours', 'lockstep']
+
+
+class SyntheticTransactionGenerator:
+    """Generates a reproducible synthetic transaction history"""
+
+    def __init__(self, n_users: int = 1000, n_livestreams: int = 50, n_gifts: int = 20,
+                 fraud_ratio: float = 0.01, start_ms: int = 1756500000000,
+                 events_per_hour: float = 2000.0, fee_ratio: int = 10000, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        self.start_ms = start_ms
+        self.events_per_hour = events_per_hour
+        self.fee_ratio = fee_ratio
+
+        self.admin_id = self._ids('k57', 1)[0]
+        # Top-ups come from a funding wallet, not from the fee sink
+        self.funding_id = self._ids('k57', 1)[0]
+        self.users = self._ids('k57', n_users)
+        self.gifts = self._ids('kd7', n_gifts)
+        self.gift_prices = self.rng.choice(GIFT_PRICES, size=n_gifts, p=GIFT_WEIGHTS / GIFT_WEIGHTS.sum())
+        self.gift_prices[:len(GIFT_PRICES)] = GIFT_PRICES[:n_gifts]
+
+        # Livestreams are hosted by a subset of users, popularity follows a power law
+        self.livestreams = self._ids('jx7', n_livestreams)
+        self.streamer_of = self.rng.choice(n_users, size=n_livestreams)
+        self.livestream_weights = self._power_law(n_livestreams, 1.2)
+        self.gifter_weights = self._power_law(n_users, 1.1)
+
+        n_fraud = int(round(n_users * fraud_ratio))
+        self.fraud_users: Set[str] = set()
+        self.fraud_patterns: Dict[str, str] = {}
+        self._fraud_accounts = self.rng.choice(n_users, size=n_fraud, replace=False) if n_fraud else np.empty(0, int)
+
+    def transactions(self, n_rows: int) -> List[Dict]:
+        """Generate about `n_rows` transactions as a list"""
+        return list(self.iter_transactions(n_rows))
+
+    def labelled_transactions(self, n_rows: int) -> Tuple[List[Dict], Set[str]]:
+        """Generate about `n_rows` transactions plus the set of users involved in injected fraud"""
+        transactions = self.transactions(n_rows)
+        return transactions, set(self.fraud_users)
+
+    def write_jsonl(self, path: str, n_rows: int) -> int:
+        """Stream about `n_rows` transactions to a JSON Lines file, returning the row count"""
+        count = 0
+        with open(path, 'w') as f:
+            for txn in self.iter_transactions(n_rows):
+                f.write(json.dumps(txn))
+                f.write('\n')
+                count += 1
+        return count
+
+    def iter_transactions(self, n_rows: int, block_rows: int = 100000) -> Iterator[Dict]:
+        """Yield about `n_rows` transactions in createdAt order"""
+        fraud_rows = self._fraud_rows(n_rows)
+        fraud_times = np.array([row['createdAt'] for row in fraud_rows], dtype=np.int64)
+        normal_rows = max(n_rows - len(fraud_rows), 0)
+
+        emitted = 0
+        block_start = self.start_ms
+        fraud_pos = 0
+        while emitted < normal_rows:
+            block = self._normal_block(block_start, min(block_rows, normal_rows - emitted))
+            emitted += len(block)
+            block_end = block[-1]['createdAt'] if block else block_start
+            if emitted >= normal_rows:
+                block_end = max(block_end, int(fraud_times[-1]) if len(fraud_times) else block_end)
+
+            # Merge in the injected rows that fall inside this block
+            fraud_end = int(np.searchsorted(fraud_times, block_end, side='right'))
+            block.extend(fraud_rows[fraud_pos:fraud_end])
+            fraud_pos = fraud_end
+            block.sort(key=lambda row: row['createdAt'])
+            yield from block
+            block_start = block_end + 1
+
+        yield from fraud_rows[fraud_pos:]
+
+    def _normal_block(self, block_start: int, target_rows: int) -> List[Dict]:
+        """Generate a time-ordered block of ordinary activity"""
+        # Gifts produce three rows, top-ups and cash-outs one
+        kinds = self.rng.choice(3, size=max(target_rows // 2, 1), p=[0.85, 0.12, 0.03])
+        rows_per_kind = np.where(kinds == 0, 3, 1)
+        kinds = kinds[:int(np.searchsorted(np.cumsum(rows_per_kind), target_rows)) + 1]
+
+        gaps = self.rng.exponential(3600000 / self.events_per_hour, size=len(kinds))
+        times = block_start + np.cumsum(gaps).astype(np.int64)
+        gifters = self.rng.choice(len(self.users), size=len(kinds), p=self.gifter_weights)
+        livestreams = self.rng.choice(len(self.livestreams), size=len(kinds), p=self.livestream_weights)
+        gifts = self.rng.integers(0, len(self.gifts), size=len(kinds))
+        top_ups = self.rng.choice(GIFT_PRICES[3:], size=len(kinds)) * self.rng.integers(1, 20, size=len(kinds))
+        n_ids = int(rows_per_kind[:len(kinds)].sum())
+        ids = self._ids('k17', n_ids)
+        hashes = self._tx_hashes(len(kinds))
+
+        rows = []
+        id_pos = 0
+        for i, kind in enumerate(kinds):
+            timestamp = int(times[i])
+            user = self.users[gifters[i]]
+            if kind == 0:
+                livestream = int(livestreams[i])
+                streamer = self.users[self.streamer_of[livestream]]
+                if streamer == user:
+                    streamer = self.users[(gifters[i] + 1) % len(self.users)]
+                rows.extend(self._gift_rows(
+                    ids[id_pos:id_pos + 3], timestamp, user, streamer,
+                    self.livestreams[livestream], int(gifts[i])
+                ))
+                id_pos += 3
+            elif kind == 1:
+                rows.append(self._row(ids[id_pos], timestamp, int(top_ups[i]), 'top-up',
+                                      owner=user, senderId=self.funding_id, receiverId=user, txHash=hashes[i]))
+                id_pos += 1
+            else:
+                streamer = self.users[self.streamer_of[int(livestreams[i])]]
+                rows.append(self._row(ids[id_pos], timestamp, int(top_ups[i]) // 2, 'cash-out',
+                                      owner=streamer, senderId=streamer, receiverId=self.admin_id,
+                                      txHash=hashes[i]))
+                id_pos += 1
+        return rows
+
+    def _fraud_rows(self, n_rows: int) -> List[Dict]:
+        """Plan the injected fraud episodes over the expected time span"""
+        accounts = [int(a) for a in self._fraud_accounts]
+        if not accounts:
+            return []
+        expected_events = n_rows / 2.5
+        span_ms = max(int(expected_events / self.events_per_hour * 3600000), 3600000)
+
+        rows = []
+        position = 0
+        episode = 0
+        while position < len(accounts):
+            pattern = FRAUD_PATTERNS[episode % len(FRAUD_PATTERNS)]
+            episode += 1
+            group_size = 3 if pattern in ('ring', 'lockstep') else 1
+            if position + group_size > len(accounts):
+                pattern, group_size = 'burst', 1
+            group = [self.users[a] for a in accounts[position:position + group_size]]
+            position += group_size
+            start = self.start_ms + int(self.rng.integers(0, span_ms))
+            rows.extend(getattr(self, f'_inject_{pattern}')(group, start))
+            for user in group:
+                self.fraud_users.add(user)
+                self.fraud_patterns[user] = pattern
+
+        rows.sort(key=lambda row: row['createdAt'])
+        return rows
+
+    def _inject_burst(self, group: List[str], start: int) -> List[Dict]:
+        """Dozens of gifts to one stream within a couple of minutes"""
+        livestream = int(self.rng.integers(0, len(self.livestreams)))
+        streamer = self.users[self.streamer_of[livestream]]
+        rows = []
+        for k in range(int(self.rng.integers(20, 60))):
+            rows.extend(self._gift_rows(self._ids('k17', 3), start + k * int(self.rng.integers(500, 4000)),
+                                        group[0], streamer, self.livestreams[livestream],
+                                        int(self.rng.integers(0, len(self.gifts)))))
+        return rows
+
+    def _inject_ring(self, group: List[str], start: int) -> List[Dict]:
+        """Accounts passing large round gifts around a cycle A -> B -> C -> A"""
+        rows = []
+        gift = int(np.argmax(self.gift_prices))
+        for lap in range(int(self.rng.integers(3, 8))):
+            for k, sender in enumerate(group):
+                receiver = group[(k + 1) % len(group)]
+                timestamp = start + (lap * len(group) + k) * 60000
+                rows.extend(self._gift_rows(self._ids('k17', 3), timestamp, sender, receiver,
+                                            self.livestreams[0], gift))
+        return rows
+
+    def _inject_off_hours(self, group: List[str], start: int) -> List[Dict]:
+        """A large top-up followed by large gifts between 01:00 and 04:00 UTC"""
+        day_start = start - start % 86400000
+        timestamp = day_start + 3600000 + int(self.rng.integers(0, 3 * 3600000))
+        livestream = int(self.rng.integers(0, len(self.livestreams)))
+        streamer = self.users[self.streamer_of[livestream]]
+        rows = [self._row(self._ids('k17', 1)[0], timestamp, 50000000000, 'top-up', owner=group[0],
+                          senderId=self.funding_id, receiverId=group[0], txHash=self._tx_hashes(1)[0])]
+        gift = int(np.argmax(self.gift_prices))
+        for k in range(int(self.rng.integers(5, 15))):
+            rows.extend(self._gift_rows(self._ids('k17', 3), timestamp + (k + 1) * 600000, group[0], streamer,
+                                        self.livestreams[livestream], gift))
+        return rows
+
+    def _inject_lockstep(self, group: List[str], start: int) -> List[Dict]:
+        """Several accounts gifting the same stream within seconds of each other, repeatedly"""
+        livestream = int(self.rng.integers(0, len(self.livestreams)))
+        streamer = self.users[self.streamer_of[livestream]]
+        gift = int(self.rng.integers(0, len(self.gifts)))
+        rows = []
+        for wave in range(int(self.rng.integers(5, 12))):
+            for k, sender in enumerate(group):
+                timestamp = start + wave * 120000 + k * 1500
+                rows.extend(self._gift_rows(self._ids('k17', 3), timestamp, sender, streamer,
+                                            self.livestreams[livestream], gift))
+        return rows
+
+    def _gift_rows(self, ids: List[str], timestamp: int, sender: str, receiver: str,
+                   livestream: str, gift: int) -> List[Dict]:
+        """The fee / gift-receive / gift-give triple written by transactions.sendGift"""
+        price = int(self.gift_prices[gift])
+        fee = price * self.fee_ratio // 100000
+        shared = {'giftId': self.gifts[gift], 'livestreamId': livestream, 'senderId': sender}
+        return [
+            self._row(ids[0], timestamp, fee, 'fee', owner=self.admin_id, receiverId=self.admin_id,
+                      creation_offset=0.0004, **shared),
+            self._row(ids[1], timestamp, price - fee, 'gift-receive', owner=receiver, receiverId=receiver,
+                      creation_offset=0.0002, **shared),
+            self._row(ids[2], timestamp, price, 'gift-give', owner=sender, receiverId=receiver, **shared),
+        ]
+
+    def _row(self, txn_id: str, timestamp: int, amount: int, txn_type: str,
+             creation_offset: float = 0.0, **fields) -> Dict:
+        row = {
+            '_creationTime': timestamp + 0.75 + creation_offset,
+            '_id': txn_id,
+            'amount': str(amount),
+            'createdAt': timestamp,
+        }
+        row.update(fields)
+        row['status'] = 'completed'
+        row['type'] = txn_type
+        return dict(sorted(row.items()))
+
+    def _ids(self, prefix: str, count: int) -> List[str]:
+        """Random Convex-style document IDs"""
+        chars = ID_ALPHABET[self.rng.integers(0, len(ID_ALPHABET), size=(count, 32 - len(prefix)))]
+        return [prefix + suffix.decode() for suffix in chars.view(f'S{32 - len(prefix)}').ravel()]
+
+    def _tx_hashes(self, count: int) -> List[str]:
+        raw = self.rng.integers(0, 256, size=(count, 32), dtype=np.uint8)
+        return ['0x' + row.tobytes().hex() for row in raw]
+
+    def _power_law(self, n: int, alpha: float) -> np.ndarray:
+        weights = 1.0 / np.arange(1, n + 1) ** alpha
+        self.rng.shuffle(weights)
+        return weights / weights.sum()
+
+
+def generate_transactions(n_rows: int, seed: int = 0, **kwargs) -> List[Dict]:
+    """Generate about `n_rows` transactions with users and livestreams scaled to the size"""
+    return SyntheticTransactionGenerator(seed=seed, **_scaled_defaults(n_rows, kwargs)).transactions(n_rows)
+
+
+def _scaled_defaults(n_rows: int, kwargs: Dict) -> Dict:
+    kwargs.setdefault('n_users', max(50, int(n_rows ** 0.75)))
+    kwargs.setdefault('n_livestreams', max(5, kwargs['n_users'] // 20))
+    return kwargs
@@ -0,0 +1,36 @@
+import pytest
+
+from fraud_detection_model import FraudDetectionModel
+from synthetic_transactions import SyntheticTransactionGenerator
+
+
+@pytest.fixture(scope='module')
+def ring_data():
+    generator = SyntheticTransactionGenerator(n_users=1000, seed=3)
+    transactions = generator.transactions(20000)
+    ring_users = [user for user, pattern in generator.fraud_patterns.items() if pattern == 'ring']
+    assert ring_users
+    return FraudDetectionModel().prepare_data(transactions), ring_users
+
+
+def _cycle_features(df, collapse: bool, columnar: bool = False):
+    model = FraudDetectionModel()
+    model.thresholds.update(cycle_max_length=4, collapse_gift_triples=collapse)
+    if columnar:
+        users = model.evaluate_table(df).to_dict()['users']
+    else:
+        users = model.evaluate_dataframe(df)['users']
+    return {
+        user_id: (result['features']['cycle_count'], result['features']['cycle_volume'])
+        for user_id, result in users.items()
+    }
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_cycle_features_survive_gift_collapsing(ring_data, columnar):
+    df, ring_users = ring_data
+    raw = _cycle_features(df, collapse=False, columnar=columnar)
+    collapsed = _cycle_features(df, collapse=True, columnar=columnar)
+
+    assert all(raw[user][0] > 0 for user in ring_users)
+    assert collapsed == raw
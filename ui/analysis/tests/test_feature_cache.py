@@ -0,0 +1,17 @@
+from feature_cache import FeatureCache
+from fraud_detection_model import FraudDetectionModel
+from synthetic_transactions import SyntheticTransactionGenerator
+
+
+def test_editing_a_result_does_not_corrupt_the_cache():
+    transactions = SyntheticTransactionGenerator(n_users=100, seed=1).transactions(2000)
+    model = FraudDetectionModel(cache=FeatureCache())
+    first = model.evaluate_transactions(transactions)['users']
+    expected = {user_id: (result['fraud_score'], dict(result['features'])) for user_id, result in first.items()}
+    for result in first.values():
+        result['fraud_score'] = -1.0
+        result['features']['transaction_count'] = -1
+
+    second = model.evaluate_transactions(transactions)['users']
+    assert model.cache.hits == len(expected)
+    assert {user_id: (result['fraud_score'], result['features']) for user_id, result in second.items()} == expected
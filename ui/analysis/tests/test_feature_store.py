@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from feature_store import FeatureStore
+from fraud_detection_model import FraudDetectionModel
+from synthetic_transactions import SyntheticTransactionGenerator
+
+
+@pytest.fixture(scope='module')
+def frame():
+    transactions = SyntheticTransactionGenerator(n_users=200, seed=5).transactions(3000)
+    return FraudDetectionModel().prepare_data(transactions).reset_index(drop=True)
+
+
+def test_rejected_chunk_does_not_leave_store_dirty(tmp_path, frame):
+    half = len(frame) // 2
+    store = FeatureStore.open(str(tmp_path / 'store'))
+    store.update(frame.iloc[:half])
+    mark = store.high_water_mark
+
+    # A chunk behind the folded data is rejected by add_chunk's createdAt order check
+    later = FeatureStore.open(str(tmp_path / 'store'))
+    later.analyzer.horizon = int(FraudDetectionModel()._to_epoch_ms(frame['createdAt']).max()) + 1
+    with pytest.raises(ValueError, match='createdAt order'):
+        later.update(frame.iloc[half:])
+
+    reopened = FeatureStore.open(str(tmp_path / 'store'))
+    assert reopened.high_water_mark == mark
+    assert reopened.update(frame.iloc[half:]) == len(frame) - half
+
+
+def test_read_error_keeps_the_chunks_already_ingested(tmp_path, frame):
+    export = tmp_path / 'export.jsonl'
+    records = frame.assign(createdAt=FraudDetectionModel()._to_epoch_ms(frame['createdAt']),
+                           amount=frame['amount'].astype('int64').astype(str))
+    lines = [json.dumps({k: v for k, v in row.items() if v == v}) for row in records.to_dict('records')]
+    export.write_text('\n'.join(lines[:2000] + ['{not json'] + lines[2000:]) + '\n')
+
+    store = FeatureStore.open(str(tmp_path / 'store'))
+    with pytest.raises(ValueError):
+        store.update_file(str(export), chunk_size=500)
+
+    reopened = FeatureStore.open(str(tmp_path / 'store'))
+    assert reopened.high_water_mark == int(records['createdAt'].iloc[1999])
+    assert reopened.results()['overall']['features']['total_transactions'] == 2000
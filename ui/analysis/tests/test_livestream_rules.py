@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from fraud_detection_model import FraudDetectionModel
+from scoring_rules import DEFAULT_RULES
+from synthetic_transactions import SyntheticTransactionGenerator
+
+
+@pytest.fixture(scope='module')
+def transactions():
+    return SyntheticTransactionGenerator(n_users=300, seed=3).transactions(30000)
+
+
+def test_livestream_thresholds_and_rules_load_from_config(tmp_path, transactions):
+    model = FraudDetectionModel()
+    df = model.prepare_data(transactions)
+    default = model.evaluate_livestreams(df)
+    assert any('gift_bursts' in result['reasons'] for result in default.values())
+
+    rules = json.loads(json.dumps(DEFAULT_RULES))
+    for rule in rules['livestreams']['rules']:
+        if rule['name'] == 'split_inconsistency':
+            rule['score'] = '50'
+    config = tmp_path / 'config.json'
+    config.write_text(json.dumps({'thresholds': {'burst_count': 10 ** 6}, 'rules': rules}))
+    tuned = FraudDetectionModel().load_config(str(config)).evaluate_livestreams(df)
+
+    assert not any('gift_bursts' in result['reasons'] for result in tuned.values())
+    for stream_id, result in tuned.items():
+        features = result['features']
+        assert features['burst_periods'] == 0
+        expected = default[stream_id]['fraud_score'] - min(default[stream_id]['features']['burst_periods'] * 3, 30)
+        if features['split_mismatch'] > 0.01:
+            expected += 30
+        assert result['fraud_score'] == pytest.approx(min(expected, 100.0))
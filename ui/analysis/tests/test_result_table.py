@@ -0,0 +1,27 @@
+import pytest
+
+from fraud_detection_model import FraudDetectionModel
+from synthetic_transactions import SyntheticTransactionGenerator
+
+
+@pytest.fixture(scope='module')
+def transactions():
+    transactions, _ = SyntheticTransactionGenerator(n_users=1000, seed=3).labelled_transactions(20000)
+    return transactions
+
+
+def _clusters(clusters):
+    return {
+        root: (result['fraud_score'], dict(result['reasons']), result['features'], result['members'])
+        for root, result in clusters.items()
+    }
+
+
+@pytest.mark.parametrize('collapse', [False, True])
+def test_table_carries_the_same_clusters(transactions, collapse):
+    model = FraudDetectionModel()
+    model.thresholds.update(cluster_accounts=True, collapse_gift_triples=collapse)
+    df = model.prepare_data(transactions)
+    expected = model.evaluate_dataframe(df)['clusters']
+    assert expected
+    assert _clusters(model.evaluate_table(df).to_dict()['clusters']) == _clusters(expected)
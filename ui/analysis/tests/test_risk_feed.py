@@ -0,0 +1,34 @@
+import pytest
+
+from fraud_detection_model import FraudDetectionModel
+from synthetic_transactions import SyntheticTransactionGenerator
+
+
+@pytest.fixture(scope='module')
+def transactions():
+    return SyntheticTransactionGenerator(n_users=500, seed=4).transactions(20000)
+
+
+@pytest.mark.parametrize('collapse', [False, True])
+def test_top_risk_users_match_evaluate_dataframe(transactions, collapse):
+    model = FraudDetectionModel()
+    model.thresholds['collapse_gift_triples'] = collapse
+    df = model.prepare_data(transactions)
+    users = model.evaluate_dataframe(df)['users']
+    ranked = sorted(users.values(), key=lambda result: -result['fraud_score'])[:20]
+
+    top = model.top_risk_users(df, 20)
+    assert [result['fraud_score'] for result in top] == [result['fraud_score'] for result in ranked]
+    for result in top:
+        expected = users[result['userId']]
+        assert result['features'] == expected['features']
+        assert dict(result['reasons']) == dict(expected['reasons'])
+
+
+def test_risk_changes_reports_only_moved_users(tmp_path, transactions):
+    model = FraudDetectionModel()
+    df = model.prepare_data(transactions)
+    path = str(tmp_path / 'snapshot.npz')
+    first = model.risk_changes(df, path)
+    assert first and all(change['previous_risk_level'] == 'MINIMAL' for change in first)
+    assert model.risk_changes(df, path) == []
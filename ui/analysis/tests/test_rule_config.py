@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+from fraud_detection_model import FraudDetectionModel
+from scoring_rules import DEFAULT_RULES
+from synthetic_transactions import SyntheticTransactionGenerator
+
+ROUND_AMOUNTS_ONLY = [
+    {'name': 'round_amounts', 'feature': 'round_amount_ratio',
+     'when': 'round_amount_ratio > 0.5', 'score': '50', 'reason': 'round'},
+]
+
+
+@pytest.fixture(scope='module')
+def transactions():
+    return SyntheticTransactionGenerator(n_users=100, seed=2).transactions(3000)
+
+
+@pytest.mark.parametrize('users', [ROUND_AMOUNTS_ONLY, {**DEFAULT_RULES['users'], 'rules': ROUND_AMOUNTS_ONLY}])
+def test_partial_rules_keep_the_other_default_groups(tmp_path, transactions, users):
+    config = tmp_path / 'config.json'
+    config.write_text(json.dumps({'rules': {'users': users}}))
+    model = FraudDetectionModel().load_config(str(config))
+    results = model.evaluate_transactions(transactions)
+    default = FraudDetectionModel().evaluate_transactions(transactions)
+
+    assert results['overall']['fraud_score'] == default['overall']['fraud_score']
+    assert set(model.rules.groups) == set(DEFAULT_RULES)
+    for result in results['users'].values():
+        assert set(result['reasons']) <= {'round_amounts'}
+        assert result['fraud_score'] in (0.0, 50.0)
+    assert model.evaluate_livestreams(model.prepare_data(transactions))
@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+from scoring_service import _HttpError, _read_request
+
+
+def _read(raw: bytes):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await _read_request(reader, 1024)
+    return asyncio.run(read())
+
+
+@pytest.mark.parametrize('length', ['abc', '-5', '+5', '1_0', ''])
+def test_malformed_content_length_is_a_bad_request(length):
+    with pytest.raises(_HttpError) as exc:
+        _read(f"POST /score HTTP/1.1\r\nContent-Length: {length}\r\n\r\n[]".encode())
+    assert exc.value.status == 400
+
+
+def test_content_length_reads_the_body():
+    assert _read(b"POST /score?x=1 HTTP/1.1\r\nContent-Length: 2\r\n\r\n[]") == (
+        'POST', '/score', {'content-length': '2'}, b'[]')
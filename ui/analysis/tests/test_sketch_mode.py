@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+import pytest
+
+from chunked_analysis import analyze_file
+from synthetic_transactions import SyntheticTransactionGenerator
+
+# Accounts tipped by hundreds to thousands of distinct senders, each paying out to half as many other
+# accounts; the last ones pay back their own tippers instead
+HEAVY_SENDERS = [300 + 150 * i for i in range(16)]
+HEAVY_USERS = [f'heavy_{i}' for i in range(len(HEAVY_SENDERS))]
+CIRCULAR_USERS = HEAVY_USERS[-3:]
+# HyperLogLog relative standard error at p=12, and the KLL normalized rank error at k=200
+HLL_ERROR = 1.04 / np.sqrt(2 ** 12)
+KLL_RANK_ERROR = 0.0165
+
+
+@pytest.fixture(scope='module')
+def export(tmp_path_factory):
+    """Synthetic traffic plus accounts trading with hundreds to thousands of distinct counterparties"""
+    transactions = SyntheticTransactionGenerator(n_users=200, seed=11).transactions(4000)
+    times = [txn['createdAt'] for txn in transactions]
+    rng = np.random.default_rng(11)
+    heavy_amounts = {}
+    for user, n_senders in zip(HEAVY_USERS, HEAVY_SENDERS):
+        amounts = np.round(rng.lognormal(18, 1.2, n_senders)).astype(np.int64)
+        created = rng.integers(min(times), max(times), n_senders).tolist()
+        for i, (amount, timestamp) in enumerate(zip(amounts.tolist(), created)):
+            transactions.append({
+                '_id': f'{user}_{i}', 'type': 'transfer', 'status': 'completed', 'amount': str(amount),
+                'createdAt': timestamp, 'senderId': f'{user}_fan_{i}', 'receiverId': user, 'owner': user,
+            })
+        payees = [f'{user}_fan_{i}' if user in CIRCULAR_USERS else f'{user}_payee_{i}'
+                  for i in range(0, n_senders, 2)]
+        for i, payee in enumerate(payees):
+            transactions.append({
+                '_id': f'{user}_payout_{i}', 'type': 'transfer', 'status': 'completed', 'amount': '1000',
+                'createdAt': max(times), 'senderId': user, 'receiverId': payee, 'owner': user,
+            })
+        heavy_amounts[user] = np.append(amounts, np.full(len(payees), 1000))
+    transactions.sort(key=lambda txn: txn['createdAt'])
+    path = tmp_path_factory.mktemp('export') / 'transactions.jsonl'
+    path.write_text('\n'.join(json.dumps(txn) for txn in transactions) + '\n')
+
+    exact = analyze_file(str(path), chunk_size=1000)['users']
+    sketch = analyze_file(str(path), chunk_size=1000, sketch=True)['users']
+    return exact, sketch, heavy_amounts
+
+
+def test_distinct_counterparties_within_hll_error(export):
+    exact, sketch, _ = export
+    for user, n_senders in zip(HEAVY_USERS, HEAVY_SENDERS):
+        expected = exact[user]['features']['unique_counterparties']
+        assert expected == (n_senders if user in CIRCULAR_USERS else n_senders + (n_senders + 1) // 2)
+        estimate = sketch[user]['features']['unique_counterparties']
+        assert abs(estimate - expected) <= 3 * HLL_ERROR * expected
+
+
+def test_median_within_kll_rank_error(export):
+    exact, sketch, heavy_amounts = export
+    for user in HEAVY_USERS:
+        amounts = np.sort(heavy_amounts[user])
+        median = sketch[user]['features']['median_amount']
+        # The estimate's rank in the exact distribution lies within the rank error of the true median
+        low = np.searchsorted(amounts, median, side='left') / len(amounts)
+        high = np.searchsorted(amounts, median, side='right') / len(amounts)
+        assert low - KLL_RANK_ERROR <= 0.5 <= high + KLL_RANK_ERROR
+        assert median == pytest.approx(exact[user]['features']['median_amount'], rel=0.1)
+
+
+def test_circular_transactions_of_heavy_users(export):
+    exact, sketch, _ = export
+    for user in HEAVY_USERS:
+        expected = user in CIRCULAR_USERS
+        assert exact[user]['features']['circular_transactions'] == expected
+        assert sketch[user]['features']['circular_transactions'] == expected, user
+
+
+def test_small_users_match_exact_mode(export):
+    exact, sketch, _ = export
+    small = [user for user, result in exact.items()
+             if result['features']['transaction_count'] < 200
+             and result['features']['unique_counterparties'] < 256]
+    assert len(small) > 100
+    for user in small:
+        expected, features = exact[user]['features'], sketch[user]['features']
+        for name in ('unique_counterparties', 'circular_transactions', 'amount_outliers', 'median_amount'):
+            assert features[name] == expected[name], (user, name)
+        assert sketch[user]['fraud_score'] == pytest.approx(exact[user]['fraud_score'])
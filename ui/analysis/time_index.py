@@ -0,0 +1,116 @@
+"""Time-range indexed analysis over a loaded transaction set
+
+Mirrors the Convex `transactions` indexes the dashboard queries through:
+
+- by_created_at: the frame sorted by createdAt, with its epoch-ms times
+- by_owner_created: the per-user rows of _explode_user_rows (each
+  transaction repeated for its sender, receiver and owner), grouped by user
+  in time order, with per-user offsets into them
+
+Both are built once. A window query finds its rows with binary search:
+one searchsorted on by_created_at for the overall features, and one over all
+(or the requested) users' segments at once, by offsetting each segment into
+its own key range as _velocity_window_counts does. Only the selected slices
+go through the feature engine, so results equal evaluate_dataframe on the
+window's rows while repeated queries skip the filtering and exploding of the
+whole history.
+
+    model.index_transactions(df)
+    last_hour = model.evaluate_window(t1 - 3600000, t1)
+"""
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class TimeIndex:
+    """createdAt-sorted frame and per-user row segments of a prepared DataFrame"""
+
+    def __init__(self, model, df: pd.DataFrame):
+        self.model = model
+        df, _ = model.collapse_gifts(df)
+        # by_created_at; a stable sort keeps the order of equal timestamps
+        self.frame = df.sort_values('createdAt', kind='stable').reset_index(drop=True)
+        self.times = model._to_epoch_ms(self.frame['createdAt'])
+
+        # by_owner_created
+        self.user_rows = model._explode_user_rows(self.frame)
+        codes, self.users = pd.factorize(self.user_rows['user_id'])
+        self.offsets = np.append(0, np.cumsum(np.bincount(codes, minlength=len(self.users))))
+        self.user_times = model._to_epoch_ms(self.user_rows['createdAt'])
+        self.base = int(self.times[0]) if len(self.times) else 0
+        self.stride = int(self.times[-1]) - self.base + 1 if len(self.times) else 1
+        self.user_keys = None
+        if len(self.users) * self.stride < 2 ** 62:
+            self.user_keys = codes.astype(np.int64) * self.stride + (self.user_times - self.base)
+
+    def evaluate(self, t0=None, t1=None, users: Optional[Iterable[str]] = None) -> Dict:
+        """Score the transactions with t0 <= createdAt <= t1 (open-ended when None)
+
+        With `users`, only those users are scored; the overall features still
+        cover every transaction in the window.
+        """
+        model = self.model
+        instrumentation = model.instrumentation
+        lower = self.base if t0 is None else _epoch_ms(t0)
+        upper = self.base + self.stride - 1 if t1 is None else _epoch_ms(t1)
+        with instrumentation.run():
+            with instrumentation.stage('window_slices'):
+                window = self.frame.iloc[np.searchsorted(self.times, lower, side='left'):
+                                         np.searchsorted(self.times, upper, side='right')]
+                if users is None:
+                    codes = np.arange(len(self.users))
+                else:
+                    codes = self.users.get_indexer(pd.Index(list(users), dtype=object))
+                    codes = np.unique(codes[codes >= 0])
+                starts, ends = self._user_slices(codes, lower, upper)
+                user_rows = self.user_rows.iloc[_ranges(starts, ends)].reset_index(drop=True)
+            instrumentation.count('rows', len(window))
+            results = {}
+            if len(user_rows):
+                cycle_features = model.calculate_cycle_features(window) if model.thresholds['cycle_max_length'] else None
+                all_features = model._features_from_user_rows(user_rows, cycle_features)
+                with instrumentation.stage('scoring'):
+                    results = model._score_users(all_features)
+            with instrumentation.stage('overall_features'):
+                overall_features = model._calculate_overall_features(window)
+            results = model._build_results(results, overall_features)
+        return model._attach_instrumentation(results)
+
+    def _user_slices(self, codes: np.ndarray, lower: int, upper: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Start and end offsets of each user's rows with lower <= createdAt <= upper"""
+        starts, ends = self.offsets[codes], self.offsets[codes + 1]
+        if lower > upper or len(codes) == 0:
+            return starts, starts
+        lower = min(max(lower, self.base), self.base + self.stride)
+        upper = min(max(upper, self.base - 1), self.base + self.stride - 1)
+        if self.user_keys is not None:
+            segment_keys = codes.astype(np.int64) * self.stride - self.base
+            return (np.searchsorted(self.user_keys, segment_keys + lower, side='left'),
+                    np.searchsorted(self.user_keys, segment_keys + upper, side='right'))
+        # Key space would overflow int64, fall back to one search per user
+        times = self.user_times
+        return (
+            np.array([start + np.searchsorted(times[start:end], lower, side='left')
+                      for start, end in zip(starts, ends)], dtype=np.int64),
+            np.array([start + np.searchsorted(times[start:end], upper, side='right')
+                      for start, end in zip(starts, ends)], dtype=np.int64),
+        )
+
+
+def _epoch_ms(value) -> int:
+    """Epoch milliseconds of an int (already ms) or anything pd.Timestamp accepts"""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return pd.Timestamp(value).value // 1000000
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, end) for every pair"""
+    sizes = ends - starts
+    total = int(sizes.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    shifts = np.repeat(starts - np.cumsum(sizes) + sizes, sizes)
+    return np.arange(total, dtype=np.int64) + shifts